@@ -0,0 +1,50 @@
+# Shared helpers for the benchmark scripts in this folder.
+# The project relies on the IDE's source roots (the repo root and setup/), so they are added to sys.path here.
+
+import os
+import sys
+import time
+import logging
+from contextlib import contextmanager
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _path in (REPO_ROOT, os.path.join(REPO_ROOT, 'setup')):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+
+@contextmanager
+def timed(results, name):
+    """
+    Times the body of a with block and stores the elapsed seconds in results[name].
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[name] = time.perf_counter() - start
+
+
+def print_table(rows, columns):
+    """
+    Prints a list of dicts as an aligned text table.
+    :param rows: A list of dicts (one per row).
+    :param columns: The keys to print, in order.
+    """
+    def fmt(value):
+        if isinstance(value, float):
+            return f"{value:.4f}"
+        return str(value)
+
+    widths = [max(len(col), *(len(fmt(row.get(col, ""))) for row in rows)) if rows else len(col) for col in columns]
+    print("  ".join(col.ljust(width) for col, width in zip(columns, widths)))
+    print("  ".join("-" * width for width in widths))
+    for row in rows:
+        print("  ".join(fmt(row.get(col, "")).ljust(width) for col, width in zip(columns, widths)))
+
+
+def quiet_logging():
+    """
+    The pipeline logs every snippet on INFO, which drowns the benchmark output.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
@@ -0,0 +1,65 @@
+"""
+Auto tagging of a synthetic subject (every trail): time of auto_tag_subject and how often the proposed target is
+the ball the synthetic gaze really looked at, for the confident and the ambiguous fixations.
+The world videos are generated at a tiny resolution and no snippets are written, only the tagging is measured.
+
+Usage:
+    python benchmarks/benchmark_auto_tagger.py --duration 1800 --hit-angle 3
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+from bench_utils import print_table, quiet_logging  # also puts the repo on sys.path
+
+from setup.CoreClasses import ProcessingContainer
+from src.utils.metadata_manager import MetadataManager
+from src.utils.subject_processor import SubjectProcessor
+from src.utils.synthetic_data import generate_synthetic_subject
+from src.utils.auto_tagger import AutoTagger, auto_tag_subject
+
+SUBJECT_NAME = "SY048"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=1800.0, help="Length of each trail's recording in seconds")
+    parser.add_argument("--hit-angle", type=float, default=3.0)
+    parser.add_argument("--ambiguity-margin", type=float, default=1.0)
+    args = parser.parse_args()
+
+    quiet_logging()
+    work_dir = tempfile.mkdtemp(prefix="ctt_auto_tagger_")
+    try:
+        data_path = os.path.join(work_dir, "data")
+        summary = generate_synthetic_subject(data_path, SUBJECT_NAME, duration_s=args.duration, resolution=(32, 24))
+        metadata_manager = MetadataManager(base_directory=os.path.join(work_dir, "metadata"))
+        container = ProcessingContainer(data_path=data_path, subject_name=SUBJECT_NAME)
+        container._create_out_path(os.path.join(work_dir, "out"))
+        SubjectProcessor(container, metadata_manager).process(write_snippets=False)
+        # the first run also builds the Unity caches, the second one is what a re-tag costs
+        auto_tag_subject(container, metadata_manager, tagger=AutoTagger(args.hit_angle, args.ambiguity_margin))
+        result = auto_tag_subject(container, metadata_manager,
+                                  tagger=AutoTagger(args.hit_angle, args.ambiguity_margin))
+        videos = metadata_manager.load_metadata(SUBJECT_NAME)["videos"]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    rows = {ambiguous: {"fixations": "ambiguous" if ambiguous else "confident", "count": 0, "correct_target": 0}
+            for ambiguous in (False, True)}
+    for video in videos:
+        fixated_balls = summary["trails"][video["trail"]]["fixated_balls"]
+        for fixation_id, fixation in video["fixations"].items():
+            row = rows[fixation["tag_ambiguous"]]
+            row["count"] += 1
+            row["correct_target"] += fixation["target_id"] == fixated_balls[int(fixation_id.split("_")[1])]
+    for row in rows.values():
+        row["accuracy"] = row["correct_target"] / row["count"] if row["count"] else 0.0
+    print(f"{result['fixations']} fixations tagged in {result['seconds']:.3f}s "
+          f"({result['relevant']} Relevant, {result['ambiguous']} ambiguous)\n")
+    print_table(list(rows.values()), ["fixations", "count", "correct_target", "accuracy"])
+
+
+if __name__ == "__main__":
+    main()
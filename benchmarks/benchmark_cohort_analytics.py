@@ -0,0 +1,99 @@
+"""
+Cohort analytics on a synthetic cohort (auto tagged): time of the first load (Unity logs parsed and cached), of a
+refresh when nothing changed and of recomputing target_history for several look back windows. The vectorized
+history must match a plain per prompt loop over the fixations.
+The world videos are generated at a tiny resolution and no snippets are written.
+
+Usage:
+    python benchmarks/benchmark_cohort_analytics.py --subjects 4 --duration 1800
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from bench_utils import timed, print_table, quiet_logging  # also puts the repo on sys.path
+
+from setup.CoreClasses import ProcessingContainer
+from src.utils.metadata_manager import MetadataManager
+from src.utils.metadata_store import MetadataStore
+from src.utils.subject_processor import SubjectProcessor
+from src.utils.synthetic_data import generate_synthetic_subject
+from src.utils.auto_tagger import auto_tag_subject, RELEVANT
+from src.utils.cohort_analytics import CohortAnalytics
+
+WINDOWS = [None, 5.0, 30.0, 120.0]
+
+
+def loop_history(fixations, searches, window):
+    """
+    The history without the join: for every prompt, go over all the fixations.
+    :return: The fixations_before count of every prompt.
+    """
+    counts = []
+    rows = list(fixations.itertuples(index=False))
+    for search in searches.itertuples(index=False):
+        count = 0
+        for fixation in rows:
+            if (fixation.subject, fixation.trail) != (search.subject, search.trail) or fixation.tag != RELEVANT \
+                    or fixation.target_id != search.ball_id or not fixation.end_ts <= search.prompt_ts:
+                continue
+            count += window is None or fixation.end_ts >= search.prompt_ts - window
+        counts.append(count)
+    return np.array(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subjects", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=1800.0, help="Length of each trail's recording in seconds")
+    args = parser.parse_args()
+
+    quiet_logging()
+    work_dir = tempfile.mkdtemp(prefix="ctt_cohort_")
+    try:
+        data_path = os.path.join(work_dir, "data")
+        metadata_manager = MetadataManager(base_directory=os.path.join(work_dir, "metadata"))
+        for i in range(args.subjects):
+            subject_name = f"SY{i:03d}"
+            generate_synthetic_subject(data_path, subject_name, duration_s=args.duration, resolution=(32, 24), seed=i)
+            container = ProcessingContainer(data_path=data_path, subject_name=subject_name)
+            container._create_out_path(os.path.join(work_dir, "out"))
+            SubjectProcessor(container, metadata_manager).process(write_snippets=False)
+            auto_tag_subject(container, metadata_manager)
+        for subject_name in metadata_manager.list_subjects():  # the first load parses the Unity logs again
+            shutil.rmtree(os.path.join(data_path, subject_name, "REC_ET", "UNI_cache"), ignore_errors=True)
+
+        timings = {}
+        store = MetadataStore(metadata_manager)
+        with timed(timings, "first load"):
+            analytics = CohortAnalytics(store, data_path)
+        with timed(timings, "refresh (unchanged)"):
+            analytics.refresh()
+        histories = {}
+        for window in WINDOWS:
+            with timed(timings, f"target_history window={window}"):
+                histories[window] = analytics.target_history(window=window)
+        with timed(timings, "latency_summary"):
+            summary = analytics.latency_summary(by=("fixated_before",))
+        fixations, searches = analytics.fixations(), analytics.searches()
+        with timed(timings, "per prompt loop (window=None)"):
+            expected = {window: loop_history(fixations, searches, window) for window in WINDOWS[:1]}
+        expected.update({window: loop_history(fixations, searches, window) for window in WINDOWS[1:]})
+        store.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{args.subjects} subjects, {len(fixations)} fixations, {len(searches)} prompts\n")
+    print_table([{"step": step, "seconds": seconds} for step, seconds in timings.items()], ["step", "seconds"])
+    print(f"\n{summary}")
+    if not all(np.array_equal(histories[window]["fixations_before"].to_numpy(), expected[window])
+               for window in WINDOWS):
+        print("FAILED: target_history doesn't match the per prompt loop")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
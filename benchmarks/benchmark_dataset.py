@@ -0,0 +1,59 @@
+"""
+Measures how many snippets per second SnippetDataset delivers for different numbers of decoding workers,
+on the snippets of a synthetic subject (snippet files or virtual snippets read from world.mp4).
+
+Usage:
+    python benchmarks/benchmark_dataset.py --duration 300 --workers 1,2,4,8 --virtual
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+from bench_utils import timed, print_table, quiet_logging  # also puts the repo on sys.path
+
+from setup.CoreClasses import ProcessingContainer
+from src.utils.metadata_manager import MetadataManager
+from src.utils.preprocessing import VideoPreprocessor
+from src.utils.snippet_dataset import SnippetDataset
+from src.utils.synthetic_data import generate_synthetic_subject
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=120, help="Recording length in seconds")
+    parser.add_argument("--resolution", default="640x480", help="World video resolution, WIDTHxHEIGHT")
+    parser.add_argument("--workers", default="1,2,4,8", help="Comma separated numbers of decoding workers")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--shuffle-buffer", type=int, default=16)
+    parser.add_argument("--virtual", action="store_true", help="Don't write snippet files, read from world.mp4")
+    args = parser.parse_args()
+
+    quiet_logging()
+    resolution = tuple(int(v) for v in args.resolution.lower().split("x"))
+    work_dir = tempfile.mkdtemp(prefix="ctt_dataset_")
+    try:
+        data_path = os.path.join(work_dir, 'data')
+        generate_synthetic_subject(data_path, "SY001", duration_s=args.duration, resolution=resolution, trails=["T2"])
+        container = ProcessingContainer(data_path=data_path, subject_name="SY001")
+        container._create_out_path(os.path.join(work_dir, 'out'))
+        metadata_manager = MetadataManager(base_directory=os.path.join(work_dir, 'metadata'))
+        VideoPreprocessor(container, trail="T2", metadata_manager=metadata_manager).process_streaming(
+            write_snippets=not args.virtual)
+
+        rows = []
+        for num_workers in (int(v) for v in args.workers.split(",")):
+            dataset = SnippetDataset(metadata_manager, batch_size=args.batch_size, num_workers=num_workers,
+                                     shuffle_buffer=args.shuffle_buffer, seed=0)
+            timings = {}
+            with timed(timings, "epoch"):
+                snippets = sum(len(batch["group_ids"]) for batch in dataset)
+            rows.append({"workers": num_workers, "snippets": snippets, "epoch_s": timings["epoch"],
+                         "snippets_per_s": snippets / timings["epoch"]})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print_table(rows, ["workers", "snippets", "epoch_s", "snippets_per_s"])
+
+
+if __name__ == "__main__":
+    main()
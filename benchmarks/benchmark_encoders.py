@@ -0,0 +1,135 @@
+"""
+Compares the snippet encoder profiles on the same snippets of a synthetic subject: encode fps, output bytes,
+decode fps and PSNR of the decoded frames against the source frames (inf = lossless).
+The snippets' frames are decoded once up front, so the encode timing covers only the encoding.
+
+Usage:
+    python benchmarks/benchmark_encoders.py --snippets 20 --resolution 1280x720 --calibration-out encoders.json
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+
+from bench_utils import timed, print_table, quiet_logging  # also puts the repo on sys.path
+
+from setup.CoreClasses import ProcessingContainer
+from src.utils.encoders import ENCODER_PROFILES, get_encoder_profile
+from src.utils.metadata_manager import MetadataManager
+from src.utils.preprocessing import VideoPreprocessor
+from src.utils.synthetic_data import generate_synthetic_subject
+from src.utils.virtual_snippets import VirtualSnippet, CapturePool
+
+
+def load_snippets(work_dir, num_snippets, resolution, trail="T2"):
+    """
+    Generates a synthetic subject and decodes the (padded) frames of its first fixation groups.
+    :return: (list of (target_length, H, W, 3) arrays, fps)
+    """
+    data_path = os.path.join(work_dir, 'data')
+    generate_synthetic_subject(data_path, "SY001", duration_s=max(60.0, num_snippets * 4.0), resolution=resolution,
+                               trails=[trail])
+    container = ProcessingContainer(data_path=data_path, subject_name="SY001")
+    container._create_out_path(os.path.join(work_dir, 'out'))
+    video_processor = VideoPreprocessor(container, trail=trail,
+                                        metadata_manager=MetadataManager(base_directory=os.path.join(work_dir, 'md')))
+    merged_dict = video_processor._merge_neighboring_fixations(video_processor._get_fixations_ts())
+    pool = CapturePool()
+    try:
+        snippets = [VirtualSnippet(video_processor.vid_path, *merged_dict[idx][:2], pool=pool).read_all()[0]
+                    for idx in range(min(num_snippets, len(merged_dict)))]
+    finally:
+        pool.close()
+    fps = int(cv2.VideoCapture(video_processor.vid_path).get(cv2.CAP_PROP_FPS))
+    return snippets, fps
+
+
+def psnr(decoded, source):
+    mse = np.mean((decoded.astype(np.float64) - source.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def benchmark_profile(profile, snippets, fps, out_dir):
+    """
+    Encodes all snippets with one profile, then decodes them back.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    height, width = snippets[0].shape[1:3]
+    paths = [os.path.join(out_dir, f"snippet_{idx}{profile.extension}") for idx in range(len(snippets))]
+    num_frames = sum(len(frames) for frames in snippets)
+    timings = {}
+    with timed(timings, "encode"):
+        for path, frames in zip(paths, snippets):
+            writer = profile.open_writer(path, fps, width, height)
+            try:
+                for frame in frames:
+                    writer.write(frame)
+            finally:
+                writer.release()
+
+    decoded = []
+    with timed(timings, "decode"):
+        for path in paths:
+            capture = cv2.VideoCapture(path)
+            frames = []
+            while True:
+                ret, frame = capture.read()
+                if not ret:
+                    break
+                frames.append(frame)
+            capture.release()
+            decoded.append(frames)
+    decoded_frames = sum(len(frames) for frames in decoded)
+    quality = [psnr(np.stack(frames), source[:len(frames)]) for frames, source in zip(decoded, snippets) if frames]
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    return {
+        "profile": profile.name,
+        "encode_fps": num_frames / timings["encode"],
+        "decode_fps": decoded_frames / timings["decode"],
+        "bytes": total_bytes,
+        "bytes_per_frame": total_bytes / num_frames,
+        "frames_ok": decoded_frames == num_frames,
+        "psnr_db": float(np.mean(quality)) if quality else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snippets", type=int, default=20, help="Number of snippets encoded with every profile")
+    parser.add_argument("--resolution", default="640x480", help="World video resolution, WIDTHxHEIGHT")
+    parser.add_argument("--profiles", default=",".join(ENCODER_PROFILES), help="Comma separated profile names")
+    parser.add_argument("--calibration-out", help="Save the measured throughput per profile as JSON")
+    parser.add_argument("--keep", action="store_true", help="Keep the encoded snippets for inspection")
+    args = parser.parse_args()
+
+    quiet_logging()
+    resolution = tuple(int(v) for v in args.resolution.lower().split("x"))
+    work_dir = tempfile.mkdtemp(prefix="ctt_encoders_")
+    try:
+        snippets, fps = load_snippets(work_dir, args.snippets, resolution)
+        rows = [benchmark_profile(get_encoder_profile(name), snippets, fps, os.path.join(work_dir, name))
+                for name in args.profiles.split(",")]
+    finally:
+        if args.keep:
+            print(f"Kept benchmark data in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{len(snippets)} snippets of {len(snippets[0])} frames at {resolution[0]}x{resolution[1]}\n")
+    print_table(rows, ["profile", "encode_fps", "decode_fps", "bytes", "bytes_per_frame", "psnr_db", "frames_ok"])
+    if args.calibration_out:
+        calibration = {"resolution": list(resolution),
+                       "profiles": {row["profile"]: {key: row[key] for key in
+                                                     ("encode_fps", "decode_fps", "bytes_per_frame")}
+                                    for row in rows}}
+        with open(args.calibration_out, 'w') as file:
+            json.dump(calibration, file, indent=4)
+        print(f"\nCalibration saved in {args.calibration_out}")
+
+
+if __name__ == "__main__":
+    main()
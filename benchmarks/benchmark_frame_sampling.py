@@ -0,0 +1,109 @@
+"""
+Exports the snippets of a synthetic subject with every frame sampler: trimming time, frames written and output
+bytes. Every sampled snippet must pass SnippetVerifier (its own snippet_length) and its frames must be the source
+frames listed in the group's frame_indices (checked by PSNR against the source recording).
+
+Usage:
+    python benchmarks/benchmark_frame_sampling.py --duration 300 --resolution 640x480 --stride 3 --count 16
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from bench_utils import timed, print_table, quiet_logging  # also puts the repo on sys.path
+
+from setup.CoreClasses import ProcessingContainer
+from src.utils.metadata_manager import MetadataManager
+from src.utils.preprocessing import VideoPreprocessor
+from src.utils.synthetic_data import generate_synthetic_subject
+from src.utils.frame_sampling import get_frame_sampler
+from src.utils.snippet_verifier import SnippetVerifier
+from src.utils.virtual_snippets import open_snippet, VirtualSnippet
+
+SUBJECT_NAME = "SY050"
+TRAIL = "T1"
+MIN_PSNR = 25.0  # the snippets are lossy mp4v, a wrong frame is far below this
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def check_frames(videos, num_groups=5):
+    """
+    Compares the first groups' snippet frames with the source frames at their frame_indices.
+    :return: The lowest PSNR.
+    """
+    lowest = float("inf")
+    for video in videos[:num_groups]:
+        frames, mask = open_snippet(video).read_all()
+        frame_indices = video.get("frame_indices") or list(range(video["start_frame"], video["end_frame"] + 1))
+        source, _ = VirtualSnippet(video["source_video"], video["start_frame"], video["end_frame"],
+                                   target_length=len(frame_indices), frame_indices=frame_indices).read_all()
+        real = frames[mask].astype(np.float64)
+        if len(real) != len(source):
+            return 0.0
+        mse = np.mean((real - source.astype(np.float64)) ** 2)
+        lowest = min(lowest, float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse))
+    return lowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=300.0, help="Recording length in seconds")
+    parser.add_argument("--resolution", default="640x480")
+    parser.add_argument("--stride", type=int, default=3)
+    parser.add_argument("--count", type=int, default=16)
+    args = parser.parse_args()
+
+    quiet_logging()
+    resolution = tuple(int(v) for v in args.resolution.lower().split("x"))
+    samplers = {"all": get_frame_sampler(),
+                f"stride={args.stride}": get_frame_sampler("stride", stride=args.stride),
+                f"uniform={args.count}": get_frame_sampler("uniform", count=args.count),
+                f"fixation_centred={args.count}": get_frame_sampler("fixation_centred", count=args.count)}
+    work_dir = tempfile.mkdtemp(prefix="ctt_sampling_")
+    rows = []
+    failed = []
+    try:
+        data_path = os.path.join(work_dir, "data")
+        generate_synthetic_subject(data_path, SUBJECT_NAME, duration_s=args.duration, resolution=resolution,
+                                   trails=[TRAIL])
+        for name, sampler in samplers.items():
+            run_dir = os.path.join(work_dir, name)
+            metadata_manager = MetadataManager(base_directory=os.path.join(run_dir, "metadata"))
+            container = ProcessingContainer(data_path=data_path, subject_name=SUBJECT_NAME)
+            container._create_out_path(os.path.join(run_dir, "out"))
+            video_processor = VideoPreprocessor(container, trail=TRAIL, metadata_manager=metadata_manager)
+            timings = {}
+            with timed(timings, "trim"):
+                groups = video_processor.process_streaming(sampler=sampler)
+            videos = metadata_manager.load_metadata(SUBJECT_NAME)["videos"]
+            report = SnippetVerifier(metadata_manager).verify([SUBJECT_NAME])
+            lowest_psnr = check_frames(videos)
+            rows.append({"sampler": name, "groups": groups, "seconds": timings["trim"],
+                         "frames": sum(len(video.get("frame_indices") or range(video["start_frame"],
+                                                                                 video["end_frame"] + 1))
+                                       for video in videos),
+                         "bytes": folder_size(container.out_path), "failed": len(report["failed"]),
+                         "min_psnr": lowest_psnr})
+            if report["failed"] or lowest_psnr < MIN_PSNR:
+                failed.append(name)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for row in rows:
+        row["bytes_vs_all"] = row["bytes"] / rows[0]["bytes"]
+        row["time_vs_all"] = row["seconds"] / rows[0]["seconds"]
+    print_table(rows, ["sampler", "groups", "frames", "seconds", "time_vs_all", "bytes", "bytes_vs_all", "failed",
+                       "min_psnr"])
+    if failed:
+        print(f"FAILED: {', '.join(failed)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Processes a synthetic trail several times with different grouping thresholds, once writing video snippets and once
+writing manifests into a FrameStore, and reports how much storage each run adds. With the frame store a run only adds
+the source frames no earlier run stored (storage follows the unique source frames, not the number of groupings).
+It also checks that every manifest expands back to the frames of its group.
+
+Usage:
+    python benchmarks/benchmark_frame_store.py --duration 60 --thresholds 10,30,60 --frame-codec jpeg
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from bench_utils import timed, print_table, quiet_logging  # also puts the repo on sys.path
+
+from setup.CoreClasses import ProcessingContainer
+from src.utils.metadata_manager import MetadataManager
+from src.utils.preprocessing import VideoPreprocessor
+from src.utils.synthetic_data import generate_synthetic_subject
+from src.utils.frame_store import FrameStore
+from src.utils.virtual_snippets import open_snippet, VirtualSnippet
+
+SUBJECT_NAME = "SY043"
+TRAIL = "T1"
+
+
+def folder_bytes(path):
+    total = 0
+    for folder, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(folder, file_name)) for file_name in files)
+    return total
+
+
+def run(data_path, work_dir, mode, threshold, frame_store):
+    """
+    Processes the trail into its own output folder.
+    :return: The trail's groups (metadata) and the elapsed seconds.
+    """
+    out_dir = os.path.join(work_dir, f"{mode}_{threshold}")
+    metadata_manager = MetadataManager(base_directory=os.path.join(out_dir, "metadata"))
+    container = ProcessingContainer(data_path=data_path, subject_name=SUBJECT_NAME)
+    container._create_out_path(out_dir)
+    video_processor = VideoPreprocessor(container, trail=TRAIL, metadata_manager=metadata_manager)
+    timings = {}
+    with timed(timings, "run"):
+        video_processor.process_streaming(threshold=threshold, metadata_batch=None, frame_store=frame_store)
+    return metadata_manager.load_metadata(SUBJECT_NAME)["videos"], timings["run"], out_dir
+
+
+def check_manifests(groups, lossless):
+    """
+    Compares each manifest with the group's frames decoded from the recording.
+    :return: The largest mean absolute pixel difference.
+    """
+    worst = 0.0
+    for video in groups:
+        stored_frames, stored_mask = open_snippet(video).read_all()
+        source_frames, source_mask = VirtualSnippet(video["source_video"], video["start_frame"],
+                                                    video["end_frame"]).read_all()
+        if not np.array_equal(stored_mask, source_mask):
+            raise AssertionError(f"Padding of {video['group_id']} doesn't match its group")
+        difference = np.abs(stored_frames.astype(np.int16) - source_frames).mean()
+        if lossless and difference:
+            raise AssertionError(f"Lossless frames of {video['group_id']} differ from the recording")
+        worst = max(worst, float(difference))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=60.0, help="Recording length in seconds")
+    parser.add_argument("--resolution", default="640x480")
+    parser.add_argument("--thresholds", default="10,30,60", help="One run per grouping threshold")
+    parser.add_argument("--frame-codec", default="jpeg", choices=["jpeg", "png"])
+    args = parser.parse_args()
+
+    quiet_logging()
+    resolution = tuple(int(v) for v in args.resolution.split("x"))
+    thresholds = [int(v) for v in args.thresholds.split(",")]
+    work_dir = tempfile.mkdtemp(prefix="ctt_frame_store_")
+    rows = []
+    try:
+        data_path = os.path.join(work_dir, "data")
+        generate_synthetic_subject(data_path, SUBJECT_NAME, duration_s=args.duration, resolution=resolution,
+                                   trails=[TRAIL])
+        store = FrameStore(os.path.join(work_dir, "frame_store"), frame_codec=args.frame_codec)
+        video_total, manifest_total = 0, 0
+        unique_frames = set()
+        worst_difference = 0.0
+        for threshold in thresholds:
+            groups, elapsed, out_dir = run(data_path, work_dir, "video", threshold, None)
+            video_total += folder_bytes(os.path.join(out_dir, "OUTPUTS"))
+            before = store.stats()["bytes"]
+            store_groups, store_elapsed, store_out_dir = run(data_path, work_dir, "store", threshold, store)
+            stats = store.stats()
+            manifest_total += folder_bytes(os.path.join(store_out_dir, "OUTPUTS"))
+            unique_frames.update(frame for video in store_groups
+                                 for frame in range(video["start_frame"], video["end_frame"] + 1))
+            worst_difference = max(worst_difference, check_manifests(store_groups, args.frame_codec == "png"))
+            rows.append({
+                "threshold": threshold,
+                "groups": len(groups),
+                "video_s": elapsed,
+                "store_s": store_elapsed,
+                "video_bytes_total": video_total,
+                "store_bytes_added": stats["bytes"] - before,
+                "store_bytes_total": stats["bytes"] + manifest_total,
+                "store_objects": stats["objects"],
+                "unique_frames": len(unique_frames),
+            })
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print_table(rows, ["threshold", "groups", "video_s", "store_s", "video_bytes_total", "store_bytes_added",
+                       "store_bytes_total", "store_objects", "unique_frames"])
+    print(f"\nAll manifests match their groups (largest mean pixel difference {worst_difference:.2f})")
+    # one object per unique source frame, plus the shared black padding frame
+    if any(row["store_objects"] > row["unique_frames"] + 1 for row in rows):
+        print("FAILED: the store holds more objects than unique source frames")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
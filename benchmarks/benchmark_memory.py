@@ -0,0 +1,122 @@
+"""
+Peak memory of the pipeline per stage and per MetadataManager operation, with a regression budget.
+
+For every scale (recording length in seconds) a synthetic subject is generated, then the pipeline runs in a fresh
+Python process under MemoryProfiler (so the RSS of one run doesn't hide the next one). The memory a run needs
+beyond a fixed baseline should not grow with the recording, so the budget is checked on the growth of the peak
+per hour of video between the shortest and the longest scale. The script exits with status 1 when it goes over
+the budget.
+
+Usage:
+    python benchmarks/benchmark_memory.py --scales 60,300 --mode streaming --budget-mb-per-hour 64
+    python benchmarks/benchmark_memory.py --scales 60,300 --mode staged --metric rss
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from bench_utils import print_table, quiet_logging  # also puts the repo on sys.path
+
+from setup.CoreClasses import ProcessingContainer
+from src.utils.metadata_manager import MetadataManager
+from src.utils.preprocessing import VideoPreprocessor, SnippetTrimmer
+from src.utils.synthetic_data import generate_synthetic_subject
+from src.utils.memory_profiler import MemoryProfiler, METADATA_OPERATIONS
+
+SUBJECT_NAME = "SY045"
+TRAIL = "T2"
+PIPELINE_STAGE = "pipeline"
+MB = 1024 ** 2
+
+
+def profile_run(data_path, work_dir, mode):
+    """
+    Runs the pipeline once under a MemoryProfiler.
+    :param mode: "staged" runs the steps of ProcessingUI.trim_videos, "streaming" runs process_streaming.
+    :return: The profiler's report.
+    """
+    metadata_manager = MetadataManager(base_directory=os.path.join(work_dir, "metadata"))
+    container = ProcessingContainer(data_path=data_path, subject_name=SUBJECT_NAME)
+    container._create_out_path(os.path.join(work_dir, "out"))
+    video_processor = VideoPreprocessor(container, trail=TRAIL, metadata_manager=metadata_manager)
+    with MemoryProfiler() as profiler, \
+            profiler.instrument(metadata_manager, METADATA_OPERATIONS), \
+            profiler.instrument(SnippetTrimmer, ["write_snippet"]):
+        with profiler.stage(PIPELINE_STAGE):
+            if mode == "streaming":
+                with profiler.stage("process_streaming"):
+                    video_processor.process_streaming()
+            else:
+                with profiler.stage("get_fixations"):
+                    fix_dict = video_processor._get_fixations_ts()
+                with profiler.stage("merge"):
+                    merged_dict = video_processor._merge_neighboring_fixations(fix_dict)
+                with profiler.stage("metadata"):
+                    video_processor.create_metadata_for_subject(fix_dict, merged_dict)
+                with profiler.stage("trim"):
+                    video_processor.trim_vid_around_fixations(merged_dict)
+    return profiler.report()
+
+
+def run_in_subprocess(data_path, work_dir, mode):
+    command = [sys.executable, os.path.abspath(__file__), "--profile-run", data_path, "--work-dir", work_dir,
+               "--mode", mode]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="60,300", help="Comma separated recording lengths in seconds")
+    parser.add_argument("--resolution", default="640x480", help="World video resolution, WIDTHxHEIGHT")
+    parser.add_argument("--mode", default="streaming", choices=["streaming", "staged"])
+    parser.add_argument("--metric", default="traced", choices=["traced", "rss"],
+                        help="traced: Python heap peak (tracemalloc), rss: sampled resident set size")
+    parser.add_argument("--budget-mb-per-hour", type=float, default=64.0,
+                        help="Allowed growth of the pipeline's peak memory per hour of video")
+    parser.add_argument("--profile-run", help=argparse.SUPPRESS)  # internal: data path of a single profiled run
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    quiet_logging()
+    if args.profile_run:
+        print(json.dumps(profile_run(args.profile_run, args.work_dir, args.mode)))
+        return
+
+    resolution = tuple(int(v) for v in args.resolution.lower().split("x"))
+    scales = sorted(float(s) for s in args.scales.split(","))
+    metric = f"{args.metric}_peak_bytes"
+    peaks = {}
+    for duration_s in scales:
+        work_dir = tempfile.mkdtemp(prefix="ctt_memory_")
+        try:
+            data_path = os.path.join(work_dir, "data")
+            generate_synthetic_subject(data_path, SUBJECT_NAME, duration_s=duration_s, resolution=resolution,
+                                       trails=[TRAIL])
+            report = run_in_subprocess(data_path, work_dir, args.mode)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        rows = [{**stats, "traced_peak_mb": stats["traced_peak_bytes"] / MB, "rss_peak_mb": stats["rss_peak_bytes"] / MB}
+                for stats in report]
+        print(f"\n{duration_s:.0f}s of video, {args.mode} pipeline:")
+        print_table(rows, ["stage", "calls", "seconds", "traced_peak_mb", "rss_peak_mb"])
+        peaks[duration_s] = next(stats[metric] for stats in report if stats["stage"] == PIPELINE_STAGE)
+
+    if len(scales) < 2:
+        print("\nGive at least two scales to check the memory budget.")
+        return
+    hours = (scales[-1] - scales[0]) / 3600
+    growth_mb_per_hour = (peaks[scales[-1]] - peaks[scales[0]]) / MB / hours
+    print(f"\nPeak {args.metric} memory grows by {growth_mb_per_hour:.1f} MB per hour of video "
+          f"(budget {args.budget_mb_per_hour:.1f} MB)")
+    if growth_mb_per_hour > args.budget_mb_per_hour:
+        print("FAILED: peak memory per processed hour of video is over the budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
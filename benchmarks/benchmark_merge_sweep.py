@@ -0,0 +1,60 @@
+"""
+Compares one plain _merge_neighboring_fixations call with a MergeSweep over many (threshold, target_length) pairs
+on the same fixations.
+
+Usage:
+    python benchmarks/benchmark_merge_sweep.py --fixations 20000
+"""
+import argparse
+
+import numpy as np
+
+from bench_utils import timed, print_table, quiet_logging  # also puts the repo on sys.path
+
+from src.utils.preprocessing import VideoPreprocessor
+from src.utils.merge_sweep import MergeSweep
+
+
+def random_fixations(num_fixations, fps=30, seed=0):
+    """
+    Fixations of 100-500ms with exponential gaps, as a fixation dictionary (like _get_fixations_ts).
+    """
+    rng = np.random.default_rng(seed)
+    durations = rng.integers(int(0.1 * fps), int(0.5 * fps), num_fixations)
+    gaps = rng.exponential(fps / 2, num_fixations).astype(np.int64)
+    starts = np.cumsum(gaps + np.concatenate([[0], durations[:-1]]))
+    ends = starts + durations - 1
+    return {idx: (int(starts[idx]), int(ends[idx])) for idx in range(num_fixations)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixations", type=int, default=20000)
+    parser.add_argument("--thresholds", default="0,5,10,15,20,25,30,40,50,60")
+    parser.add_argument("--target-lengths", default="60,90,120,150,180,210,240,270,300,360")
+    args = parser.parse_args()
+
+    quiet_logging()
+    fixation_dict = random_fixations(args.fixations)
+    thresholds = [int(v) for v in args.thresholds.split(",")]
+    target_lengths = [int(v) for v in args.target_lengths.split(",")]
+    pairs = [(threshold, target_length) for threshold in thresholds for target_length in target_lengths]
+
+    timings = {}
+    with timed(timings, "plain_merge"):
+        VideoPreprocessor._merge_neighboring_fixations(fixation_dict)
+    starts = np.array([fixation_dict[idx][0] for idx in range(len(fixation_dict))])
+    ends = np.array([fixation_dict[idx][1] for idx in range(len(fixation_dict))])
+    with timed(timings, "sweep"):
+        sweep = MergeSweep(starts, ends)
+        rows = [sweep.summary(threshold, target_length) for threshold, target_length in pairs]
+
+    print_table([row for row in rows if row["target_length"] == 180],
+                ["threshold", "target_length", "groups", "padding_ratio", "fixations_cut_by_cap",
+                 "fixations_left_out", "mean_fixations_per_group"])
+    print(f"\n{args.fixations} fixations: one plain merge {timings['plain_merge']:.3f}s, "
+          f"sweep of {len(pairs)} pairs {timings['sweep']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
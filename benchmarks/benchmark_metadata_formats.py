@@ -0,0 +1,74 @@
+"""
+Compares the metadata storage formats of MetadataManager (indented JSON, msgpack, compressed msgpack) on real
+subject files: file size, save time and load time, and checks that every format loads back identical metadata.
+
+Usage:
+    python benchmarks/benchmark_metadata_formats.py --subjects DI431,DF888 --repeat 5
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from bench_utils import REPO_ROOT, timed, print_table, quiet_logging  # also puts the repo on sys.path
+
+from src.utils.metadata_manager import MetadataManager, zstandard
+
+FORMATS = [("json", None), ("msgpack", None), ("msgpack", "zlib"), ("msgpack", "zstd")]
+
+
+def benchmark_format(subject_name, metadata, storage_format, compression, work_dir, repeat):
+    manager = MetadataManager(base_directory=os.path.join(work_dir, f"{storage_format}_{compression}"),
+                              storage_format=storage_format, compression=compression)
+    save_times, load_times = [], []
+    loaded = None
+    for _ in range(repeat):
+        timings = {}
+        with timed(timings, "save"):
+            manager.save_metadata(subject_name, metadata)
+        with timed(timings, "load"):
+            loaded = manager.load_metadata(subject_name)
+        save_times.append(timings["save"])
+        load_times.append(timings["load"])
+    return {
+        "subject": subject_name,
+        "format": storage_format if compression is None else f"{storage_format}+{compression}",
+        "bytes": os.path.getsize(manager._get_subject_metadata_path(subject_name)),
+        "save_s": min(save_times),
+        "load_s": min(load_times),
+        "lossless": loaded == metadata,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--metadata", default=os.path.join(REPO_ROOT, "metadata"), help="Metadata directory")
+    parser.add_argument("--subjects", default="DI431,DF888")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per format, the fastest is reported")
+    args = parser.parse_args()
+
+    quiet_logging()
+    source = MetadataManager(base_directory=args.metadata)
+    formats = [(storage_format, compression) for storage_format, compression in FORMATS
+               if compression != "zstd" or zstandard is not None]
+    if len(formats) < len(FORMATS):
+        print("zstandard is not installed, skipping msgpack+zstd\n")
+    rows = []
+    work_dir = tempfile.mkdtemp(prefix="ctt_metadata_formats_")
+    try:
+        for subject_name in args.subjects.split(","):
+            metadata = source.load_metadata(subject_name)
+            for storage_format, compression in formats:
+                rows.append(benchmark_format(subject_name, metadata, storage_format, compression, work_dir,
+                                             args.repeat))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print_table(rows, ["subject", "format", "bytes", "save_s", "load_s", "lossless"])
+    if not all(row["lossless"] for row in rows):
+        print("FAILED: a format didn't load back identical metadata")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
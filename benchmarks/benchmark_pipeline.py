@@ -0,0 +1,92 @@
+"""
+End-to-end benchmark of the VideoPreprocessor pipeline on synthetic subjects.
+
+For every scale (recording length in seconds) a synthetic subject is generated in a temporary folder,
+then each stage is timed separately and the whole run is timed once more from scratch.
+
+Usage:
+    python benchmarks/benchmark_pipeline.py --scales 30,120,600 --resolution 640x480
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+from bench_utils import timed, print_table, quiet_logging  # also puts the repo on sys.path
+
+from setup.CoreClasses import ProcessingContainer
+from src.utils.metadata_manager import MetadataManager
+from src.utils.preprocessing import VideoPreprocessor
+from src.utils.synthetic_data import generate_synthetic_subject
+
+STAGES = ["setup", "get_fixations", "merge", "metadata", "trim", "end_to_end"]
+
+
+def run_pipeline(data_path, subject_name, trail, out_dir, metadata_dir, results=None):
+    """
+    Runs the same steps as ProcessingUI.trim_videos. If results is given, each stage is timed into it.
+    """
+    results = {} if results is None else results
+    with timed(results, "setup"):
+        metadata_manager = MetadataManager(base_directory=metadata_dir)
+        container = ProcessingContainer(data_path=data_path, subject_name=subject_name)
+        container._create_out_path(out_dir)
+        video_processor = VideoPreprocessor(container, trail=trail, metadata_manager=metadata_manager)
+    with timed(results, "get_fixations"):
+        fix_dict = video_processor._get_fixations_ts()
+    with timed(results, "merge"):
+        merged_dict = video_processor._merge_neighboring_fixations(fix_dict)
+    with timed(results, "metadata"):
+        video_processor.create_metadata_for_subject(fix_dict, merged_dict)
+    with timed(results, "trim"):
+        video_processor.trim_vid_around_fixations(merged_dict)
+    results["fixations"] = len(fix_dict)
+    results["groups"] = len(merged_dict)
+    return results
+
+
+def benchmark_scale(duration_s, resolution, fixations_per_minute, trail="T2", keep=False):
+    """
+    Generates a subject of the given length and benchmarks the pipeline on it.
+    """
+    work_dir = tempfile.mkdtemp(prefix="ctt_bench_")
+    try:
+        data_path = os.path.join(work_dir, 'data')
+        subject_name = "SY001"
+        generate_synthetic_subject(data_path, subject_name, duration_s=duration_s, resolution=resolution,
+                                   fixations_per_minute=fixations_per_minute, trails=[trail])
+        results = {"duration_s": duration_s}
+        run_pipeline(data_path, subject_name, trail, os.path.join(work_dir, 'staged'),
+                     os.path.join(work_dir, 'metadata_staged'), results)
+
+        end_to_end = {}
+        with timed(end_to_end, "end_to_end"):
+            run_pipeline(data_path, subject_name, trail, os.path.join(work_dir, 'e2e'),
+                         os.path.join(work_dir, 'metadata_e2e'))
+        results.update(end_to_end)
+        return results
+    finally:
+        if keep:
+            print(f"Kept benchmark data in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="30,120,600", help="Comma separated recording lengths in seconds")
+    parser.add_argument("--resolution", default="640x480", help="World video resolution, WIDTHxHEIGHT")
+    parser.add_argument("--fixations-per-minute", type=float, default=120)
+    parser.add_argument("--keep", action="store_true", help="Keep the generated data for inspection")
+    args = parser.parse_args()
+
+    quiet_logging()
+    resolution = tuple(int(v) for v in args.resolution.lower().split("x"))
+    rows = []
+    for scale in (float(s) for s in args.scales.split(",")):
+        rows.append(benchmark_scale(scale, resolution, args.fixations_per_minute, keep=args.keep))
+    print_table(rows, ["duration_s", "fixations", "groups"] + STAGES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Loading the Unity trail logs of a synthetic cohort: parsing the text with plain pandas, with UnityLog.parse, and
+loading UnityLog's binary cache (REC_ET/UNI_cache). The cached columns must be identical to the parsed ones.
+The world videos are generated at a tiny resolution, only the Unity logs matter here.
+
+Usage:
+    python benchmarks/benchmark_unity_log.py --subjects 4 --duration 1800
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from bench_utils import timed, print_table, quiet_logging  # also puts the repo on sys.path
+
+from src.utils.synthetic_data import generate_synthetic_subject
+from src.utils.unity_log import UnityLog, load_unity_log, unity_cache_path
+
+TRAILS = ["T1", "T2"]
+COLUMNS = ["timestamps", "event_codes", "ball_ids", "ball_positions", "cam_positions", "gaze_directions"]
+
+
+def same_log(first, second):
+    return first.event_names == second.event_names and all(
+        np.array_equal(getattr(first, column), getattr(second, column), equal_nan=True) for column in COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subjects", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=1800.0, help="Recording length in seconds")
+    args = parser.parse_args()
+
+    quiet_logging()
+    work_dir = tempfile.mkdtemp(prefix="ctt_unity_log_")
+    try:
+        log_paths = []
+        for i in range(args.subjects):
+            summary = generate_synthetic_subject(work_dir, f"SY{i:03d}", duration_s=args.duration, resolution=(32, 24),
+                                                 trails=TRAILS, seed=i)
+            log_paths += [os.path.join(summary["uni_path"], f"SY{i:03d}_{trail}.txt") for trail in TRAILS]
+
+        timings = {}
+        with timed(timings, "pandas_default"):
+            rows = sum(len(pd.read_csv(path)) for path in log_paths)
+        with timed(timings, "parse"):
+            parsed = [UnityLog.parse(path) for path in log_paths]
+        with timed(timings, "parse_and_cache"):
+            for path in log_paths:
+                load_unity_log(path)
+        with timed(timings, "cached"):
+            cached = [load_unity_log(path) for path in log_paths]
+        text_bytes = sum(os.path.getsize(path) for path in log_paths)
+        cache_bytes = sum(os.path.getsize(unity_cache_path(path)) for path in log_paths)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{len(log_paths)} Unity logs, {rows} rows\n")
+    print_table([{"method": method, "seconds": seconds, "ms_per_log": 1000 * seconds / len(log_paths)}
+                 for method, seconds in timings.items()], ["method", "seconds", "ms_per_log"])
+    print(f"\nText logs {text_bytes} bytes, caches {cache_bytes} bytes")
+    if not all(same_log(first, second) for first, second in zip(parsed, cached)):
+        print("FAILED: the cache doesn't hold the parsed columns")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
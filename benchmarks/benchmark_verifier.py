@@ -0,0 +1,96 @@
+"""
+Compares SnippetVerifier (container headers, no decoding) with checking every snippet by decoding it with cv2,
+on the snippets of a synthetic subject. Both must agree on which snippets are broken (one is deleted and one
+is cut in half before checking).
+
+Usage:
+    python benchmarks/benchmark_verifier.py --duration 300 --workers 8
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import cv2
+
+from bench_utils import timed, print_table, quiet_logging  # also puts the repo on sys.path
+
+from setup.CoreClasses import ProcessingContainer
+from src.utils.metadata_manager import MetadataManager
+from src.utils.preprocessing import VideoPreprocessor, TARGET_LENGTH
+from src.utils.synthetic_data import generate_synthetic_subject
+from src.utils.snippet_verifier import SnippetVerifier
+
+SUBJECT_NAME = "SY046"
+TRAIL = "T1"
+
+
+def decode_check(videos):
+    """
+    The check without the verifier: decode every snippet and count its frames.
+    :return: The group ids of the broken snippets.
+    """
+    broken = set()
+    for video in videos:
+        capture = cv2.VideoCapture(video["snippet_path"])
+        frames = 0
+        while capture.isOpened():
+            ret, _ = capture.read()
+            if not ret:
+                break
+            frames += 1
+        capture.release()
+        if frames != TARGET_LENGTH:
+            broken.add(video["group_id"])
+    return broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=300.0, help="Recording length in seconds")
+    parser.add_argument("--resolution", default="640x480")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    quiet_logging()
+    resolution = tuple(int(v) for v in args.resolution.lower().split("x"))
+    work_dir = tempfile.mkdtemp(prefix="ctt_verifier_")
+    try:
+        data_path = os.path.join(work_dir, "data")
+        generate_synthetic_subject(data_path, SUBJECT_NAME, duration_s=args.duration, resolution=resolution,
+                                   trails=[TRAIL])
+        metadata_manager = MetadataManager(base_directory=os.path.join(work_dir, "metadata"))
+        container = ProcessingContainer(data_path=data_path, subject_name=SUBJECT_NAME)
+        container._create_out_path(os.path.join(work_dir, "out"))
+        VideoPreprocessor(container, trail=TRAIL, metadata_manager=metadata_manager).process_streaming()
+        videos = metadata_manager.load_metadata(SUBJECT_NAME)["videos"]
+        os.remove(videos[0]["snippet_path"])
+        with open(videos[1]["snippet_path"], "r+b") as file:
+            file.truncate(os.path.getsize(videos[1]["snippet_path"]) // 2)
+
+        timings = {}
+        with timed(timings, "decode"):
+            decode_broken = decode_check(videos)
+        with timed(timings, "headers"):
+            report = SnippetVerifier(metadata_manager, max_workers=args.workers).verify([SUBJECT_NAME])
+        with timed(timings, "packets"):
+            packet_report = SnippetVerifier(metadata_manager, count_packets=True,
+                                            max_workers=args.workers).verify([SUBJECT_NAME])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    rows = [
+        {"method": "decode every frame (cv2)", "seconds": timings["decode"], "broken": len(decode_broken)},
+        {"method": "SnippetVerifier headers", "seconds": timings["headers"], "broken": len(report["failed"])},
+        {"method": "SnippetVerifier packets", "seconds": timings["packets"], "broken": len(packet_report["failed"])},
+    ]
+    print(f"{len(videos)} snippets\n")
+    print_table(rows, ["method", "seconds", "broken"])
+    for verifier_report in (report, packet_report):
+        if {entry["group_id"] for entry in verifier_report["failed"]} != decode_broken:
+            print("FAILED: the verifier and the decoding check disagree")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Stress test for FileJobQueue with several local worker processes.
+
+A queue is filled with dummy jobs, then several worker processes drain it. One of them "crashes" (exits without
+finishing or releasing its job) after claiming its first job, so that job has to be reclaimed as stale by
+another worker. At the end every job must be done, and apart from the crashed one each job must have been
+processed exactly once, otherwise the script exits with status 1.
+
+Before that, a stalled worker is checked: worker A's claim goes stale and worker B reclaims and claims the job.
+A's heartbeat must fail (and stop A's handler), A's complete must leave B's claim alone, and B must finish the
+job as its own. A worker that crashes while finishing a job (after its claim was renamed to .finishing) must
+not lose the job: it is reclaimed once stale.
+
+Usage:
+    python benchmarks/stress_job_queue.py --workers 6 --jobs 60
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from bench_utils import quiet_logging  # also puts the repo on sys.path
+
+from src.utils.job_queue import FileJobQueue, JobLostError, run_worker
+
+STALE_TIMEOUT = 2
+
+
+def dummy_job(job, log_dir):
+    """
+    Records which worker processed the job (one file per processing), then takes a little while.
+    """
+    with open(os.path.join(log_dir, f"{job.name}.{os.getpid()}.{time.time_ns()}"), "w"):
+        pass
+    time.sleep(0.05)
+    return {"pid": os.getpid()}
+
+
+def worker(queue_dir, log_dir, crash):
+    quiet_logging()
+    job_queue = FileJobQueue(queue_dir, stale_timeout=STALE_TIMEOUT)
+    if crash:
+        job = job_queue.claim()
+        os._exit(0)  # dies while holding the claim, without heartbeats
+    run_worker(job_queue, poll_interval=0.2, handler=lambda job: dummy_job(job, log_dir))
+
+
+def check_stalled_worker(work_dir):
+    """
+    Worker A stalls past the stale timeout, worker B reclaims and claims its job, then A wakes up.
+    :return: A list of the problems found (empty if the queue behaved).
+    """
+    job_queue = FileJobQueue(os.path.join(work_dir, "stalled_queue"), stale_timeout=STALE_TIMEOUT)
+    job_queue.submit("STALL", "T2", "data", "out", "metadata")
+    problems = []
+    job_a = job_queue.claim("worker-A")
+    stale_time = time.time() - 2 * STALE_TIMEOUT
+    os.utime(job_a.path, (stale_time, stale_time))  # A stops sending heartbeats
+    job_queue.reclaim_stale()
+    job_b = job_queue.claim("worker-B")
+    if job_b is None:
+        return ["worker B could not claim the stale job"]
+    if job_queue.heartbeat(job_a):
+        problems.append("A's heartbeat succeeded on B's claim")
+    if not job_a.abort_event.is_set():
+        problems.append("A's failed heartbeat didn't cancel A's handler")
+    job_queue.complete(job_a, {"worker": "A"})
+    if job_queue.list_jobs("done") or not os.path.exists(job_b.path):
+        problems.append("A's complete moved B's claim")
+    if not job_queue.heartbeat(job_b):
+        problems.append("B's heartbeat failed on its own claim")
+    job_queue.complete(job_b, {"worker": "B"})
+    done = job_queue.list_jobs("done")
+    if done != [job_b.name] or json.load(open(os.path.join(job_queue.queue_dir, "done", done[0])))["worker"] \
+            != "worker-B":
+        problems.append("B's complete didn't finish the job as B's")
+
+    # a handler running under keep_alive is stopped when its claim is lost
+    job_queue.submit("STALL", "T1", "data", "out", "metadata")
+    job_c = job_queue.claim("worker-C")
+    try:
+        with job_queue.keep_alive(job_c, interval=0.05):
+            os.utime(job_c.path, (stale_time, stale_time))
+            job_queue.reclaim_stale()
+            if not job_c.abort_event.wait(5):
+                problems.append("the handler wasn't cancelled after its claim was lost")
+        problems.append("keep_alive didn't raise JobLostError")
+    except JobLostError:
+        pass
+
+    # worker D crashes in the middle of _finish, the job must come back once it is stale
+    job_queue.submit("STALL", "T3", "data", "out", "metadata")
+    job_d = job_queue.claim("worker-D")
+    finishing_path = f"{job_d.path}.finishing"
+    os.rename(job_d.path, finishing_path)
+    os.utime(finishing_path, (stale_time, stale_time))
+    if job_d.name not in job_queue.reclaim_stale() or job_d.name not in job_queue.list_jobs("pending"):
+        problems.append("a job whose worker crashed while finishing it was lost")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=6)
+    parser.add_argument("--jobs", type=int, default=60)
+    args = parser.parse_args()
+
+    quiet_logging()
+    with tempfile.TemporaryDirectory(prefix="ctt_queue_") as work_dir:
+        problems = check_stalled_worker(work_dir)
+        print(f"Stalled worker: {'; '.join(problems) if problems else 'OK'}")
+        if problems:
+            print("FAILED")
+            sys.exit(1)
+
+        queue_dir = os.path.join(work_dir, "queue")
+        log_dir = os.path.join(work_dir, "log")
+        os.makedirs(log_dir)
+        job_queue = FileJobQueue(queue_dir, stale_timeout=STALE_TIMEOUT)
+        for i in range(args.jobs):
+            job_queue.submit(f"SUBJ{i:03d}", "T2", "data", "out", "metadata")
+
+        start = time.perf_counter()
+        crasher = multiprocessing.Process(target=worker, args=(queue_dir, log_dir, True))
+        crasher.start()
+        crasher.join()
+        processes = [multiprocessing.Process(target=worker, args=(queue_dir, log_dir, False))
+                     for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        counts = job_queue.counts()
+        processed = {}
+        for entry in os.listdir(log_dir):
+            name = entry.split(".json.")[0] + ".json"
+            processed[name] = processed.get(name, 0) + 1
+        done = job_queue.list_jobs("done")
+        attempts = {name: json.load(open(os.path.join(queue_dir, "done", name)))["attempts"] for name in done}
+        duplicates = [name for name, count in processed.items() if count > 1]
+        reclaimed = [name for name, count in attempts.items() if count > 1]
+        print(f"{args.workers} workers, {args.jobs} jobs in {elapsed:.2f}s: {counts}, "
+              f"{len(reclaimed)} reclaimed after the crash, {len(duplicates)} processed twice")
+        if counts["done"] != args.jobs or duplicates or len(reclaimed) != 1:
+            print("FAILED")
+            sys.exit(1)
+        print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Stress test for concurrent MetadataManager writers.
+
+Several processes share one metadata directory and one subject. Each of them adds groups, sets their snippet
+paths and tags their fixations, all interleaved. At the end every single update must be in the file,
+otherwise the script exits with status 1 (a lost update).
+
+Usage:
+    python benchmarks/stress_metadata_writers.py --writers 8 --groups 25
+"""
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import time
+
+from bench_utils import quiet_logging  # also puts the repo on sys.path
+
+from src.utils.metadata_manager import MetadataManager
+
+SUBJECT = "STRESS"
+
+
+def writer(metadata_dir, writer_id, groups):
+    quiet_logging()
+    manager = MetadataManager(base_directory=metadata_dir)
+    for i in range(groups):
+        idx = writer_id * groups + i  # group ids are unique across the writers
+        group_id = f"group_{idx}"
+        manager.add_video_snippet(SUBJECT, {
+            "group_id": group_id,
+            "start_frame": i,
+            "end_frame": i + 1,
+            "total_fixations": 1,
+            "fixations": {f"fixation_{idx}": {"start_frame": i, "end_frame": i + 1, "duration": 2, "tag": None}},
+        })
+        manager.update_fixation_snippet_path(SUBJECT, f"snippet_{idx}.mp4", idx)
+        manager.update_fixation_tag(SUBJECT, group_id, f"fixation_{idx}", "Relevant")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--groups", type=int, default=25, help="Groups added (with a path and a tag) by each writer")
+    args = parser.parse_args()
+
+    quiet_logging()
+    with tempfile.TemporaryDirectory(prefix="ctt_stress_") as metadata_dir:
+        start = time.perf_counter()
+        processes = [multiprocessing.Process(target=writer, args=(metadata_dir, w, args.groups))
+                     for w in range(args.writers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        metadata = MetadataManager(base_directory=metadata_dir).load_metadata(SUBJECT)
+        expected = args.writers * args.groups
+        videos = metadata["videos"]
+        tagged = sum(1 for video in videos for fixation in video["fixations"].values() if fixation["tag"])
+        with_paths = sum(1 for video in videos
+                         if video.get("snippet_path") == video["group_id"].replace("group_", "snippet_") + ".mp4")
+        failed_writers = sum(1 for process in processes if process.exitcode != 0)
+        print(f"{args.writers} writers, {3 * expected} updates in {elapsed:.2f}s: "
+              f"{len(videos)}/{expected} groups, {with_paths}/{expected} snippet paths, {tagged}/{expected} tags, "
+              f"{failed_writers} failed writers")
+        if len(videos) != expected or with_paths != expected or tagged != expected or failed_writers:
+            print("FAILED: updates were lost")
+            sys.exit(1)
+        print("OK")
+
+
+if __name__ == "__main__":
+    main()
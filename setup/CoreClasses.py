@@ -84,3 +84,32 @@ class ProcessingContainer(DataContainer):
 
 
 
+
+class GlobalContainer:
+    def __init__(self):
+        """
+        The g_pool object Pupil Labs' modules (File_Source, plugins, exporters) expect, holding the recording's
+        paths and shared state. See gpool_initializers for how it is filled.
+        """
+        self.plugin_by_name = {}
+        self.plugins = None  # Plugins initialized dynamically
+        self.rec_dir = None
+        self.user_dir = None
+        self.capture = None
+        self.timestamps = None
+        self.min_data_confidence = 0.5
+        self.topics = (
+            "notify.eye_process.",
+            "notify.player_process.",
+            "notify.world_process.",
+            "notify.service_process",
+            "notify.clear_settings_process.",
+            "notify.player_drop_process.",
+            "notify.launcher_process.",
+            "notify.meta.should_doc",
+            "notify.circle_detector_process.should_start",
+            "notify.ipc_startup",
+        )
+
+    def __repr__(self):
+        return f"GlobalContainer(rec_dir={self.rec_dir})"
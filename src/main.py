@@ -1,20 +1,9 @@
 # General imports
 import os
-from shared_modules.plugin import Plugin_List
 import logging
 
-
-# Pupil imports
-from video_capture import File_Source
-
 # Project imports (written by us)
-from utils.preprocessing import Preprocessor
-
-# from utils.gpool_initializers import (initialize_basic_gpool,
-#                                       add_capture_to_gpool,
-#                                       initialize_plugins,
-#
-#                                       )
+from utils.gpool_initializers import PupilSession
 
 # Defining params
 plugin_initializers = [
@@ -113,22 +102,21 @@ def main():
     plugin_dir = os.path.abspath(r'..\setup\custom_plugins')
     output_dir = os.path.abspath(r'..\test')
 
-    # Initialize g_pool and attributes
-    g_pool = initialize_basic_gpool(input_dir, plugin_dir)
-    add_capture_to_gpool(g_pool)
-    #initialize_data_for_pre_computation(g_pool)
-    initialize_plugins(g_pool, plugin_initializers)
-
-    # Initialize Preprocessor
-    preprocessor = Preprocessor(g_pool=g_pool, output_dir=output_dir)
+    # Export requests: (recording directory, start frame, end frame), they all share one warm session
+    export_requests = [
+        (input_dir, 0, 100),
+    ]
 
-    # Run export for a single subject
-    try:
-        print("Starting export process...")
-        preprocessor.export_vid_for_subject(plugin_initializers)
-        print("Export process completed successfully.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    # The g_pool, its plugins and the recordings' captures and eye data are loaded once, every export re-targets them
+    with PupilSession(plugin_dir, plugin_initializers) as session:
+        for i, (rec_dir, start_frame, end_frame) in enumerate(export_requests):
+            out_file_path = os.path.join(output_dir, f"export_{i}.mp4")
+            try:
+                print(f"Starting export {i} of {rec_dir} ({start_frame}-{end_frame})...")
+                session.export(out_file_path, rec_dir, start_frame, end_frame)
+                print("Export process completed successfully.")
+            except Exception as e:
+                print(f"An error occurred: {e}")
 
 # Entry point
 if __name__ == "__main__":
@@ -13,6 +13,7 @@ from PIL import Image, ImageTk
 import time
 import os
 from src.utils.metadata_manager import MetadataManager
+from src.utils.virtual_snippets import open_snippet
 
 
 class MediaPlayerApp:
@@ -67,16 +68,19 @@ class MediaPlayerUI:
         self.subject_name = subject_name
 
         self.metadata_manager = MetadataManager(base_directory=metadata_path)
-        self.metadata = self.metadata_manager.load_metadata(subject_name)
-        self.videos = self.metadata.get("videos", [])
+        # Only the group headers are loaded here, a group's fixations are read when the group is selected
+        self.metadata_view = self.metadata_manager.open_metadata_view(subject_name)
+        self.videos = self.metadata_view.groups
 
-        self.cap = None
+        self.snippet = None  # the selected group's snippet file, or a virtual snippet read from the recording
+        self.playing = False
         self.current_frame = None
         self.current_video_index = 0
         self.current_fixation_index = 0
         self.selected_video = None
         self.playback_speed = tk.DoubleVar(value=1.0)
         self.selected_tag = tk.StringVar(value="Relevant")
+        self.ambiguous_only = tk.BooleanVar(value=False)  # skip the fixations the auto tagger is confident about
         self.tag_controls_frame = None # Will create it only when needed
         self.next_video_button = None  # Will create it only when needed
 
@@ -95,13 +99,15 @@ class MediaPlayerUI:
         tk.Label(control_frame, text=f"{self.metadata_path}", wraplength=180, justify="left").pack(pady=5)
 
         tk.Label(control_frame, text="Select Video:").pack(pady=(20, 0))
-        self.video_selector = ttk.Combobox(control_frame, values=[v["group_id"] for v in self.videos], state="readonly")
+        self.video_selector = ttk.Combobox(control_frame, values=[self.video_label(v) for v in self.videos],
+                                           state="readonly")
         self.video_selector.pack()
         self.video_selector.bind("<<ComboboxSelected>>", self.on_video_selected)
 
         tk.Label(control_frame, text="Playback Speed:").pack(pady=(20, 0))
         tk.OptionMenu(control_frame, self.playback_speed, 0.5, 1.0, 1.5, 2.0).pack()
 
+        tk.Checkbutton(control_frame, text="Only review ambiguous auto tags", variable=self.ambiguous_only).pack()
         tk.Button(control_frame, text="Play Fixations", command=self.play_next_fixation).pack(pady=10)
         tk.Button(control_frame, text="Pause Video", command=self.pause_video).pack(pady=5)
 
@@ -117,18 +123,30 @@ class MediaPlayerUI:
         self.video_canvas = tk.Canvas(main_frame, width=640, height=480, bg="black")
         self.video_canvas.pack(side=tk.RIGHT)
 
+    @staticmethod
+    def video_label(video):
+        """
+        The selector's label of a group, group ids restart in every trail (e.g. T1/group_0).
+        """
+        return f"{video['trail']}/{video['group_id']}" if video.get("trail") else video["group_id"]
+
     def on_video_selected(self, event):
-        group_id = self.video_selector.get()
-        for index, video in enumerate(self.videos):
-            if video["group_id"] == group_id:
-                self.current_video_index = index
-                self.current_fixation_index = 0
-                self.selected_video = video
-                break
+        index = self.video_selector.current()  # labels can repeat in old metadata, select by position
+        if index < 0:
+            return
+        self.current_video_index = index
+        self.current_fixation_index = 0
+        self.selected_video = self.metadata_view.load_group(index)
+        self.snippet = None
 
     def play_next_fixation(self):
         fixations = self.selected_video["fixations"]
         fixation_keys = list(fixations.keys())
+        while self.ambiguous_only.get() and self.current_fixation_index < len(fixation_keys):
+            fixation = fixations[fixation_keys[self.current_fixation_index]]
+            if fixation.get("tag_source") != "auto" or fixation.get("tag_ambiguous"):
+                break
+            self.current_fixation_index += 1  # a confident auto tag, nothing to review
         if self.current_fixation_index >= len(fixation_keys):
             messagebox.showinfo("Video Finished", "You have finished all fixations in this video.")
 
@@ -147,26 +165,26 @@ class MediaPlayerUI:
             return
 
         fixation = fixations[fixation_keys[self.current_fixation_index]]
+        if fixation.get("tag_source") == "auto" and fixation.get("tag"):
+            self.selected_tag.set(fixation["tag"])  # the proposed tag, the reviewer only has to confirm it
         start_frame = fixation["start_frame"]
         end_frame = fixation["end_frame"]
 
-        if not self.cap or not self.cap.isOpened():
-            self.cap = cv2.VideoCapture(self.selected_video["snippet_path"])
-            if not self.cap.isOpened():
-                messagebox.showerror("Error", f"Cannot open video: {self.selected_video['snippet_path']}")
+        if self.snippet is None:
+            try:
+                self.snippet = open_snippet(self.selected_video)
+            except FileNotFoundError as e:
+                messagebox.showerror("Error", f"Cannot open video: {e}")
                 return
 
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
         self.play_fixation(start_frame, end_frame)
 
     def play_fixation(self, start_frame, end_frame):
-        while True:
-            ret, frame = self.cap.read()
-            if not ret or self.cap.get(cv2.CAP_PROP_POS_FRAMES) > end_frame:
-                self.cap.release()
-                self.cap = None
-                self.tag_controls_frame.pack()
-                break
+        # start_frame and end_frame are frame indices of the recording, the snippet maps them to its own frames
+        self.playing = True
+        for frame_index, frame in self.snippet.iter_frames(start_frame, end_frame):
+            if not self.playing:  # paused
+                return
 
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             img = Image.fromarray(frame)
@@ -177,6 +195,9 @@ class MediaPlayerUI:
             self.root.update()
             time.sleep(0.03 / self.playback_speed.get())
 
+        self.playing = False
+        self.tag_controls_frame.pack()
+
     def submit_tag(self):
         tag = self.selected_tag.get().strip()
 
@@ -189,12 +210,14 @@ class MediaPlayerUI:
                 return  # Go back to tagging
 
         else:
-            fixation_id = f"fixation_{self.current_fixation_index}"
+            # fixation ids are numbered across the whole subject, not per group
+            fixation_id = list(self.selected_video["fixations"].keys())[self.current_fixation_index]
             self.metadata_manager.update_fixation_tag(
                 subject_name=self.subject_name,
                 group_id=self.selected_video["group_id"],
                 fixation_id=fixation_id,
-                tag=tag
+                tag=tag,
+                trail=self.selected_video.get("trail")
             )
 
         self.current_fixation_index += 1
@@ -202,9 +225,8 @@ class MediaPlayerUI:
         self.play_next_fixation()
 
     def pause_video(self):
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
-            self.cap = None
+        if self.playing:
+            self.playing = False
             messagebox.showinfo("Pause", "Video playback paused.")
 
     def load_next_video(self):
@@ -213,15 +235,17 @@ class MediaPlayerUI:
             messagebox.showinfo("Done", "You have completed all videos!")
             self.video_selector.set("")
             self.selected_video = None
+            self.snippet = None
             if self.next_video_button:
                 self.next_video_button.destroy()
                 self.next_video_button = None
             return
 
         # Set the next video
-        self.selected_video = self.videos[self.current_video_index]
+        self.selected_video = self.metadata_view.load_group(self.current_video_index)
+        self.snippet = None
         self.current_fixation_index = 0
-        self.video_selector.set(self.selected_video["group_id"])
+        self.video_selector.current(self.current_video_index)
 
         if self.next_video_button:
             self.next_video_button.destroy()
@@ -1,10 +1,15 @@
 # general imports
+import queue
+import threading
 import tkinter as tk
 from tkinter import *
+from tkinter import ttk
 
 # own imports
 from src.utils.metadata_manager import MetadataManager
 from src.utils.preprocessing import VideoPreprocessor
+from src.utils.encoders import ENCODER_PROFILES, DEFAULT_ENCODER
+from src.utils.progress import format_progress
 from setup.CoreClasses import ProcessingContainer, DataContainer
 
 
@@ -18,6 +23,14 @@ class ProcessingUI:
         self.processing_container = None
         self.VideoProcessor = None
         self.metadata_manager = None
+        self.virtual_snippets = tk.BooleanVar(value=False)
+        self.encoder = tk.StringVar(value=DEFAULT_ENCODER)
+        # the trimming runs on a worker thread, it reports to the Tk thread through worker_messages
+        self.worker = None
+        self.cancel_event = threading.Event()
+        self.worker_messages = queue.Queue()
+        self.progress_value = tk.DoubleVar(value=0.0)
+        self.progress_text = tk.StringVar(value="")
 
         # Set up the UI (e.g., input fields for user-provided data)
         self.setup_ui()
@@ -99,7 +112,16 @@ class ProcessingUI:
         tk.Button(next_window, text="Back", command=lambda: self.go_back(next_window)).pack()
 
         # Add buttons for further operations
-        tk.Button(next_window, text="Trim Videos", command=self.trim_videos).pack()
+        self.trim_button = tk.Button(next_window, text="Trim Videos", command=self.trim_videos)
+        self.trim_button.pack()
+        self.cancel_button = tk.Button(next_window, text="Cancel", command=self.cancel_trimming, state=DISABLED)
+        self.cancel_button.pack()
+        ttk.Progressbar(next_window, variable=self.progress_value, maximum=100, length=400).pack()
+        tk.Label(next_window, textvariable=self.progress_text).pack()
+        tk.Checkbutton(next_window, text="Virtual snippets (don't write snippet files, read groups from world.mp4)",
+                       variable=self.virtual_snippets).pack()
+        tk.Label(next_window, text="Snippet encoder:").pack()
+        tk.OptionMenu(next_window, self.encoder, *ENCODER_PROFILES).pack()
 
     def go_back(self, current_window):
         """Return to the main window."""
@@ -107,12 +129,76 @@ class ProcessingUI:
         self.root.deiconify()  # Show the main window again
 
     def trim_videos(self):
-        """Trims videos using trim_vid_around_fixations function of VidPreprocessor class"""
-        print("Trimming videos...")  # Replace with actual implementation
-        fix_dict = self.video_processor._get_fixations_ts()
-        merged_dict = self.video_processor._merge_neighboring_fixations(fix_dict)
-        self.video_processor.create_metadata_for_subject(fix_dict, merged_dict)
-        self.video_processor.trim_vid_around_fixations(merged_dict)
+        """Starts trimming the videos (see _trim_videos_worker) on a worker thread, so the window stays responsive"""
+        if self.worker is not None and self.worker.is_alive():
+            return
+        print("Trimming videos...")
+        self.cancel_event.clear()
+        self.progress_value.set(0.0)
+        self.progress_text.set("Reading fixations...")
+        self.trim_button.config(state=DISABLED)
+        self.cancel_button.config(state=NORMAL)
+        # the Tk variables are read here, widgets must not be touched from the worker thread
+        self.worker = threading.Thread(target=self._trim_videos_worker,
+                                       args=(self.virtual_snippets.get(), self.encoder.get()), daemon=True)
+        self.worker.start()
+        self.root.after(100, self._poll_worker)
+
+    def _trim_videos_worker(self, virtual_snippets, encoder):
+        """
+        Runs on the worker thread: fixations -> groups -> metadata -> trim_vid_around_fixations.
+        Everything it reports goes through self.worker_messages as (kind, value) tuples.
+        """
+        try:
+            fix_dict = self.video_processor._get_fixations_ts()
+            merged_dict = self.video_processor._merge_neighboring_fixations(fix_dict)
+            self.worker_messages.put(("status", f"Creating metadata for {len(merged_dict)} groups..."))
+            # the trail's groups are replaced, so trimming again after a cancel doesn't add them a second time
+            self.video_processor.create_metadata_for_subject(fix_dict, merged_dict, replace=True,
+                                                             virtual=virtual_snippets)
+            if virtual_snippets:
+                # the metadata already points at the source video, the media player reads the groups from there
+                self.worker_messages.put(("done", "Virtual snippets selected, no snippet files are written."))
+                return
+            written = self.video_processor.trim_vid_around_fixations(
+                merged_dict, encoder=encoder, cancel_event=self.cancel_event,
+                progress_callback=lambda progress: self.worker_messages.put(("progress", progress)))
+            if written < len(merged_dict):
+                self.worker_messages.put(("done", f"Cancelled after {written}/{len(merged_dict)} snippets, "
+                                                  f"trimming again redoes every group of the trail."))
+            else:
+                self.worker_messages.put(("done", f"All {written} video snippets created successfully."))
+        except Exception as e:
+            self.worker_messages.put(("error", f"Trimming failed: {e}"))
+
+    def _poll_worker(self):
+        """Shows the worker's messages, runs on the Tk thread every 100ms until the worker is done"""
+        finished = False
+        while True:
+            try:
+                kind, value = self.worker_messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                self.progress_value.set(100 * (value["fraction"] or 0.0))
+                self.progress_text.set(format_progress(value))
+            elif kind == "status":
+                self.progress_text.set(value)
+            else:  # done or error
+                self.progress_text.set(value)
+                print(value)
+                finished = True
+        if finished or (not self.worker.is_alive() and self.worker_messages.empty()):
+            self.trim_button.config(state=NORMAL)
+            self.cancel_button.config(state=DISABLED)
+        else:
+            self.root.after(100, self._poll_worker)
+
+    def cancel_trimming(self):
+        """Asks the worker to stop after the snippet it is writing (the metadata stays consistent)"""
+        self.cancel_event.set()
+        self.cancel_button.config(state=DISABLED)
+        self.progress_text.set("Cancelling after the current snippet...")
 
 
 if __name__ == "__main__":
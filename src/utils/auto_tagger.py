@@ -0,0 +1,236 @@
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+# Our own libraries
+from src.utils.subject_processor import SubjectProcessor
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+RELEVANT, IRRELEVANT = "Relevant", "Irrelevant"  # the tags of MediaPlayerUI
+
+
+def load_frame_timestamps(world_timestamps_path):
+    """
+    :return: The Pupil time of every world frame (first column of the export's world_timestamps.csv).
+    """
+    return pd.read_csv(world_timestamps_path).iloc[:, 0].to_numpy(dtype=np.float64)
+
+
+def group_fixations(videos, trail, include_untrailed=False):
+    """
+    Collects the fixations of a trail's groups. A group's fixations are filtered by its frame range, older
+    metadata files have every earlier fixation in each group.
+    :param videos: The subject's metadata["videos"] list.
+    :param include_untrailed: Also collect the groups without a trail (metadata written before the groups had
+                              one), for a subject that has a single trail.
+    :return: A list of (group's trail, group_id, fixation_id, start frame, end frame), in time order. The group's
+             trail is None for groups without one.
+    """
+    fixations = []
+    for video in videos:
+        if video.get("trail") != trail and not (include_untrailed and video.get("trail") is None):
+            continue
+        for fixation_id, fixation in video["fixations"].items():
+            if video["start_frame"] <= fixation["start_frame"] and fixation["end_frame"] <= video["end_frame"]:
+                fixations.append((video.get("trail"), video["group_id"], fixation_id, fixation["start_frame"],
+                                  fixation["end_frame"]))
+    fixations.sort(key=lambda fixation: fixation[3])
+    return fixations
+
+
+class AutoTagger:
+    def __init__(self, hit_angle=3.0, ambiguity_margin=1.0, min_confidence=0.6, clock_offset=0.0):
+        """
+        Proposes fixation tags by hit testing the gaze against the Unity balls: every gaze sample of the Unity log
+        that falls inside a fixation's time window is compared with the direction from the camera to every ball.
+        Every sample within hit_angle of its nearest ball votes for that ball. A fixation is Relevant (with the ball
+        with the most votes as its target) if that ball got at least as many votes as there are samples that hit no
+        ball, otherwise Irrelevant. Voting keeps a single stray sample (e.g. at a fixation's edge) from flipping the
+        result. Everything is done with array operations over all the samples of a trail at once.
+        :param hit_angle: Degrees between the gaze and the direction of a ball that still count as a hit.
+        :param ambiguity_margin: Degrees. A fixation is ambiguous if most of its samples have a second ball within
+                                 this margin of the nearest one.
+        :param min_confidence: Fixations with a lower confidence (share of their gaze samples that hit the
+                               chosen ball, or that hit no ball for Irrelevant) are ambiguous.
+        :param clock_offset: Seconds added to the Unity timestamps to get Pupil time.
+        """
+        self.hit_angle = hit_angle
+        self.ambiguity_margin = ambiguity_margin
+        self.min_confidence = min_confidence
+        self.clock_offset = clock_offset
+
+    def tag(self, fixation_start_ts, fixation_end_ts, unity_log):
+        """
+        Tags fixations given by their time windows.
+        :param fixation_start_ts: Pupil time of every fixation's first frame (sorted, non overlapping).
+        :param fixation_end_ts: Pupil time of every fixation's last frame.
+        :param unity_log: The trail's UnityLog.
+        :return: A dict of arrays (one value per fixation): tag (None without gaze samples), target_id (-1 for no
+                 ball), angle (degrees to the chosen ball), samples, confidence and ambiguous.
+        """
+        fixation_start_ts = np.asarray(fixation_start_ts, dtype=np.float64)
+        fixation_end_ts = np.asarray(fixation_end_ts, dtype=np.float64)
+        num_fixations = len(fixation_start_ts)
+        ball_ids, ball_positions = unity_log.spawns()
+        sample_ts, cam_positions, gaze_directions = unity_log.gaze_samples()
+        sample_ts = sample_ts + self.clock_offset
+
+        # the fixation each gaze sample belongs to (samples between fixations are dropped)
+        fixation_of_sample = np.searchsorted(fixation_start_ts, sample_ts, side="right") - 1
+        inside = fixation_of_sample >= 0
+        inside[inside] = sample_ts[inside] <= fixation_end_ts[fixation_of_sample[inside]]
+        fixation_of_sample = fixation_of_sample[inside]
+        samples = np.bincount(fixation_of_sample, minlength=num_fixations)
+
+        result = {
+            "tag": np.full(num_fixations, None, dtype=object),
+            "target_id": np.full(num_fixations, -1, dtype=np.int64),
+            "angle": np.full(num_fixations, np.nan),
+            "samples": samples,
+            "confidence": np.zeros(num_fixations),
+            "ambiguous": np.ones(num_fixations, dtype=bool),
+        }
+        if not len(fixation_of_sample):
+            return result
+        if not len(ball_ids):
+            has_samples = samples > 0
+            result["tag"][has_samples] = IRRELEVANT
+            result["confidence"][has_samples] = 1.0
+            result["ambiguous"][has_samples] = False
+            return result
+
+        # angle between every sample's gaze and the direction to every ball, (samples, balls)
+        to_balls = ball_positions[None, :, :].astype(np.float64) - cam_positions[inside][:, None, :]
+        to_balls /= np.linalg.norm(to_balls, axis=2, keepdims=True)
+        gaze = gaze_directions[inside].astype(np.float64)
+        gaze /= np.linalg.norm(gaze, axis=1, keepdims=True)
+        angles = np.degrees(np.arccos(np.clip(np.einsum("sbk,sk->sb", to_balls, gaze), -1.0, 1.0)))
+
+        # every sample votes for the ball it hits (if any), a fixation's samples are contiguous
+        sample_order = np.argsort(angles, axis=1)
+        rows = np.arange(len(angles))
+        nearest_angle = angles[rows, sample_order[:, 0]]
+        sample_hit = nearest_angle <= self.hit_angle
+        sample_tie = sample_hit & (angles[rows, sample_order[:, 1]] - nearest_angle < self.ambiguity_margin) \
+            if angles.shape[1] > 1 else np.zeros(len(angles), dtype=bool)
+        votes = np.zeros(angles.shape)
+        votes[rows[sample_hit], sample_order[sample_hit, 0]] = 1.0
+        fixations_with_samples, first_sample = np.unique(fixation_of_sample, return_index=True)
+        num_samples = samples[fixations_with_samples]
+        ball_votes = np.add.reduceat(votes, first_sample, axis=0)
+        best = np.argmax(ball_votes, axis=1)
+        best_votes = ball_votes[np.arange(len(best)), best]
+        hit_votes = ball_votes.sum(axis=1)
+        is_hit = best_votes >= (num_samples - hit_votes)  # at least as many samples on the best ball as on no ball
+
+        # mean angle to the chosen ball (to the nearest ball for Irrelevant)
+        position = np.searchsorted(fixations_with_samples, fixation_of_sample)
+        target = np.where(is_hit[position], best[position], sample_order[:, 0])
+        best_angle = np.add.reduceat(angles[rows, target], first_sample) / num_samples
+        # confidence: share of the samples that agree with the decision
+        confidence = np.where(is_hit, best_votes, num_samples - hit_votes) / num_samples
+        ties = np.add.reduceat(sample_tie.astype(np.float64), first_sample) / num_samples
+        ambiguous = (confidence < self.min_confidence) | (is_hit & (ties >= 0.5))
+        result["tag"][fixations_with_samples] = np.where(is_hit, RELEVANT, IRRELEVANT)
+        result["target_id"][fixations_with_samples] = np.where(is_hit, ball_ids[best], -1)
+        result["angle"][fixations_with_samples] = best_angle
+        result["confidence"][fixations_with_samples] = confidence
+        result["ambiguous"][fixations_with_samples] = ambiguous
+        return result
+
+    def tag_updates(self, video_processor, videos, include_untrailed=False):
+        """
+        Tags the fixations of one trail.
+        :param video_processor: The trail's VideoPreprocessor (for its world timestamps and Unity log).
+        :param videos: The subject's metadata["videos"] list.
+        :param include_untrailed: Also tag the groups without a trail, see group_fixations.
+        :return: The updates for MetadataManager.update_fixation_tags.
+        """
+        fixations = group_fixations(videos, video_processor.trail, include_untrailed)
+        if not fixations:
+            return []
+        frame_ts = load_frame_timestamps(video_processor.pl_timestamps)
+        start_frames = np.array([fixation[3] for fixation in fixations])
+        end_frames = np.array([fixation[4] for fixation in fixations])
+        last_frame = len(frame_ts) - 1
+        result = self.tag(frame_ts[np.minimum(start_frames, last_frame)], frame_ts[np.minimum(end_frames, last_frame)],
+                          video_processor.load_unity_log())
+        return [{
+            "trail": group_trail,  # None for groups without a trail, so update_fixation_tags finds them
+            "group_id": group_id,
+            "fixation_id": fixation_id,
+            "tag": result["tag"][i],
+            "tag_source": "auto",
+            "tag_confidence": round(float(result["confidence"][i]), 3),
+            "tag_ambiguous": bool(result["ambiguous"][i]),
+            "target_id": int(result["target_id"][i]) if result["target_id"][i] >= 0 else None,
+        } for i, (group_trail, group_id, fixation_id, _, _) in enumerate(fixations)]
+
+
+def auto_tag_subject(parent, metadata_manager, trails=None, tagger=None, overwrite_manual=False):
+    """
+    Proposes tags for every fixation of a subject and writes them in one metadata commit, marked with
+    tag_source "auto". Tags set by a reviewer (tag_source "manual") are kept unless overwrite_manual.
+    Groups without a trail (metadata written before the groups had one) are tagged as the subject's trail if it
+    has a single exported trail, otherwise they are skipped with an error (the subject needs to be processed again).
+    :param parent: An instance of ProcessingContainer object.
+    :param metadata_manager: An instance of MetadataManager object.
+    :param trails: The trails to tag (default: every trail with an exported recording).
+    :param tagger: An AutoTagger (default: AutoTagger()).
+    :return: A dict with the number of fixations, updated tags, Relevant tags and ambiguous tags.
+    """
+    start_time = time.perf_counter()
+    tagger = tagger or AutoTagger()
+    videos = metadata_manager.load_metadata(parent.subject_name)["videos"]
+    subject_processor = SubjectProcessor(parent, metadata_manager, trails)
+    untrailed = sum(video.get("trail") is None for video in videos)
+    include_untrailed = untrailed > 0 and trails is None and len(subject_processor.trails) == 1
+    if untrailed and include_untrailed:
+        logging.info(f"{untrailed} groups of subject {parent.subject_name} have no trail, tagging them as its only "
+                     f"trail {subject_processor.trails[0]}")
+    elif untrailed:
+        logging.error(f"{untrailed} groups of subject {parent.subject_name} have no trail and can't be matched to one "
+                      f"of its trails {subject_processor.trails}, they are not tagged. Process the subject again to "
+                      f"write its metadata with trails.")
+    tag_updates = []
+    for trail, video_processor in subject_processor.video_processors.items():
+        tag_updates += tagger.tag_updates(video_processor, videos, include_untrailed)
+    updated = metadata_manager.update_fixation_tags(parent.subject_name, tag_updates,
+                                                    overwrite_manual=overwrite_manual)
+    summary = {
+        "fixations": len(tag_updates),
+        "updated": updated,
+        "relevant": sum(tag_update["tag"] == RELEVANT for tag_update in tag_updates),
+        "ambiguous": sum(tag_update["tag_ambiguous"] for tag_update in tag_updates),
+        "seconds": time.perf_counter() - start_time,
+    }
+    logging.info(f"Auto tagged subject {parent.subject_name}: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    from setup.CoreClasses import ProcessingContainer
+    from src.utils.metadata_manager import MetadataManager
+
+    parser = argparse.ArgumentParser(description="Propose fixation tags from the Unity logs (gaze vs. ball hit test).")
+    parser.add_argument("subjects", nargs="+", help="Subject names (e.g. AN755)")
+    parser.add_argument("--data", required=True, help="Data folder of all subjects")
+    parser.add_argument("--metadata", required=True, help="Metadata directory")
+    parser.add_argument("--trails", help="Comma separated trails (default: all exported trails)")
+    parser.add_argument("--hit-angle", type=float, default=3.0)
+    parser.add_argument("--overwrite-manual", action="store_true", help="Also replace reviewers' tags")
+    args = parser.parse_args()
+
+    manager = MetadataManager(base_directory=args.metadata)
+    for subject in args.subjects:
+        print(subject, auto_tag_subject(ProcessingContainer(data_path=args.data, subject_name=subject), manager,
+                                        trails=args.trails.split(",") if args.trails else None,
+                                        tagger=AutoTagger(hit_angle=args.hit_angle),
+                                        overwrite_manual=args.overwrite_manual))
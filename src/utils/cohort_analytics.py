@@ -0,0 +1,222 @@
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+# Our own libraries
+from setup.CoreClasses import ProcessingContainer
+from src.utils.subject_processor import SubjectProcessor
+from src.utils.auto_tagger import load_frame_timestamps, RELEVANT
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+FIXATION_COLUMNS = ["subject", "trail", "group_id", "fixation_id", "start_frame", "end_frame", "duration", "tag",
+                    "tag_source", "tag_confidence", "target_id"]
+SEARCH_COLUMNS = ["subject", "trail", "ball_id", "prompt_ts", "found_ts", "latency"]
+
+
+class CohortAnalytics:
+    def __init__(self, metadata_store, data_path, clock_offset=0.0):
+        """
+        Joins the fixations of every subject and trail (from the MetadataStore) with the Unity task events, to ask
+        whether fixating a ball before it is prompted shortens the search for it.
+        The joined tables are kept in memory and refresh only reloads the subjects whose metadata changed, so
+        recomputing with other parameters (see target_history) only re-runs the array operations.
+        :param metadata_store: An instance of MetadataStore object.
+        :param data_path: Data folder of all subjects (for the world timestamps and the Unity logs).
+        :param clock_offset: Seconds added to the Unity timestamps to get Pupil time.
+        """
+        self.metadata_store = metadata_store
+        self.data_path = data_path
+        self.clock_offset = clock_offset
+        self._fixations = {}  # subject -> DataFrame of its fixations with start_ts/end_ts
+        self._searches = {}  # subject -> DataFrame of its prompt/found pairs
+        self.refresh()
+
+    def refresh(self):
+        """
+        Refreshes the metadata store and reloads the subjects that changed (or aren't loaded yet).
+        :return: A list of the reloaded subject names.
+        """
+        start_time = time.perf_counter()
+        changed = set(self.metadata_store.refresh())
+        subjects = [name for (name,) in self.metadata_store.query("SELECT name FROM subjects ORDER BY name")]
+        for subject_name in set(self._fixations) - set(subjects):
+            del self._fixations[subject_name]
+            del self._searches[subject_name]
+        reloaded = [subject_name for subject_name in subjects
+                    if subject_name in changed or subject_name not in self._fixations]
+        for subject_name in reloaded:
+            self._fixations[subject_name], self._searches[subject_name] = self._load_subject(subject_name)
+        logging.info(f"Cohort analytics refreshed, {len(reloaded)} of {len(subjects)} subjects reloaded "
+                     f"in {time.perf_counter() - start_time:.2f}s")
+        return reloaded
+
+    def _load_subject(self, subject_name):
+        """
+        Reads a subject's fixations from the store, converts their frames to Pupil time and collects the trails'
+        prompt and found events (from the Unity caches).
+        :return: (fixations DataFrame, searches DataFrame).
+        """
+        fixations = pd.DataFrame(self.metadata_store.query(
+            f"SELECT {', '.join(FIXATION_COLUMNS)} FROM fixations WHERE subject = ? ORDER BY trail, start_frame",
+            (subject_name,)), columns=FIXATION_COLUMNS)
+        fixations["start_ts"] = np.nan
+        fixations["end_ts"] = np.nan
+        # tags saved before tag_source existed were set by a reviewer (see metadata_manager.is_manual_tag)
+        fixations.loc[fixations["tag_source"].isna() & fixations["tag"].notna(), "tag_source"] = "manual"
+        if fixations.empty:
+            return fixations, pd.DataFrame(columns=SEARCH_COLUMNS)
+
+        try:
+            parent = ProcessingContainer(data_path=self.data_path, subject_name=subject_name)
+            parent.out_path = None  # only the recordings' paths are needed, nothing is written
+            video_processors = SubjectProcessor(parent, self.metadata_store.metadata_manager).video_processors
+        except (FileNotFoundError, RuntimeError) as e:
+            logging.warning(f"No recordings of subject {subject_name} in {self.data_path}, its fixations have no "
+                            f"times: {e}")
+            return fixations, pd.DataFrame(columns=SEARCH_COLUMNS)
+        # groups without a trail (metadata written before the groups had one), like auto_tagger.auto_tag_subject
+        untrailed = fixations["trail"].isna().to_numpy()
+        if untrailed.any() and len(video_processors) == 1:
+            fixations.loc[untrailed, "trail"] = next(iter(video_processors))
+            logging.info(f"{untrailed.sum()} fixations of subject {subject_name} have no trail, counting them as "
+                         f"its only trail {next(iter(video_processors))}")
+        elif untrailed.any():
+            logging.error(f"{untrailed.sum()} fixations of subject {subject_name} have no trail and can't be matched "
+                          f"to one of its trails {list(video_processors)}, they are skipped. Process the subject "
+                          f"again to write its metadata with trails.")
+        trails = sorted(trail for trail in fixations["trail"].unique() if isinstance(trail, str))
+        searches = []
+        for trail in trails:
+            video_processor = video_processors.get(trail)
+            if video_processor is None:
+                logging.warning(f"No recording of trail {trail} for subject {subject_name}, its fixations are skipped")
+                continue
+            frame_ts = load_frame_timestamps(video_processor.pl_timestamps)
+            in_trail = (fixations["trail"] == trail).to_numpy()
+            last_frame = len(frame_ts) - 1
+            fixations.loc[in_trail, "start_ts"] = frame_ts[np.minimum(fixations["start_frame"][in_trail], last_frame)]
+            fixations.loc[in_trail, "end_ts"] = frame_ts[np.minimum(fixations["end_frame"][in_trail], last_frame)]
+            searches.append(self._pair_searches(subject_name, trail, video_processor.load_unity_log()))
+        return fixations, pd.concat(searches, ignore_index=True) if searches else pd.DataFrame(columns=SEARCH_COLUMNS)
+
+    def _pair_searches(self, subject_name, trail, unity_log):
+        """
+        Pairs every prompt with the first found event of the same ball at or after it.
+        :return: A DataFrame of SEARCH_COLUMNS (found_ts and latency are NaN if the ball was never found).
+        """
+        prompt_ts, prompt_balls = unity_log.events("prompt")
+        found_ts, found_balls = unity_log.events("found")
+        prompts = pd.DataFrame({"ball_id": prompt_balls.astype(np.int64), "prompt_ts": prompt_ts + self.clock_offset})
+        founds = pd.DataFrame({"ball_id": found_balls.astype(np.int64), "found_ts": found_ts + self.clock_offset})
+        searches = pd.merge_asof(prompts.sort_values("prompt_ts"), founds.sort_values("found_ts"),
+                                 left_on="prompt_ts", right_on="found_ts", by="ball_id", direction="forward")
+        searches["latency"] = searches["found_ts"] - searches["prompt_ts"]
+        searches.insert(0, "trail", trail)
+        searches.insert(0, "subject", subject_name)
+        return searches[SEARCH_COLUMNS]
+
+    def fixations(self, subjects=None, trail=None):
+        """
+        :return: A DataFrame with one row per fixation: FIXATION_COLUMNS plus start_ts and end_ts (Pupil time).
+        """
+        return self._concat(self._fixations, subjects, trail)
+
+    def searches(self, subjects=None, trail=None):
+        """
+        :return: A DataFrame with one row per prompt: SEARCH_COLUMNS.
+        """
+        return self._concat(self._searches, subjects, trail)
+
+    @staticmethod
+    def _concat(tables, subjects, trail):
+        frames = [tables[subject_name] for subject_name in (subjects or sorted(tables)) if subject_name in tables]
+        if not frames:
+            return pd.DataFrame()
+        table = pd.concat(frames, ignore_index=True)
+        return table[table["trail"] == trail].reset_index(drop=True) if trail is not None else table
+
+    def target_history(self, window=None, tag_sources=None, min_confidence=0.0, subjects=None, trail=None):
+        """
+        The fixation history of every prompted ball before its prompt, next to its search latency. A fixation counts
+        for a ball if it is tagged Relevant with the ball as its target and ends before the prompt.
+        :param window: Seconds before the prompt to look back (None: the whole trail).
+        :param tag_sources: Only count tags from these sources, e.g. ["manual"] (None: every source).
+        :param min_confidence: Minimum tag_confidence of auto tags (manual tags always count).
+        :return: A DataFrame with one row per prompt: SEARCH_COLUMNS plus fixations_before, fixation_frames_before,
+                 first_fixation_ts, last_fixation_ts (end of the last fixation), seconds_since_fixation and
+                 fixated_before.
+        """
+        searches = self.searches(subjects, trail)
+        fixations = self.fixations(subjects, trail)
+        if searches.empty:
+            return searches
+        searches = searches.reset_index(drop=True)
+        searches["search"] = np.arange(len(searches))
+
+        if not fixations.empty:
+            on_target = (fixations["tag"] == RELEVANT) & fixations["target_id"].notna() & fixations["end_ts"].notna()
+            if tag_sources is not None:
+                on_target &= fixations["tag_source"].isin(tag_sources)
+            if min_confidence:
+                on_target &= (fixations["tag_source"] != "auto") | (fixations["tag_confidence"] >= min_confidence)
+            fixations = fixations.loc[on_target, ["subject", "trail", "target_id", "duration", "start_ts", "end_ts"]]
+            fixations = fixations.astype({"target_id": np.int64})
+        joined = searches[["search", "subject", "trail", "ball_id", "prompt_ts"]].merge(
+            fixations, left_on=["subject", "trail", "ball_id"], right_on=["subject", "trail", "target_id"])
+        before = joined["end_ts"] <= joined["prompt_ts"]
+        if window is not None:
+            before &= joined["end_ts"] >= joined["prompt_ts"] - window
+        history = joined[before].groupby("search").agg(fixations_before=("duration", "size"),
+                                                       fixation_frames_before=("duration", "sum"),
+                                                       first_fixation_ts=("start_ts", "min"),
+                                                       last_fixation_ts=("end_ts", "max"))
+
+        searches = searches.join(history, on="search").drop(columns="search")
+        searches["fixations_before"] = searches["fixations_before"].fillna(0).astype(np.int64)
+        searches["fixation_frames_before"] = searches["fixation_frames_before"].fillna(0).astype(np.int64)
+        searches["seconds_since_fixation"] = searches["prompt_ts"] - searches["last_fixation_ts"]
+        searches["fixated_before"] = searches["fixations_before"] > 0
+        return searches
+
+    def latency_summary(self, by=("fixated_before",), **history_options):
+        """
+        Search latency statistics of target_history grouped by its columns, e.g. by=("trail", "fixated_before").
+        :param history_options: Passed to target_history (window, tag_sources, ...).
+        :return: A DataFrame with count, mean, median and std of the latency per group (unfound balls are left out).
+        """
+        history = self.target_history(**history_options)
+        if history.empty:
+            return history
+        return history.dropna(subset=["latency"]).groupby(list(by))["latency"].agg(["count", "mean", "median", "std"])
+
+
+if __name__ == "__main__":
+    import argparse
+    from src.utils.metadata_manager import MetadataManager
+    from src.utils.metadata_store import MetadataStore
+
+    parser = argparse.ArgumentParser(description="Search latency of the prompted balls vs. their earlier fixations.")
+    parser.add_argument("--data", required=True, help="Data folder of all subjects")
+    parser.add_argument("--metadata", required=True, help="Metadata directory")
+    parser.add_argument("--window", type=float, help="Seconds before the prompt to look back (default: whole trail)")
+    parser.add_argument("--tag-sources", help="Comma separated tag sources to count (default: all)")
+    parser.add_argument("--min-confidence", type=float, default=0.0)
+    parser.add_argument("--out", help="Write the per prompt table to this csv")
+    args = parser.parse_args()
+
+    store = MetadataStore(MetadataManager(base_directory=args.metadata))
+    analytics = CohortAnalytics(store, args.data)
+    options = {"window": args.window, "min_confidence": args.min_confidence,
+               "tag_sources": args.tag_sources.split(",") if args.tag_sources else None}
+    print(analytics.latency_summary(by=("trail", "fixated_before"), **options))
+    if args.out:
+        analytics.target_history(**options).to_csv(args.out, index=False)
+        print(f"Wrote {os.path.abspath(args.out)}")
+    store.close()
@@ -0,0 +1,193 @@
+import os
+import json
+import logging
+import av
+
+# Our own libraries
+from CoreClasses import ProcessingContainer
+from src.utils.encoders import ENCODER_PROFILES, DEFAULT_ENCODER
+from src.utils.preprocessing import VideoPreprocessor, TARGET_LENGTH
+from src.utils.seek_index import SeekIndex
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Throughput measured by benchmarks/benchmark_encoders.py (same format as its --calibration-out JSON).
+# Frames per second and bytes per frame scale with the frame's pixel count relative to "resolution".
+DEFAULT_CALIBRATION = {
+    "resolution": [640, 480],
+    "profiles": {
+        "fast_mpeg4": {"encode_fps": 410.0, "decode_fps": 885.0, "bytes_per_frame": 9900.0},
+        "h264": {"encode_fps": 155.0, "decode_fps": 585.0, "bytes_per_frame": 3800.0},
+        "mjpeg": {"encode_fps": 415.0, "decode_fps": 765.0, "bytes_per_frame": 17400.0},
+        "ffv1": {"encode_fps": 72.0, "decode_fps": 70.0, "bytes_per_frame": 173700.0},
+    },
+}
+SOURCE_PROFILE = "fast_mpeg4"  # Pupil Labs exports world.mp4 as MPEG-4, its decode speed is taken from this profile
+
+
+def load_calibration(path=None):
+    """
+    Loads throughput numbers saved by benchmark_encoders.py --calibration-out, missing profiles fall back to the
+    defaults.
+    """
+    if path is None:
+        return DEFAULT_CALIBRATION
+    with open(path) as file:
+        calibration = json.load(file)
+    profiles = {**DEFAULT_CALIBRATION["profiles"], **calibration.get("profiles", {})}
+    return {"resolution": calibration.get("resolution", DEFAULT_CALIBRATION["resolution"]), "profiles": profiles}
+
+
+def probe_video(video_path):
+    """
+    Reads a video's properties from its container header and packets, nothing is decoded or written (a seek index
+    sidecar is used if it is up to date, otherwise the index is built in memory without saving it).
+    :return: A dict with fps, width, height, frame count, mean keyframe interval and the SeekIndex.
+    """
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        fps = float(stream.average_rate or stream.guessed_rate or 30)
+        width, height = stream.codec_context.width, stream.codec_context.height
+    seek_index = SeekIndex.load(video_path)
+    if seek_index is None:
+        seek_index = SeekIndex.build(video_path)
+    keyframes = len(set(seek_index.keyframe_index.tolist())) if len(seek_index) else 0
+    return {
+        "fps": fps,
+        "width": width,
+        "height": height,
+        "frames": len(seek_index),
+        "keyframe_interval": len(seek_index) / keyframes if keyframes else 0.0,
+        "seek_index": seek_index,
+    }
+
+
+def count_decoded_frames(groups, seek_index):
+    """
+    Counts the frames SnippetTrimmer decodes for the groups: the frames skipped to reach each group (from the
+    current position or from the keyframe before the group, like seek_capture) plus the group's frames.
+    :param groups: (start frame, end frame) of each group, in time order.
+    :return: (frames decoded to seek, frames of the groups)
+    """
+    position = 0
+    seek_frames = group_frames = 0
+    for start_frame, end_frame in groups:
+        keyframe = seek_index.keyframe_before(start_frame)
+        if not keyframe <= position <= start_frame:
+            position = keyframe
+        seek_frames += start_frame - position
+        group_frames += end_frame - start_frame + 1
+        position = end_frame + 1
+    return seek_frames, group_frames
+
+
+def _scaled(calibration, profile, width, height):
+    """
+    :return: (encode fps, decode fps, bytes per frame) of a profile at the given frame size.
+    """
+    numbers = calibration["profiles"][profile]
+    ratio = (width * height) / (calibration["resolution"][0] * calibration["resolution"][1])
+    return numbers["encode_fps"] / ratio, numbers["decode_fps"] / ratio, numbers["bytes_per_frame"] * ratio
+
+
+def plan_trail(video_processor, threshold=30, target_length=TARGET_LENGTH, write_snippets=True, calibration=None):
+    """
+    Estimates the cost of processing one trail of a subject (VideoPreprocessor.process_streaming) without decoding.
+    :param video_processor: A VideoPreprocessor of the subject and trail.
+    :param write_snippets: False for virtual snippets (nothing is encoded or written).
+    :param calibration: Throughput numbers (see load_calibration), default DEFAULT_CALIBRATION.
+    :return: A dict with the video's properties, the groups, the frames to decode and to encode (with padding),
+             and per encoder profile the output bytes and the estimated wall time in seconds.
+    """
+    calibration = calibration or DEFAULT_CALIBRATION
+    video = probe_video(video_processor.vid_path)
+    groups = [(start_frame, end_frame) for start_frame, end_frame, _ in
+              video_processor._iter_merged_groups(video_processor._iter_fixations(10000), threshold, target_length)]
+    seek_frames, group_frames = count_decoded_frames(groups, video["seek_index"])
+    encode_frames = len(groups) * target_length if write_snippets else 0
+    _, source_decode_fps, _ = _scaled(calibration, SOURCE_PROFILE, video["width"], video["height"])
+    decode_seconds = (seek_frames + group_frames) / source_decode_fps
+
+    profiles = {}
+    for profile in ENCODER_PROFILES:
+        encode_fps, _, bytes_per_frame = _scaled(calibration, profile, video["width"], video["height"])
+        profiles[profile] = {
+            "output_bytes": int(encode_frames * bytes_per_frame),
+            "wall_time_s": decode_seconds + encode_frames / encode_fps,
+        }
+    return {
+        "subject": video_processor.subject_name,
+        "trail": video_processor.trail,
+        "video_path": video_processor.vid_path,
+        "fps": video["fps"],
+        "resolution": [video["width"], video["height"]],
+        "video_frames": video["frames"],
+        "keyframe_interval": video["keyframe_interval"],
+        "groups": len(groups),
+        "frames_to_decode": seek_frames + group_frames,
+        "frames_decoded_to_seek": seek_frames,
+        "frames_to_encode": encode_frames,
+        "padding_frames": encode_frames - group_frames if write_snippets else 0,
+        "profiles": profiles,
+    }
+
+
+def plan_cohort(data_path, subjects, trails, out_path, threshold=30, write_snippets=True, calibration=None):
+    """
+    Plans every (subject, trail) of a cohort. It's a dry run: nothing is written to disk, not even the output
+    folders.
+    :param data_path: Data folder of all subjects.
+    :param subjects: Subject names.
+    :param trails: Trails to plan for every subject (trails without a recording are skipped with a warning).
+    :param out_path: The output folder the processing would use.
+    :return: (list of plan_trail dicts, totals dict with the summed frames and per profile bytes and wall time)
+    """
+    plans = []
+    for subject_name in subjects:
+        container = ProcessingContainer(data_path=data_path, subject_name=subject_name)
+        container.out_path = os.path.join(out_path, 'OUTPUTS')  # where _create_out_path would put it, not created
+        for trail in trails:
+            try:
+                video_processor = VideoPreprocessor(container, trail=trail, metadata_manager=None)
+            except (KeyError, FileNotFoundError) as e:
+                logging.warning(f"Skipping {subject_name} {trail}: {e}")
+                continue
+            plans.append(plan_trail(video_processor, threshold, write_snippets=write_snippets,
+                                    calibration=calibration))
+    totals = {key: sum(plan[key] for plan in plans)
+              for key in ("groups", "video_frames", "frames_to_decode", "frames_to_encode", "padding_frames")}
+    totals["profiles"] = {profile: {key: sum(plan["profiles"][profile][key] for plan in plans)
+                                    for key in ("output_bytes", "wall_time_s")}
+                          for profile in ENCODER_PROFILES}
+    return plans, totals
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Estimate frames, disk and time of processing subjects, "
+                                                 "without decoding any video.")
+    parser.add_argument("subjects", nargs="+", help="Subject names (e.g. AN755)")
+    parser.add_argument("--data", required=True, help="Data folder of all subjects")
+    parser.add_argument("--trails", required=True, help="Comma separated trails (e.g. T1,T2)")
+    parser.add_argument("--out", required=True, help="Output folder")
+    parser.add_argument("--calibration", help="JSON from benchmark_encoders.py --calibration-out")
+    parser.add_argument("--encoder", default=DEFAULT_ENCODER, help="Profile of the per trail lines")
+    parser.add_argument("--virtual", action="store_true", help="Plan virtual snippets (nothing is encoded)")
+    args = parser.parse_args()
+
+    plans, totals = plan_cohort(args.data, args.subjects, args.trails.split(","), args.out,
+                                write_snippets=not args.virtual, calibration=load_calibration(args.calibration))
+    for plan in plans:
+        profile = plan["profiles"][args.encoder]
+        print(f"{plan['subject']} {plan['trail']}: {plan['groups']} groups, decode {plan['frames_to_decode']} "
+              f"({plan['frames_decoded_to_seek']} to seek), encode {plan['frames_to_encode']} frames, "
+              f"{profile['output_bytes'] / 1024 ** 2:.1f} MB, ~{profile['wall_time_s']:.0f}s")
+    print(f"\nTotal: {totals['groups']} groups, decode {totals['frames_to_decode']} frames, "
+          f"encode {totals['frames_to_encode']} frames")
+    for profile, numbers in totals["profiles"].items():
+        print(f"  {profile:<11} {numbers['output_bytes'] / 1024 ** 3:8.2f} GB  ~{numbers['wall_time_s'] / 3600:.2f} h")
@@ -0,0 +1,117 @@
+import logging
+import av
+import cv2
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+DEFAULT_ENCODER = "fast_mpeg4"
+
+
+class CvVideoWriter:
+    def __init__(self, path, fourcc, fps, width, height):
+        """
+        Writes BGR frames with cv2.VideoWriter.
+        """
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+        if not self.writer.isOpened():
+            raise RuntimeError(f"cv2 cannot write {fourcc} video to {path}")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+class PyAVVideoWriter:
+    def __init__(self, path, codec, fps, width, height, pix_fmt, options=None):
+        """
+        Writes BGR frames with PyAV (FFmpeg), for codecs and settings cv2.VideoWriter doesn't expose.
+        """
+        self.container = av.open(path, mode="w")
+        try:
+            self.stream = self.container.add_stream(codec, rate=fps)
+            self.stream.width = width
+            self.stream.height = height
+            self.stream.pix_fmt = pix_fmt
+            self.stream.options = {key: str(value) for key, value in (options or {}).items()}
+        except Exception:
+            self.container.close()
+            raise
+
+    def write(self, frame):
+        video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+        for packet in self.stream.encode(video_frame):
+            self.container.mux(packet)
+
+    def release(self):
+        try:
+            for packet in self.stream.encode():  # flush the frames the encoder still holds
+                self.container.mux(packet)
+        finally:
+            self.container.close()
+
+
+class EncoderProfile:
+    def __init__(self, name, extension, backend, codec, pix_fmt=None, options=None, description=""):
+        """
+        An output encoding for the video snippets.
+        :param name: The profile's name (key in ENCODER_PROFILES).
+        :param extension: File extension of the snippets, it also selects the container (e.g. ".mkv").
+        :param backend: "cv2" (codec is a fourcc) or "pyav" (codec is an FFmpeg encoder name).
+        :param pix_fmt: Pixel format of the encoded stream (PyAV only).
+        :param options: Encoder options, e.g. {"preset": "veryfast", "crf": 23} (PyAV only).
+        """
+        self.name = name
+        self.extension = extension
+        self.backend = backend
+        self.codec = codec
+        self.pix_fmt = pix_fmt
+        self.options = dict(options or {})
+        self.description = description
+
+    def open_writer(self, path, fps, width, height):
+        """
+        :return: A writer with write(bgr_frame) and release().
+        """
+        if self.backend == "cv2":
+            return CvVideoWriter(path, self.codec, fps, width, height)
+        return PyAVVideoWriter(path, self.codec, fps, width, height, self.pix_fmt, self.options)
+
+    def with_options(self, **options):
+        """
+        :return: A copy of the profile with some encoder options changed, e.g. with_options(crf=18).
+        """
+        return EncoderProfile(self.name, self.extension, self.backend, self.codec, self.pix_fmt,
+                              {**self.options, **options}, self.description)
+
+
+ENCODER_PROFILES = {
+    "fast_mpeg4": EncoderProfile("fast_mpeg4", ".mp4", "cv2", "mp4v",
+                                 description="MPEG-4 part 2, fastest to encode, lossy"),
+    "h264": EncoderProfile("h264", ".mp4", "pyav", "libx264", "yuv420p", {"preset": "veryfast", "crf": 23},
+                           description="H.264, much smaller files, slower to encode"),
+    "mjpeg": EncoderProfile("mjpeg", ".avi", "cv2", "MJPG",
+                            description="Motion JPEG, every frame is a keyframe (frame-accurate random access)"),
+    "ffv1": EncoderProfile("ffv1", ".mkv", "pyav", "ffv1", "bgr0", {"level": 3, "g": 1},
+                           description="FFV1 lossless, training-grade frames, largest files"),
+}
+
+
+def get_encoder_profile(encoder=None, **options):
+    """
+    Returns an encoder profile by name (None is the default profile). An EncoderProfile is returned as is.
+    :param options: Encoder options that override the profile's options (e.g. preset="slow", crf=18 for h264).
+    """
+    if isinstance(encoder, EncoderProfile):
+        profile = encoder
+    else:
+        encoder = encoder or DEFAULT_ENCODER
+        if encoder not in ENCODER_PROFILES:
+            raise KeyError(f"Unknown encoder profile: {encoder}. Available: {sorted(ENCODER_PROFILES)}")
+        profile = ENCODER_PROFILES[encoder]
+    return profile.with_options(**options) if options else profile
@@ -0,0 +1,131 @@
+import os
+import logging
+import numpy as np
+import cv2
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Registry of per-frame processors, {name : FrameProcessor subclass}
+FRAME_PROCESSORS = {}
+
+
+def register_frame_processor(name):
+    """
+    Class decorator that registers a FrameProcessor subclass under a name, so it can be selected by name
+    (e.g. trim_vid_around_fixations(..., frame_processors=["motion_energy"])).
+    """
+    def register(cls):
+        cls.name = name
+        FRAME_PROCESSORS[name] = cls
+        return cls
+    return register
+
+
+class FrameProcessor:
+    name = None
+
+    def __init__(self):
+        """
+        Base class of per-frame processors. They run inside the decode loop of the trimming, get every decoded
+        frame of the recording once, and keep one compact value per frame.
+        """
+        self.values = []
+
+    def process(self, frame, frame_index):
+        """
+        Called with every decoded BGR frame. Subclasses return the frame's value (a number or a small array).
+        """
+        raise NotImplementedError
+
+    def __call__(self, frame, frame_index):
+        self.values.append(self.process(frame, frame_index))
+
+    def result(self):
+        """
+        :return: The values of all processed frames as one array (first axis is the frame).
+        """
+        return np.asarray(self.values)
+
+
+@register_frame_processor("color_histogram")
+class ColorHistogram(FrameProcessor):
+    def __init__(self, bins=16):
+        """
+        Normalized per-channel (B, G, R) histogram of each frame, shape (3, bins) per frame.
+        """
+        super().__init__()
+        self.bins = bins
+
+    def process(self, frame, frame_index):
+        hist = np.stack([cv2.calcHist([frame], [channel], None, [self.bins], [0, 256]).reshape(-1) for channel in range(3)])
+        return (hist / hist[0].sum()).astype(np.float32)
+
+
+@register_frame_processor("motion_energy")
+class MotionEnergy(FrameProcessor):
+    def __init__(self, scale=0.25):
+        """
+        Mean absolute difference to the previous frame (grayscale, downscaled). NaN if the previous frame of the
+        recording wasn't decoded (e.g. the first frame of a group after a gap).
+        """
+        super().__init__()
+        self.scale = scale
+        self._previous = None
+        self._previous_index = None
+
+    def process(self, frame, frame_index):
+        gray = cv2.cvtColor(cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA),
+                            cv2.COLOR_BGR2GRAY).astype(np.int16)
+        energy = np.nan
+        if self._previous is not None and self._previous_index == frame_index - 1:
+            energy = float(np.abs(gray - self._previous).mean())
+        self._previous, self._previous_index = gray, frame_index
+        return np.float32(energy)
+
+
+@register_frame_processor("black_frame")
+class BlackFrameDetector(FrameProcessor):
+    def __init__(self, threshold=10):
+        """
+        Flags frames whose mean brightness is below the threshold (black frames, e.g. tracking loss in the headset).
+        """
+        super().__init__()
+        self.threshold = threshold
+
+    def process(self, frame, frame_index):
+        return frame.mean() < self.threshold
+
+
+def create_frame_processors(frame_processors):
+    """
+    Builds processor instances from a list of registered names and/or FrameProcessor instances.
+    """
+    processors = []
+    for processor in frame_processors or []:
+        if isinstance(processor, str):
+            if processor not in FRAME_PROCESSORS:
+                raise KeyError(f"Unknown frame processor: {processor}. Available: {sorted(FRAME_PROCESSORS)}")
+            processor = FRAME_PROCESSORS[processor]()
+        processors.append(processor)
+    return processors
+
+
+def save_frame_features(processors, frame_indices, out_dir):
+    """
+    Saves each processor's per-frame values as <out_dir>/features/<name>.npy, plus frame_indices.npy that holds
+    the recording frame index of every row.
+    :return: The features directory, or None if there was nothing to save.
+    """
+    if not processors:
+        return None
+    features_dir = os.path.join(out_dir, 'features')
+    os.makedirs(features_dir, exist_ok=True)
+    np.save(os.path.join(features_dir, 'frame_indices.npy'), np.asarray(frame_indices, dtype=np.int64))
+    for processor in processors:
+        np.save(os.path.join(features_dir, f"{processor.name}.npy"), processor.result())
+    logging.info(f"Saved per-frame features ({', '.join(p.name for p in processors)}) in {features_dir}")
+    return features_dir
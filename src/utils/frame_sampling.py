@@ -0,0 +1,166 @@
+import math
+import logging
+import numpy as np
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+DEFAULT_SAMPLER = "all"
+
+
+class FrameSampler:
+    name = None
+
+    def select(self, start_frame, end_frame, fixations=None):
+        """
+        Chooses the frames of a fixation group that go into its snippet.
+        :param fixations: The group's fixations as (start frame, end frame) pairs, if known.
+        :return: A sorted int64 array of recording frame indices within start_frame..end_frame.
+        """
+        raise NotImplementedError
+
+    def snippet_length(self, max_group_length):
+        """
+        :param max_group_length: The longest a group can be (TARGET_LENGTH).
+        :return: The length (in frames, padding included) of every snippet written with this sampler.
+        """
+        raise NotImplementedError
+
+    @property
+    def is_full(self):
+        """
+        True if every frame of the group is kept (the snippets are the same as without a sampler).
+        """
+        return False
+
+    def params(self):
+        return {}
+
+    def group_metadata(self, frame_indices, snippet_length):
+        """
+        :return: The fields stored in a group's metadata when it is sampled: the recording index of every snippet
+                 frame, the snippet length and the sampler with its parameters.
+        """
+        return {"frame_indices": [int(frame_index) for frame_index in frame_indices],
+                "snippet_length": int(snippet_length),
+                "sampling": {"sampler": self.name, **self.params()}}
+
+
+class AllFrames(FrameSampler):
+    name = "all"
+
+    def select(self, start_frame, end_frame, fixations=None):
+        return np.arange(start_frame, end_frame + 1, dtype=np.int64)
+
+    def snippet_length(self, max_group_length):
+        return max_group_length
+
+    @property
+    def is_full(self):
+        return True
+
+
+class StrideSampler(FrameSampler):
+    name = "stride"
+
+    def __init__(self, stride=3):
+        """
+        Keeps every stride-th frame of a group, starting at its first frame.
+        """
+        if stride < 1:
+            raise ValueError(f"The stride must be at least 1, got {stride}")
+        self.stride = int(stride)
+
+    def select(self, start_frame, end_frame, fixations=None):
+        return np.arange(start_frame, end_frame + 1, self.stride, dtype=np.int64)
+
+    def snippet_length(self, max_group_length):
+        return math.ceil(max_group_length / self.stride)
+
+    @property
+    def is_full(self):
+        return self.stride == 1
+
+    def params(self):
+        return {"stride": self.stride}
+
+
+class UniformSampler(FrameSampler):
+    name = "uniform"
+
+    def __init__(self, count=16):
+        """
+        Keeps count frames spread evenly over the group, its first and last frame included. Groups shorter than
+        count frames keep all their frames (and are padded).
+        """
+        if count < 1:
+            raise ValueError(f"The frame count must be at least 1, got {count}")
+        self.count = int(count)
+
+    def select(self, start_frame, end_frame, fixations=None):
+        num_frames = min(self.count, end_frame - start_frame + 1)
+        # the spacing is at least one frame, so the rounded indices are all different
+        return np.round(np.linspace(start_frame, end_frame, num_frames)).astype(np.int64)
+
+    def snippet_length(self, max_group_length):
+        return self.count
+
+    def params(self):
+        return {"count": self.count}
+
+
+class FixationCentredSampler(FrameSampler):
+    name = "fixation_centred"
+
+    def __init__(self, count=16, stride=1):
+        """
+        Keeps count frames, stride apart, centred on the middle of the group's longest fixation (the middle of the
+        group if its fixations aren't given). The window is shifted to stay inside the group, and it is cut at the
+        group's end if the group is shorter than the window.
+        """
+        if count < 1 or stride < 1:
+            raise ValueError(f"The frame count and the stride must be at least 1, got {count} and {stride}")
+        self.count = int(count)
+        self.stride = int(stride)
+
+    def select(self, start_frame, end_frame, fixations=None):
+        if fixations:
+            fix_start, fix_end = max(fixations, key=lambda fixation: fixation[1] - fixation[0])
+            centre = (fix_start + fix_end) / 2
+        else:
+            centre = (start_frame + end_frame) / 2
+        span = (self.count - 1) * self.stride
+        first = int(round(centre - span / 2))
+        first = max(min(first, end_frame - span), start_frame)
+        return np.arange(first, min(first + span, end_frame) + 1, self.stride, dtype=np.int64)
+
+    def snippet_length(self, max_group_length):
+        return self.count
+
+    def params(self):
+        return {"count": self.count, "stride": self.stride}
+
+
+FRAME_SAMPLERS = {
+    "all": AllFrames,
+    "stride": StrideSampler,
+    "uniform": UniformSampler,
+    "fixation_centred": FixationCentredSampler,
+}
+
+
+def get_frame_sampler(sampler=None, **options):
+    """
+    Returns a frame sampler by name (None is every frame), e.g. get_frame_sampler("stride", stride=3).
+    A FrameSampler instance is returned as is.
+    :param options: The sampler's parameters (stride, count).
+    """
+    if isinstance(sampler, FrameSampler):
+        return sampler
+    sampler = sampler or DEFAULT_SAMPLER
+    if sampler not in FRAME_SAMPLERS:
+        raise KeyError(f"Unknown frame sampler: {sampler}. Available: {sorted(FRAME_SAMPLERS)}")
+    return FRAME_SAMPLERS[sampler](**options)
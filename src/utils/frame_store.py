@@ -0,0 +1,234 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import cv2
+
+# Our own libraries
+from src.utils.encoders import get_encoder_profile
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+MANIFEST_EXTENSION = ".frames.json"  # snippets written into a frame store are manifests with this extension
+MANIFEST_VERSION = 1
+# Every frame is stored on its own (intra only), so a group can start and end at any frame of the recording
+FRAME_CODECS = {
+    "jpeg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 90]),
+    "png": (".png", [cv2.IMWRITE_PNG_COMPRESSION, 3]),  # lossless
+}
+DEFAULT_FRAME_CODEC = "jpeg"
+_RECORDING_ID_SAMPLE = 1 << 16  # bytes hashed from the start and from the end of a recording
+
+
+def recording_id(video_path):
+    """
+    A stable id of a recording: a hash of its size and of its first and last 64KB. Unlike the path it stays
+    the same when the data folder is mounted somewhere else (e.g. on another node), and it changes if the
+    recording is re-exported.
+    """
+    digest = hashlib.sha1()
+    size = os.path.getsize(video_path)
+    digest.update(str(size).encode("utf-8"))
+    with open(video_path, "rb") as file:
+        digest.update(file.read(_RECORDING_ID_SAMPLE))
+        if size > _RECORDING_ID_SAMPLE:
+            file.seek(max(size - _RECORDING_ID_SAMPLE, _RECORDING_ID_SAMPLE))
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class FrameStore:
+    def __init__(self, root, frame_codec=DEFAULT_FRAME_CODEC):
+        """
+        A content-addressed store of encoded frames. Every frame is saved once, under a key that is a hash of
+        (source recording, frame index, frame codec), so frames shared by neighbouring groups, the black padding
+        frame and repeated runs with different grouping parameters don't add anything to the storage.
+        Snippets written into the store are manifests (see write_manifest) that reference its frames.
+        Several processes can write into the same store: objects are written to a temporary file and renamed.
+        :param root: The store's folder (will be created if needed).
+        :param frame_codec: How each frame is encoded, a key of FRAME_CODECS.
+        """
+        if frame_codec not in FRAME_CODECS:
+            raise ValueError(f"Unknown frame codec {frame_codec}, choose one of {list(FRAME_CODECS)}")
+        self.root = os.path.abspath(root)
+        self.frame_codec = frame_codec
+        self.extension, self.imwrite_params = FRAME_CODECS[frame_codec]
+        self.objects_path = os.path.join(self.root, "objects")
+        os.makedirs(self.objects_path, exist_ok=True)
+        self._recording_ids = {}  # video path : recording id
+
+    def recording_id(self, video_path):
+        if video_path not in self._recording_ids:
+            self._recording_ids[video_path] = recording_id(video_path)
+        return self._recording_ids[video_path]
+
+    def frame_key(self, source_id, frame_index):
+        """
+        :param source_id: The recording id (see recording_id).
+        :return: The key of a frame of the recording.
+        """
+        return hashlib.sha256(f"{source_id}:{int(frame_index)}:{self.frame_codec}".encode("utf-8")).hexdigest()
+
+    def black_key(self, width, height):
+        """
+        :return: The key of the black padding frame of the given size (one object for the whole cohort).
+        """
+        return hashlib.sha256(f"black:{width}x{height}:{self.frame_codec}".encode("utf-8")).hexdigest()
+
+    def _object_path(self, key):
+        return os.path.join(self.objects_path, key[:2], key + self.extension)
+
+    def has(self, key):
+        return os.path.isfile(self._object_path(key))
+
+    def put(self, key, frame):
+        """
+        Saves a BGR frame under key, unless the store already has it.
+        :return: True if the frame was written, False if it was already stored.
+        """
+        object_path = self._object_path(key)
+        if os.path.isfile(object_path):
+            return False
+        ok, encoded = cv2.imencode(self.extension, frame, self.imwrite_params)
+        if not ok:
+            raise RuntimeError(f"Could not encode frame {key} as {self.frame_codec}")
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        temp_path = f"{object_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(encoded.tobytes())
+        os.replace(temp_path, object_path)  # same key means same frame, so a concurrent writer is harmless
+        return True
+
+    def get(self, key):
+        """
+        :return: The stored BGR frame.
+        """
+        object_path = self._object_path(key)
+        frame = cv2.imdecode(np.fromfile(object_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise FileNotFoundError(f"Frame {key} is missing or corrupted in {self.root}")
+        return frame
+
+    def stats(self):
+        """
+        :return: A dict with the number of stored objects and their total size in bytes.
+        """
+        objects, total_bytes = 0, 0
+        for folder, _, files in os.walk(self.objects_path):
+            for file_name in files:
+                if file_name.endswith(self.extension):
+                    objects += 1
+                    total_bytes += os.path.getsize(os.path.join(folder, file_name))
+        return {"objects": objects, "bytes": total_bytes}
+
+    def write_manifest(self, manifest_path, source_video, frame_indices, padding, width, height, fps, encoder=None):
+        """
+        Writes a snippet manifest: the keys of its real frames in order and the number of black padding frames.
+        :param manifest_path: Path of the manifest (should end with MANIFEST_EXTENSION).
+        :param source_video: The recording the frames were taken from.
+        :param frame_indices: Recording frame indices of the snippet's real frames (all stored already).
+        :param padding: Number of black frames after the real frames.
+        :param encoder: Encoder profile name used when the manifest is expanded into a video.
+        """
+        source_id = self.recording_id(source_video)
+        black_key = self.black_key(width, height)
+        if padding:
+            self.put(black_key, np.zeros((height, width, 3), dtype=np.uint8))
+        manifest = {
+            "version": MANIFEST_VERSION,
+            # relative, so the output folder and the store can be moved together
+            "store": os.path.relpath(self.root, os.path.dirname(os.path.abspath(manifest_path))),
+            "frame_codec": self.frame_codec,
+            "encoder": encoder,
+            "source_video": source_video,
+            "recording_id": source_id,
+            "width": width,
+            "height": height,
+            "fps": fps,
+            "frame_indices": [int(frame_index) for frame_index in frame_indices],
+            "frames": [self.frame_key(source_id, frame_index) for frame_index in frame_indices],
+            "padding": int(padding),
+            "padding_key": black_key,
+        }
+        temp_path = manifest_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(manifest, file)
+        os.replace(temp_path, manifest_path)
+
+
+def is_manifest(snippet_path):
+    return snippet_path.endswith(MANIFEST_EXTENSION)
+
+
+def load_manifest(manifest_path):
+    """
+    Loads a snippet manifest together with the FrameStore its frames are in.
+    :return: (manifest dict, FrameStore)
+    """
+    with open(manifest_path, "r") as file:
+        manifest = json.load(file)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version {manifest.get('version')} in {manifest_path}")
+    store_root = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), manifest["store"])
+    return manifest, FrameStore(store_root, manifest["frame_codec"])
+
+
+def iter_manifest_frames(manifest_path):
+    """
+    Yields the frames of a manifest, the real frames and then the padding.
+    :return: A generator of (recording frame index or None for padding, BGR frame).
+    """
+    manifest, store = load_manifest(manifest_path)
+    for frame_index, key in zip(manifest["frame_indices"], manifest["frames"]):
+        yield frame_index, store.get(key)
+    if manifest["padding"]:
+        black_frame = store.get(manifest["padding_key"])
+        for _ in range(manifest["padding"]):
+            yield None, black_frame
+
+
+def read_manifest(manifest_path):
+    """
+    Expands a manifest into an array.
+    :return: (frames, mask), a (frames, H, W, 3) uint8 array and a bool array that is False for padding.
+    """
+    frames, mask = [], []
+    for frame_index, frame in iter_manifest_frames(manifest_path):
+        frames.append(frame)
+        mask.append(frame_index is not None)
+    return np.stack(frames), np.asarray(mask, dtype=bool)
+
+
+def expand_manifest(manifest_path, out_path=None, encoder=None):
+    """
+    Expands a manifest back into a playable video.
+    :param out_path: The video path (default: the manifest path with the encoder profile's extension).
+    :param encoder: Encoder profile name (default: the one recorded in the manifest).
+    :return: The path of the written video.
+    """
+    manifest, _ = load_manifest(manifest_path)
+    profile = get_encoder_profile(encoder or manifest.get("encoder"))
+    if out_path is None:
+        out_path = manifest_path[:-len(MANIFEST_EXTENSION)] + profile.extension
+    writer = profile.open_writer(out_path, manifest["fps"], manifest["width"], manifest["height"])
+    try:
+        for _, frame in iter_manifest_frames(manifest_path):
+            writer.write(frame)
+    finally:
+        writer.release()
+    return out_path
+
+
+def open_frame_store(frame_store):
+    """
+    :param frame_store: None, a FrameStore, or the root folder of one.
+    :return: None or a FrameStore.
+    """
+    if frame_store is None or isinstance(frame_store, FrameStore):
+        return frame_store
+    return FrameStore(frame_store)
@@ -1,6 +1,7 @@
 # General imports
 import numpy as np
 import os
+import time
 import msgpack
 import pandas as pd
 
@@ -188,6 +189,193 @@ def initialize_plugins(g_pool, plugin_initializers):
     from shared_modules.plugin import Plugin_List
 
     g_pool.plugins = Plugin_List(g_pool, plugin_initializers=plugin_initializers)
+
+
+# Plugins that read their recording when they are created, they are created again when the session moves to
+# another recording (the others only read g_pool while they run)
+RECORDING_BOUND_PLUGINS = ("Offline_Fixation_Detector", "Raw_Data_Exporter")
+
+
+def available_plugins(user_dir):
+    """
+    The plugins an export can use (the exporter's visualizers and fixation detector, the raw data exporter and
+    the runtime plugins of user_dir), by class name and by lower case class name (e.g. "vis_circle").
+    """
+    from plugin import import_runtime_plugins
+    from vis_circle import Vis_Circle
+    from vis_cross import Vis_Cross
+    from vis_polyline import Vis_Polyline
+    from vis_light_points import Vis_Light_Points
+    from vis_watermark import Vis_Watermark
+    from vis_scan_path import Vis_Scan_Path
+    from fixation_detector import Offline_Fixation_Detector
+    from raw_data_exporter import Raw_Data_Exporter
+
+    plugins = [Vis_Circle, Vis_Cross, Vis_Polyline, Vis_Light_Points, Vis_Watermark, Vis_Scan_Path,
+               Offline_Fixation_Detector, Raw_Data_Exporter]
+    plugins += import_runtime_plugins(os.path.join(user_dir, "plugins"))
+    return {**{plugin.__name__: plugin for plugin in plugins},
+            **{plugin.__name__.lower(): plugin for plugin in plugins}}
+
+
+class PupilSession:
+    def __init__(self, plugin_dir, plugin_initializers, min_data_confidence=0.5, max_open_recordings=2):
+        """
+        Keeps one g_pool warm across many exports: it is built once (initialize_basic_gpool, add_capture_to_gpool,
+        initialize_plugins) and every export only re-targets it, i.e. swaps rec_dir, capture and timestamps and
+        seeks the capture to the export's first frame, then runs the export loop (the one of Pupil's
+        _export_world_video) against it. The plugin list is created once, moving to another recording re-creates
+        only the RECORDING_BOUND_PLUGINS. The captures, timestamps and eye data of the last max_open_recordings
+        recordings stay loaded, each export only slices the eye data of its frame range.
+        Pupil isn't installed in the environment this was written in: it follows Pupil's API (File_Source,
+        Plugin_List, PupilDataBisector, MPEG_Writer) but was never run against a real recording.
+        :param plugin_dir: Additional plugins directory (g_pool.user_dir).
+        :param plugin_initializers: Plugin_List initializers, e.g. [{"name": "vis_circle", "args": {...}}].
+        :param min_data_confidence: g_pool.min_data_confidence.
+        :param max_open_recordings: Number of recordings whose capture and data are kept loaded.
+        """
+        self.plugin_dir = plugin_dir
+        self.plugin_initializers = plugin_initializers
+        self.min_data_confidence = min_data_confidence
+        self.max_open_recordings = max_open_recordings
+        self.g_pool = None
+        self.frame_range = None  # (start frame, end frame) of the next export, both inclusive
+        self._recordings = {}  # rec_dir : {"capture", "timestamps", "eye_data"}, in least recently used order
+
+    def _load_recording(self, rec_dir):
+        """
+        Returns the loaded capture, timestamps and eye data of a recording (opening it if needed).
+        """
+        if rec_dir in self._recordings:
+            self._recordings[rec_dir] = self._recordings.pop(rec_dir)  # most recently used
+            return self._recordings[rec_dir]
+        self.g_pool.rec_dir = rec_dir
+        add_capture_to_gpool(self.g_pool)
+        self._recordings[rec_dir] = {"capture": self.g_pool.capture, "timestamps": self.g_pool.timestamps,
+                                     "eye_data": load_precomputed_eye_data(rec_dir)}
+        while len(self._recordings) > self.max_open_recordings:
+            self._recordings.pop(next(iter(self._recordings)))["capture"].cleanup()
+        return self._recordings[rec_dir]
+
+    def retarget(self, rec_dir, start_frame=None, end_frame=None):
+        """
+        Points the session's g_pool at a recording and a frame range (None: the whole recording). The first call
+        builds the g_pool and its plugin list, later calls swap rec_dir, capture and timestamps (if the recording
+        changed) and seek the capture.
+        :return: The session's g_pool.
+        """
+        if self.g_pool is None:
+            self.g_pool = initialize_basic_gpool(rec_dir, self.plugin_dir)
+            self.g_pool.app = "exporter"
+            self.g_pool.process = "exporter"
+            self.g_pool.min_data_confidence = self.min_data_confidence
+            self.g_pool.plugin_by_name = available_plugins(self.plugin_dir)
+            self.g_pool.delayed_notifications = {}
+            self.g_pool.notifications = []
+        recording_changed = self.g_pool.rec_dir != rec_dir or self.g_pool.plugins is None
+        recording = self._load_recording(rec_dir)
+        self.g_pool.rec_dir = rec_dir
+        self.g_pool.capture = recording["capture"]
+        self.g_pool.timestamps = recording["timestamps"]
+        if self.g_pool.plugins is None:
+            initialize_plugins(self.g_pool, self.plugin_initializers)
+        elif recording_changed:
+            self._reload_recording_bound_plugins()
+
+        last_frame = len(self.g_pool.timestamps) - 1
+        start_frame = 0 if start_frame is None else max(int(start_frame), 0)
+        end_frame = last_frame if end_frame is None else min(int(end_frame), last_frame)
+        if start_frame > end_frame:
+            raise ValueError(f"Empty frame range {start_frame}-{end_frame} in {rec_dir}")
+        self.frame_range = (start_frame, end_frame)
+        self.g_pool.capture.seek_to_frame(start_frame)
+        return self.g_pool
+
+    def _reload_recording_bound_plugins(self):
+        bound_plugins = [name.lower() for name in RECORDING_BOUND_PLUGINS]
+        reloaded = []
+        for plugin in list(self.g_pool.plugins):
+            if plugin.class_name.lower() in bound_plugins:
+                reloaded.append((type(plugin), plugin.get_init_dict()))
+                plugin.alive = False
+        self.g_pool.plugins.clean()  # calls cleanup() of the removed plugins
+        for plugin_cls, args in reloaded:
+            self.g_pool.plugins.add(plugin_cls, args=args)
+
+    def _set_eye_data(self):
+        """
+        Puts the pupil, gaze and fixation data of the current frame range into the g_pool (like
+        _export_world_video does with its pre_computed_eye_data). The recording's data is only sliced.
+        """
+        eye_data = self._recordings[self.g_pool.rec_dir]["eye_data"]
+        export_window = (self.g_pool.timestamps[self.frame_range[0]], self.g_pool.timestamps[self.frame_range[1]])
+        init_dicts = {key: data_bisector.init_dict_for_window(export_window) for key, data_bisector in eye_data.items()}
+        self.g_pool.pupil_positions = PupilDataBisector.from_init_dict(init_dicts["pupil"])
+        self.g_pool.gaze_positions = Bisector(**init_dicts["gaze"])
+        self.g_pool.fixations = Affiliator(**init_dicts["fixations"])
+
+    def _deliver_notifications(self):
+        for notification in list(self.g_pool.delayed_notifications.values()):
+            if notification["_notify_time_"] < time.time():
+                del notification["_notify_time_"]
+                del self.g_pool.delayed_notifications[notification["subject"]]
+                self.g_pool.notifications.append(notification)
+        while self.g_pool.notifications:
+            notification = self.g_pool.notifications.pop(0)
+            for plugin in self.g_pool.plugins:
+                plugin.on_notify(notification)
+
+    def export(self, out_file_path, rec_dir=None, start_frame=None, end_frame=None):
+        """
+        Exports the world video of a frame range with the session's plugins, on the session's g_pool.
+        :param rec_dir: The recording (default: the current one).
+        :return: The number of exported frames.
+        """
+        from av_writer import MPEG_Writer
+        from player_methods import enclosing_window
+        from video_capture import EndofVideoError
+
+        if rec_dir is None and self.g_pool is None:
+            raise ValueError("The session has no recording yet, pass rec_dir")
+        g_pool = self.retarget(rec_dir or self.g_pool.rec_dir, start_frame, end_frame)
+        start_frame, end_frame = self.frame_range
+        self._set_eye_data()
+        writer = MPEG_Writer(out_file_path, start_time_synced=g_pool.timestamps[start_frame])
+        exported = 0
+        try:
+            while exported < end_frame - start_frame + 1:
+                try:
+                    frame = g_pool.capture.get_frame()
+                except EndofVideoError:
+                    break
+                frame_window = enclosing_window(g_pool.timestamps, frame.index)
+                events = {"frame": frame,
+                          "gaze": g_pool.gaze_positions.by_ts_window(frame_window),
+                          "pupil": g_pool.pupil_positions.by_ts_window(frame_window)}
+                self._deliver_notifications()
+                for plugin in g_pool.plugins:
+                    plugin.recent_events(events)
+                writer.write_video_frame(frame)
+                exported += 1
+        finally:
+            writer.close(timestamp_export_format="all")
+        return exported
+
+    def close(self):
+        if self.g_pool is not None and self.g_pool.plugins is not None:
+            for plugin in list(self.g_pool.plugins):
+                plugin.alive = False
+            self.g_pool.plugins.clean()
+        for recording in self._recordings.values():
+            recording["capture"].cleanup()
+        self._recordings.clear()
+        self.g_pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 #
 #
 #
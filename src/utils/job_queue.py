@@ -0,0 +1,373 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+
+# Our own libraries
+from CoreClasses import ProcessingContainer
+from src.utils.metadata_manager import MetadataManager
+from src.utils.preprocessing import VideoPreprocessor
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+JOB_STATES = ("pending", "claimed", "done", "failed")
+FINISHING_SUFFIX = ".finishing"  # a claim being moved to its final state, see FileJobQueue._finish
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class JobLostError(RuntimeError):
+    """
+    Raised when a worker's claim on a job was taken away (reclaimed as stale) while it was working on it.
+    """
+
+
+class ClaimLostEvent(threading.Event):
+    """
+    The abort event of a Job. It is set by a failed heartbeat, and is_set() also finds the claim lost by itself
+    (one stat of the claim file), so a handler that checks it before writing doesn't wait for the next heartbeat.
+    """
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+
+    def is_set(self):
+        if not super().is_set() and not os.path.exists(self.job.path):
+            self.set()
+        return super().is_set()
+
+
+class Job:
+    def __init__(self, queue, name, data, claim_token):
+        """
+        A job claimed from a FileJobQueue.
+        :param name: The job's file name (<subject>__<trail>.json).
+        :param data: The job's content (subject, trail, paths, processing options, attempts, history).
+        :param claim_token: The token of this claim, the claimed file is claimed/<token>__<name>.
+        """
+        self.queue = queue
+        self.name = name
+        self.data = data
+        self.claim_token = claim_token
+        self.abort_event = ClaimLostEvent(self)  # set once the claim is lost, the handler must stop writing
+
+    @property
+    def path(self):
+        return os.path.join(self.queue.queue_dir, "claimed", f"{self.claim_token}__{self.name}")
+
+    def __repr__(self):
+        return f"Job({self.data['subject']}, {self.data['trail']})"
+
+
+class FileJobQueue:
+    def __init__(self, queue_dir, stale_timeout=600, max_attempts=3):
+        """
+        A job queue made of plain files on a (shared) filesystem, one job file per (subject, trail), moving between
+        the pending/, claimed/, done/ and failed/ folders. Jobs are claimed with an atomic rename, so any number of
+        workers on any number of machines can drain the queue; exactly one rename of a pending job succeeds.
+        Every claim gets its own file name (claimed/<token>__<subject>__<trail>.json), so a worker only ever touches
+        or finishes its own claim, never a later claim of the same job by another worker.
+        A worker touches its claimed job file while it works (heartbeat). A claimed job whose file hasn't been
+        touched for stale_timeout seconds is considered abandoned (crashed worker or node) and goes back to pending.
+        Keep stale_timeout well above the heartbeat interval and the clock skew between the machines.
+        :param queue_dir: The queue's directory (on storage every worker mounts).
+        :param stale_timeout: Seconds without a heartbeat after which a claimed job is reclaimed.
+        :param max_attempts: A job that failed this many times goes to failed/ instead of back to pending/.
+        """
+        self.queue_dir = queue_dir
+        self.stale_timeout = stale_timeout
+        self.max_attempts = max_attempts
+        for state in JOB_STATES:
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    def _path(self, state, name):
+        return os.path.join(self.queue_dir, state, name)
+
+    @staticmethod
+    def job_name(subject_name, trail):
+        return f"{subject_name}__{trail}.json"
+
+    @staticmethod
+    def _claimed_job_name(claim_name):
+        """
+        :return: The job name of a claimed file (claimed/<token>__<name>).
+        """
+        return claim_name.split("__", 1)[1]
+
+    def _claim_files(self):
+        """
+        :return: The file names in claimed/: the claims and the claims that are being finished (.finishing).
+        """
+        return sorted(file_name for file_name in os.listdir(os.path.join(self.queue_dir, "claimed"))
+                      if file_name.endswith((".json", f".json{FINISHING_SUFFIX}")) and not file_name.startswith("."))
+
+    def _exists(self, state, name):
+        if state == "claimed":
+            return any(self._claimed_job_name(claim_name).removesuffix(FINISHING_SUFFIX) == name
+                       for claim_name in self._claim_files())
+        return os.path.exists(self._path(state, name))
+
+    def _write(self, path, data):
+        """
+        Writes a job file through a temporary file, so readers never see a half written job.
+        """
+        temp_path = f"{path}.{default_worker_id()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(data, file, indent=4)
+        os.replace(temp_path, path)
+
+    def submit(self, subject_name, trail, data_path, out_path, metadata_dir, resubmit=False, **options):
+        """
+        Adds a job for one trail of one subject.
+        :param data_path: The data folder of all subjects (as the workers see it).
+        :param out_path: The output folder of the snippets.
+        :param metadata_dir: The metadata directory.
+        :param resubmit: Submit again even if the job is already done or failed.
+        :param options: Keyword arguments of VideoPreprocessor.process_streaming (e.g. threshold, encoder).
+        :return: True if the job was added.
+        """
+        name = self.job_name(subject_name, trail)
+        existing = [state for state in JOB_STATES if self._exists(state, name)]
+        if existing and not (resubmit and existing[0] in ("done", "failed")):
+            logging.info(f"Job {name} is already {existing[0]}, not submitted")
+            return False
+        data = {"subject": subject_name, "trail": trail, "data_path": data_path, "out_path": out_path,
+                "metadata_dir": metadata_dir, "options": options, "attempts": 0, "history": []}
+        self._write(self._path("pending", name), data)
+        for state in existing:
+            try:
+                os.remove(self._path(state, name))
+            except FileNotFoundError:
+                pass
+        logging.info(f"Submitted job {name}")
+        return True
+
+    def list_jobs(self, state):
+        return sorted(name for name in os.listdir(os.path.join(self.queue_dir, state))
+                      if name.endswith(".json") and not name.startswith("."))
+
+    def counts(self):
+        return {state: len(self.list_jobs(state)) for state in JOB_STATES}
+
+    def claim(self, worker_id=None):
+        """
+        Claims the next pending job.
+        :return: A Job, or None if no job is pending.
+        """
+        worker_id = worker_id or default_worker_id()
+        for name in self.list_jobs("pending"):
+            claim_token = uuid.uuid4().hex
+            claimed_path = self._path("claimed", f"{claim_token}__{name}")
+            try:
+                os.rename(self._path("pending", name), claimed_path)
+            except FileNotFoundError:
+                continue  # another worker claimed it first
+            os.utime(claimed_path)  # rename keeps the old mtime, start the heartbeat now
+            with open(claimed_path) as file:
+                data = json.load(file)
+            data["attempts"] += 1
+            data["worker"] = worker_id
+            data["history"].append({"event": "claimed", "worker": worker_id, "time": time.time()})
+            self._write(claimed_path, data)
+            logging.info(f"Worker {worker_id} claimed job {name}")
+            return Job(self, name, data, claim_token)
+        return None
+
+    def heartbeat(self, job):
+        """
+        Marks a claimed job as alive. Only this worker's claim is touched, a later claim of the job by another
+        worker has another file name.
+        :return: False if the job isn't claimed by this worker anymore (it was reclaimed as stale), the job's
+                 abort_event is set then.
+        """
+        try:
+            os.utime(job.path)
+            return True
+        except FileNotFoundError:
+            logging.warning(f"{job} is no longer claimed by this worker")
+            job.abort_event.set()
+            return False
+
+    @contextmanager
+    def keep_alive(self, job, interval=None):
+        """
+        Sends heartbeats for a job from a background thread while the with block runs. If a heartbeat finds the
+        claim lost, the job's abort_event is set (the handler must stop) and JobLostError is raised when the
+        with block ends.
+        """
+        interval = interval or max(self.stale_timeout / 4, 1)
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(interval):
+                if not self.heartbeat(job):
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+            if job.abort_event.is_set():
+                raise JobLostError(f"{job} was reclaimed while this worker was working on it")
+
+    def _finish(self, job, state, event):
+        """
+        Moves a claimed job to another state. Only this worker's claim file is renamed (first to a private name),
+        so a job that was reclaimed, and maybe claimed by another worker, in the meantime is left alone.
+        :return: False if the job was reclaimed before it finished.
+        """
+        finishing_path = f"{job.path}{FINISHING_SUFFIX}"
+        try:
+            os.rename(job.path, finishing_path)
+        except FileNotFoundError:
+            # the job was reclaimed while this worker was still on it, the new claim decides its state
+            logging.warning(f"{job} was reclaimed before it finished ({event}), leaving it to the new claim")
+            return False
+        job.data["history"].append({"event": event, "worker": job.data.get("worker"), "time": time.time()})
+        self._write(finishing_path, job.data)
+        os.rename(finishing_path, self._path(state, job.name))
+        return True
+
+    def complete(self, job, result=None):
+        """
+        Moves a claimed job to done/.
+        """
+        job.data["result"] = result
+        if self._finish(job, "done", "done"):
+            logging.info(f"{job} done")
+
+    def fail(self, job, error):
+        """
+        Moves a failed job back to pending/ (or to failed/ after max_attempts attempts).
+        """
+        job.data["error"] = str(error)
+        state = "pending" if job.data["attempts"] < self.max_attempts else "failed"
+        if self._finish(job, state, f"failed: {error}"):
+            logging.warning(f"{job} failed (attempt {job.data['attempts']}), moved to {state}: {error}")
+
+    def reclaim_stale(self):
+        """
+        Moves claimed jobs without a heartbeat for stale_timeout seconds back to pending/. That includes jobs whose
+        worker crashed while finishing them (a stale .finishing file), they are done again.
+        :return: The names of the reclaimed jobs.
+        """
+        reclaimed = []
+        now = time.time()
+        for claim_name in self._claim_files():
+            claimed_path = self._path("claimed", claim_name)
+            name = self._claimed_job_name(claim_name).removesuffix(FINISHING_SUFFIX)
+            try:
+                if now - os.stat(claimed_path).st_mtime < self.stale_timeout:
+                    continue
+                with open(claimed_path) as file:
+                    attempts = json.load(file)["attempts"]
+                # a job that keeps killing its workers stops being retried
+                state = "pending" if attempts < self.max_attempts else "failed"
+                os.rename(claimed_path, self._path(state, name))
+            except FileNotFoundError:
+                continue  # finished or reclaimed by someone else in the meantime
+            logging.warning(f"Reclaimed stale job {name} (attempt {attempts}), moved to {state}")
+            reclaimed.append(name)
+        return reclaimed
+
+
+def process_job(job):
+    """
+    Runs the VideoPreprocessor pipeline for the job's (subject, trail). process_streaming replaces the trail's
+    groups from an earlier (interrupted) attempt.
+    :return: The job's result (number of groups).
+    """
+    data = job.data
+    metadata_manager = MetadataManager(base_directory=data["metadata_dir"])
+    container = ProcessingContainer(data_path=data["data_path"], subject_name=data["subject"])
+    container._create_out_path(data["out_path"])
+    video_processor = VideoPreprocessor(container, trail=data["trail"], metadata_manager=metadata_manager)
+    # a lost claim stops the trail after its current group without writing any more metadata, the worker that
+    # reclaimed the job redoes the trail
+    num_of_groups = video_processor.process_streaming(abort_event=job.abort_event, **data["options"])
+    return {"groups": num_of_groups}
+
+
+def run_worker(job_queue, worker_id=None, wait_for_jobs=False, poll_interval=10, handler=process_job):
+    """
+    Claims and processes jobs until the queue is drained.
+    :param job_queue: A FileJobQueue.
+    :param wait_for_jobs: Keep polling for new jobs instead of returning once nothing is pending or claimed.
+    :param handler: The function that processes a job (default: process_job).
+    :return: The number of jobs this worker finished.
+    """
+    worker_id = worker_id or default_worker_id()
+    finished = 0
+    while True:
+        job_queue.reclaim_stale()
+        job = job_queue.claim(worker_id)
+        if job is None:
+            if not wait_for_jobs and not job_queue._claim_files():
+                break
+            time.sleep(poll_interval)  # claimed jobs may still come back as stale
+            continue
+        try:
+            with job_queue.keep_alive(job):
+                result = handler(job)
+        except JobLostError as e:
+            logging.warning(f"{e}, worker {worker_id} drops it")
+            continue
+        except Exception as e:
+            logging.exception(f"{job} failed on worker {worker_id}")
+            job_queue.fail(job, e)
+            continue
+        job_queue.complete(job, result)
+        finished += 1
+    logging.info(f"Worker {worker_id} finished {finished} jobs")
+    return finished
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="File based job queue for processing subjects on shared storage.")
+    parser.add_argument("queue", help="Queue directory (on storage all workers mount)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = subparsers.add_parser("submit", help="Submit a job per subject and trail")
+    submit_parser.add_argument("subjects", nargs="+", help="Subject names (e.g. AN755)")
+    submit_parser.add_argument("--trails", required=True, help="Comma separated trails (e.g. T1,T2)")
+    submit_parser.add_argument("--data", required=True, help="Data folder of all subjects")
+    submit_parser.add_argument("--out", required=True, help="Output folder")
+    submit_parser.add_argument("--metadata", required=True, help="Metadata directory")
+    submit_parser.add_argument("--encoder", help="Snippet encoder profile")
+    submit_parser.add_argument("--virtual", action="store_true", help="Don't write snippet files")
+    submit_parser.add_argument("--resubmit", action="store_true", help="Submit done/failed jobs again")
+
+    worker_parser = subparsers.add_parser("work", help="Run a worker")
+    worker_parser.add_argument("--wait", action="store_true", help="Keep waiting for new jobs")
+    worker_parser.add_argument("--stale-timeout", type=float, default=600)
+
+    subparsers.add_parser("status", help="Print the number of jobs per state")
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        job_queue = FileJobQueue(args.queue)
+        options = {"write_snippets": not args.virtual}
+        if args.encoder:
+            options["encoder"] = args.encoder
+        for subject in args.subjects:
+            for trail in args.trails.split(","):
+                job_queue.submit(subject, trail, args.data, args.out, args.metadata, resubmit=args.resubmit,
+                                 **options)
+    elif args.command == "work":
+        run_worker(FileJobQueue(args.queue, stale_timeout=args.stale_timeout), wait_for_jobs=args.wait)
+    print(FileJobQueue(args.queue).counts())
@@ -0,0 +1,179 @@
+import time
+import logging
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+# psutil is optional, the RSS is read from /proc on Linux without it
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+METADATA_OPERATIONS = ["load_metadata", "save_metadata", "add_video_snippet", "add_video_snippets",
+                       "replace_video_snippets", "remove_video_snippets", "update_fixation_snippet_path",
+                       "update_snippet_paths", "update_fixation_tag", "update_fixation_tags"]
+
+
+def current_rss():
+    """
+    :return: The resident set size of this process in bytes, or None if it can't be read on this platform.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024  # the value is in kB
+    except OSError:
+        pass
+    return None
+
+
+class _StageRecord:
+    def __init__(self, name, traced_start, rss_start):
+        self.name = name
+        self.traced_start = traced_start
+        self.traced_peak = traced_start
+        self.rss_start = rss_start
+        self.rss_peak = rss_start
+        self.start_time = time.perf_counter()
+
+
+class MemoryProfiler:
+    def __init__(self, sample_interval=0.05):
+        """
+        Attributes peak memory to pipeline stages. Every stage (see stage and instrument) gets:
+        the peak of the Python heap above its start (tracemalloc, exact, includes numpy arrays but not memory that
+        OpenCV/FFmpeg allocate themselves) and the peak RSS above its start (sampled by a thread every
+        sample_interval seconds, so it includes the native allocations but can miss very short spikes).
+        Stages can be nested, an outer stage's peak includes its inner stages. Calls of the same stage name are
+        aggregated (calls, seconds and the largest peaks). The stages are meant to be opened from one thread.
+        Use it as a context manager: tracemalloc and the sampler run between __enter__ and __exit__.
+        :param sample_interval: Seconds between two RSS samples.
+        """
+        self.sample_interval = sample_interval
+        self.stats = {}  # stage name : aggregated stats
+        self._open_stages = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _sample_rss(self):
+        while not self._stop.wait(self.sample_interval):
+            rss = current_rss()
+            if rss is None:
+                return
+            with self._lock:
+                for record in self._open_stages:
+                    record.rss_peak = max(record.rss_peak, rss)
+
+    def _fold_traced_peak(self):
+        """
+        Hands the heap peak since the last fold to every open stage and resets it, so a stage that starts later
+        measures its own peak without losing the outer stages' one.
+        """
+        _, peak = tracemalloc.get_traced_memory()
+        for record in self._open_stages:
+            record.traced_peak = max(record.traced_peak, peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measures the body of a with block as the stage name.
+        """
+        rss = current_rss() or 0
+        with self._lock:
+            self._fold_traced_peak()
+            record = _StageRecord(name, tracemalloc.get_traced_memory()[0], rss)
+            self._open_stages.append(record)
+        try:
+            yield record
+        finally:
+            rss = current_rss() or 0
+            with self._lock:
+                record.rss_peak = max(record.rss_peak, rss)
+                self._fold_traced_peak()
+                self._open_stages.remove(record)
+                self._add(record, time.perf_counter() - record.start_time)
+
+    def _add(self, record, seconds):
+        stats = self.stats.setdefault(record.name, {"stage": record.name, "calls": 0, "seconds": 0.0,
+                                                    "traced_peak_bytes": 0, "rss_peak_bytes": 0})
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["traced_peak_bytes"] = max(stats["traced_peak_bytes"], record.traced_peak - record.traced_start)
+        stats["rss_peak_bytes"] = max(stats["rss_peak_bytes"], record.rss_peak - record.rss_start)
+
+    @contextmanager
+    def instrument(self, target, method_names, prefix=None):
+        """
+        Measures every call of some methods of a class or an object as its own stage, e.g.
+        instrument(metadata_manager, METADATA_OPERATIONS) or instrument(SnippetTrimmer, ["write_snippet"]).
+        The original methods are put back when the with block ends.
+        :param prefix: Stage name prefix (default: the class name).
+        """
+        prefix = prefix or (target.__name__ if isinstance(target, type) else type(target).__name__)
+        originals = {}
+        for method_name in method_names:
+            original = getattr(target, method_name)
+            originals[method_name] = target.__dict__.get(method_name, None) if isinstance(target, type) else None
+            wrapper = self._wrap(original, f"{prefix}.{method_name}")
+            if isinstance(originals[method_name], staticmethod):
+                wrapper = staticmethod(wrapper)
+            setattr(target, method_name, wrapper)
+        try:
+            yield self
+        finally:
+            for method_name, original in originals.items():
+                if original is not None:
+                    setattr(target, method_name, original)
+                else:  # the method came from a base class (or the instance's class), remove the wrapper
+                    delattr(target, method_name)
+
+    def _wrap(self, method, stage_name):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.stage(stage_name):
+                return method(*args, **kwargs)
+        return wrapper
+
+    def report(self):
+        """
+        :return: The stats of every stage (list of dicts), in the order the stages first ended.
+        """
+        return list(self.stats.values())
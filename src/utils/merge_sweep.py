@@ -0,0 +1,124 @@
+import logging
+import numpy as np
+
+# Our own libraries
+from src.utils.preprocessing import TARGET_LENGTH
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def fixation_arrays(fixation_dict):
+    """
+    Converts a fixation dictionary (outputted by _get_fixations_ts) into two int arrays.
+    :return: (start frames, end frames), ordered by fixation id.
+    """
+    starts = np.fromiter((fixation_dict[idx][0] for idx in range(len(fixation_dict))), dtype=np.int64,
+                         count=len(fixation_dict))
+    ends = np.fromiter((fixation_dict[idx][1] for idx in range(len(fixation_dict))), dtype=np.int64,
+                       count=len(fixation_dict))
+    return starts, ends
+
+
+class MergeSweep:
+    def __init__(self, starts, ends):
+        """
+        Computes the grouping of _merge_neighboring_fixations for many (threshold, target_length) pairs over the
+        same fixations. The gaps between fixations and the running maximum of the end frames are computed once,
+        each threshold and each target length adds one vectorized pass, and each pair only walks its groups.
+        :param starts: Start frames of the fixations (sorted by time).
+        :param ends: End frames of the fixations.
+        """
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.num_fixations = len(self.starts)
+        self.fixation_ids = np.arange(self.num_fixations, dtype=np.int64)
+        self.gaps = self.starts[1:] - self.ends[:-1]  # gaps[i] is between fixation i and i+1
+        self.running_max_end = np.maximum.accumulate(self.ends) if self.num_fixations else self.ends
+        self._segment_ends = {}
+        self._cap_ends = {}
+
+    def _segment_end(self, threshold):
+        """
+        For every fixation, the last fixation reachable from it without a gap larger than the threshold.
+        """
+        if threshold not in self._segment_ends:
+            breaks = np.flatnonzero(self.gaps > threshold)  # a new group has to start after these fixations
+            breaks = np.append(breaks, self.num_fixations - 1)
+            self._segment_ends[threshold] = breaks[np.searchsorted(breaks, self.fixation_ids)]
+        return self._segment_ends[threshold]
+
+    def _cap_end(self, target_length):
+        """
+        For every fixation, the last fixation a group starting there can reach before exceeding target_length.
+        """
+        if target_length not in self._cap_ends:
+            cap_end = np.searchsorted(self.running_max_end, self.starts + target_length - 1, side="right") - 1
+            # _merge_neighboring_fixations counts the first fixation of a group once more when adding the second one
+            second = np.minimum(self.fixation_ids + 1, self.num_fixations - 1)
+            first_merge_fails = self.ends[second] - self.starts + 2 > target_length
+            cap_end = np.where(first_merge_fails, self.fixation_ids, cap_end)
+            self._cap_ends[target_length] = np.maximum(cap_end, self.fixation_ids)
+        return self._cap_ends[target_length]
+
+    def groups(self, threshold=30, target_length=TARGET_LENGTH):
+        """
+        The grouping of _merge_neighboring_fixations(threshold, target_length), as fixation index arrays.
+        :return: (first fixation of each group, last fixation of each group, bool array: group closed by the cap).
+        """
+        if self.num_fixations < 2:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=bool)
+        segment_end = self._segment_end(threshold)
+        cap_end = self._cap_end(target_length)
+        group_end = np.minimum(segment_end, cap_end)
+        next_start = (group_end + 1).tolist()
+
+        first = []
+        start = 0
+        last_fixation = self.num_fixations - 1
+        while start < last_fixation:  # a group that would start with the last fixation is left out
+            first.append(start)
+            start = next_start[start]
+        first = np.asarray(first, dtype=np.int64)
+        last = group_end[first]
+        closed_by_cap = (cap_end[first] < segment_end[first])
+        return first, last, closed_by_cap
+
+    def summary(self, threshold=30, target_length=TARGET_LENGTH):
+        """
+        Summary of one (threshold, target_length) pair.
+        :return: A dict with the number of groups, the share of padding frames in the snippets, the number of
+                 fixations the cap pushed out of their group (into the next one), the number of fixations
+                 left out of all groups, and the number of groups longer than target_length (a single fixation
+                 longer than the snippet, trimming would reject these).
+        """
+        first, last, closed_by_cap = self.groups(threshold, target_length)
+        spans = self.ends[last] - self.starts[first] + 1 if len(first) else np.zeros(0, dtype=np.int64)
+        padding = np.clip(target_length - spans, 0, None)
+        covered = int((last - first + 1).sum())
+        return {
+            "threshold": threshold,
+            "target_length": target_length,
+            "groups": len(first),
+            "padding_ratio": float(padding.sum() / (len(first) * target_length)) if len(first) else 0.0,
+            "fixations_cut_by_cap": int(closed_by_cap.sum()),
+            "fixations_left_out": self.num_fixations - covered,
+            "oversized_groups": int((spans > target_length).sum()),
+            "mean_fixations_per_group": covered / len(first) if len(first) else 0.0,
+        }
+
+
+def sweep_merge_parameters(starts, ends, pairs):
+    """
+    Evaluates many (threshold, target_length) pairs on the same fixations.
+    :param starts: Start frames of the fixations (e.g. from fixation_arrays).
+    :param ends: End frames of the fixations.
+    :param pairs: An iterable of (threshold, target_length).
+    :return: A list of MergeSweep.summary dicts, one per pair.
+    """
+    sweep = MergeSweep(starts, ends)
+    return [sweep.summary(threshold, target_length) for threshold, target_length in pairs]
@@ -1,23 +1,149 @@
+import io
 import json
 import os
+import re
+import time
+import zlib
 import logging
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+import msgpack
+
+# zstd compression of binary metadata is optional
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Cross-process file locking, fcntl on Linux/macOS and msvcrt on Windows
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Group header fields that are copied into the metadata index (everything except the nested fixations)
+INDEX_GROUP_FIELDS = ("group_id", "trail", "start_frame", "end_frame", "total_fixations", "snippet_path",
+                      "source_video")
+
+# File extension of every (storage format, compression) pair, the format of an existing file is detected on load
+METADATA_EXTENSIONS = {
+    ("json", None): ".json",
+    ("msgpack", None): ".msgpack",
+    ("msgpack", "zstd"): ".msgpack.zst",
+    ("msgpack", "zlib"): ".msgpack.zlib",
+}
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
 
 class MetadataManager:
-    def __init__(self, base_directory="..\metadata"):
+    def __init__(self, base_directory="..\metadata", storage_format="json", compression=None):
         """
         Initializes the MetadataManager.
         :param base_directory: Directory where all metadata files will be stored.
+        :param storage_format: "json" (indented, human readable) or "msgpack" (compact binary, much faster).
+                               Files are loaded in whatever format they have, and saved in this one.
+        :param compression: None, "zstd" (needs the zstandard package) or "zlib", for the msgpack format only.
         """
+        if (storage_format, compression) not in METADATA_EXTENSIONS:
+            raise ValueError(f"Unsupported metadata storage: {storage_format} with compression {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression of the metadata needs the zstandard package")
         self.base_directory = base_directory
+        self.storage_format = storage_format
+        self.compression = compression
+        self._local = threading.local()  # lock depth per subject, so a thread can re-enter its own lock
         Path(self.base_directory).mkdir(parents=True, exist_ok=True)
         logging.info(f"MetadataManager initialized. Metadata directory: {self.base_directory}")
 
     def _get_subject_metadata_path(self, subject_name):
         """
-        Returns the file path for a specific subject's metadata.
+        Returns the file path for a specific subject's metadata: the existing file (in any storage format, the
+        configured one first), or the path it will be saved in.
+        """
+        target_path = self._get_target_metadata_path(subject_name)
+        if os.path.exists(target_path):
+            return target_path
+        for extension in METADATA_EXTENSIONS.values():
+            path = os.path.join(self.base_directory, f"{subject_name}{extension}")
+            if os.path.exists(path):
+                return path
+        return target_path
+
+    def _get_target_metadata_path(self, subject_name):
+        """
+        Returns the path a subject's metadata is saved in (in the configured storage format).
+        """
+        extension = METADATA_EXTENSIONS[(self.storage_format, self.compression)]
+        return os.path.join(self.base_directory, f"{subject_name}{extension}")
+
+    def list_subjects(self):
+        """
+        Returns the names of all subjects that have a metadata file in the metadata directory.
+        """
+        subjects = set()
+        for file in os.listdir(self.base_directory):
+            for extension in METADATA_EXTENSIONS.values():
+                if file.endswith(extension):
+                    subjects.add(file[:-len(extension)])
+                    break
+        return sorted(subjects)
+
+    @contextmanager
+    def _subject_lock(self, subject_name):
+        """
+        Holds an exclusive lock on a subject's metadata (a <subject>.json.lock file next to it).
+        The lock works across threads, processes and (on a shared filesystem) machines, and is re-entrant
+        within a thread so locked methods can call each other.
+        """
+        depths = self._local.__dict__.setdefault("depths", {})
+        if depths.get(subject_name, 0) > 0:
+            depths[subject_name] += 1
+            try:
+                yield
+            finally:
+                depths[subject_name] -= 1
+            return
+
+        # the lock file keeps its name whatever the storage format, so managers of different formats exclude each other
+        lock_path = os.path.join(self.base_directory, f"{subject_name}.json.lock")
+        with open(lock_path, "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)  # retries for ~10 seconds
+                        break
+                    except OSError:
+                        logging.debug(f"Still waiting for the metadata lock of subject: {subject_name}")
+            depths[subject_name] = 1
+            try:
+                yield
+            finally:
+                depths[subject_name] = 0
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _update_metadata(self, subject_name, update):
+        """
+        Runs a read-modify-write cycle on a subject's metadata while holding its lock, so concurrent writers
+        (batch workers, the media player) never overwrite each other's changes.
+        :param update: A function that gets the loaded metadata and changes it in place.
+                       If it returns False nothing is saved.
+        :return: Whatever update returned.
         """
-        return os.path.join(self.base_directory, f"{subject_name}.json")
+        with self._subject_lock(subject_name):
+            metadata = self.load_metadata(subject_name)
+            result = update(metadata)
+            if result is not False:
+                self.save_metadata(subject_name, metadata)
+            return result
 
     def load_metadata(self, subject_name):
         """
@@ -25,9 +151,10 @@ class MetadataManager:
         """
         metadata_path = self._get_subject_metadata_path(subject_name)
         try:
-            with open(metadata_path, "r") as file:
-                logging.debug(f"Loaded metadata for subject: {subject_name}")
-                return json.load(file)
+            with open(metadata_path, "rb") as file:
+                metadata = self._decode_metadata(file.read())
+            logging.debug(f"Loaded metadata for subject: {subject_name}")
+            return metadata
         except FileNotFoundError:
             logging.warning(f"No metadata file found for subject: {subject_name}. Creating new metadata.")
             return {"name": subject_name, "videos": []}
@@ -36,15 +163,18 @@ class MetadataManager:
         """
         Saves the metadata for a specific subject safely.
         """
-        metadata_path = self._get_subject_metadata_path(subject_name)
-        temp_path = f"{metadata_path}.tmp"
+        metadata_path = self._get_target_metadata_path(subject_name)
+        temp_path = f"{metadata_path}.{os.getpid()}.tmp"
         try:
-            # Write to a temporary file first
-            with open(temp_path, "w") as temp_file:
-                json.dump(metadata, temp_file, indent=4)
+            with self._subject_lock(subject_name):
+                # Write to a temporary file first
+                with open(temp_path, "wb") as temp_file:
+                    group_offsets = self._encode_metadata(metadata, temp_file)
 
-            # Replace the original file
-            os.replace(temp_path, metadata_path)
+                # Replace the original file
+                self._replace_file(temp_path, metadata_path)
+                self._remove_other_formats(subject_name)
+                self._save_metadata_index(subject_name, metadata, group_offsets)
             logging.info(f"Metadata saved for subject: {subject_name} in {metadata_path}")
 
         except Exception as e:
@@ -53,65 +183,474 @@ class MetadataManager:
                 os.remove(temp_path)
             raise
 
+    def _encode_metadata(self, metadata, file):
+        """
+        Writes the metadata in the configured storage format.
+        :return: (byte offset, byte length) of each item of metadata["videos"] in the file, or None for every
+                 item if the file is compressed (the groups can't be read separately).
+        """
+        if self.storage_format == "json":
+            return self._dump_json(metadata, file)
+        if self.compression is None:
+            return self._dump_msgpack(metadata, file)
+        buffer = io.BytesIO()
+        group_offsets = [None] * len(self._dump_msgpack(metadata, buffer))
+        if self.compression == "zstd":
+            file.write(zstandard.ZstdCompressor(level=3).compress(buffer.getvalue()))
+        else:
+            file.write(zlib.compress(buffer.getvalue(), 6))
+        return group_offsets
+
+    @staticmethod
+    def _decode_metadata(data):
+        """
+        Decodes a metadata file of any storage format (detected from its content).
+        """
+        if data.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise ImportError("This metadata file is zstd compressed, reading it needs the zstandard package")
+            data = zstandard.ZstdDecompressor().decompress(data)
+        elif data[:1] == b"\x78":  # zlib header (never the first byte of a JSON or msgpack metadata file)
+            data = zlib.decompress(data)
+        if data.lstrip()[:1] in (b"{", b""):
+            return json.loads(data.decode("utf-8"))
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+    def _remove_other_formats(self, subject_name):
+        """
+        Deletes the subject's metadata files (and their indexes) in the storage formats it wasn't just saved in,
+        so saving converts a subject to the configured format.
+        """
+        target_path = self._get_target_metadata_path(subject_name)
+        for extension in METADATA_EXTENSIONS.values():
+            path = os.path.join(self.base_directory, f"{subject_name}{extension}")
+            if path == target_path:
+                continue
+            for stale_path in (path, f"{path}.idx"):
+                try:
+                    os.remove(stale_path)
+                    logging.info(f"Removed {stale_path}, subject {subject_name} is now stored in {target_path}")
+                except FileNotFoundError:
+                    pass
+
+    def export_json(self, subject_name, out_path):
+        """
+        Writes a subject's metadata as indented JSON (the original format), whatever format it is stored in.
+        :param out_path: The JSON file to write (outside the metadata directory, or it counts as a second copy).
+        """
+        metadata = self.load_metadata(subject_name)
+        with open(out_path, "wb") as file:
+            self._dump_json(metadata, file)
+        logging.info(f"Exported metadata of subject {subject_name} to {out_path}")
+
+    @staticmethod
+    def _dump_msgpack(metadata, file):
+        """
+        Writes the metadata exactly like msgpack.pack(metadata, file), but packs each item of metadata["videos"]
+        separately to record where it lives in the file.
+        :return: A list of (byte offset, byte length) for each item of metadata["videos"].
+        """
+        packer = msgpack.Packer()
+        group_offsets = []
+        file.write(packer.pack_map_header(len(metadata)))
+        for key, value in metadata.items():
+            file.write(packer.pack(key))
+            if key == "videos" and isinstance(value, list):
+                file.write(packer.pack_array_header(len(value)))
+                for video in value:
+                    chunk = packer.pack(video)
+                    group_offsets.append((file.tell(), len(chunk)))
+                    file.write(chunk)
+            else:
+                file.write(packer.pack(value))
+        return group_offsets
+
+    @staticmethod
+    def _dump_json(metadata, file):
+        """
+        Writes the metadata exactly like json.dump(metadata, file, indent=4), but writes each item of
+        metadata["videos"] separately to record where it lives in the file.
+        :param file: A file opened in binary mode.
+        :return: A list of (byte offset, byte length) for each item of metadata["videos"].
+        """
+        group_offsets = []
+        if not metadata:
+            file.write(b"{}")
+            return group_offsets
+        file.write(b"{")
+        for i, (key, value) in enumerate(metadata.items()):
+            file.write(b"," if i else b"")
+            file.write(b"\n    " + json.dumps(key).encode() + b": ")
+            if key == "videos" and isinstance(value, list) and value:
+                file.write(b"[")
+                for j, video in enumerate(value):
+                    file.write(b"," if j else b"")
+                    file.write(b"\n        ")
+                    chunk = json.dumps(video, indent=4).replace("\n", "\n        ").encode()
+                    group_offsets.append((file.tell(), len(chunk)))
+                    file.write(chunk)
+                file.write(b"\n    ]")
+            else:
+                file.write(json.dumps(value, indent=4).replace("\n", "\n    ").encode())
+        file.write(b"\n}")
+        return group_offsets
+
+    def _get_metadata_index_path(self, subject_name):
+        """
+        Returns the path of the index sidecar of a subject's metadata (group headers and their byte offsets).
+        """
+        return f"{self._get_subject_metadata_path(subject_name)}.idx"
+
+    def _save_metadata_index(self, subject_name, metadata, group_offsets):
+        """
+        Writes the index sidecar of a subject, tied to the current size and modification time of its metadata file.
+        """
+        stat = os.stat(self._get_subject_metadata_path(subject_name))
+        index = {
+            "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns,
+            "name": metadata.get("name", subject_name),
+            "groups": [{**{field: video.get(field) for field in INDEX_GROUP_FIELDS},
+                        "offset": location[0] if location else None, "length": location[1] if location else None}
+                       for video, location in zip(metadata.get("videos", []), group_offsets)],
+        }
+        index_path = self._get_metadata_index_path(subject_name)
+        temp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as temp_file:
+            json.dump(index, temp_file)
+        self._replace_file(temp_path, index_path)
+        return index
+
+    def _build_metadata_index(self, subject_name):
+        """
+        Builds the index of a metadata file that has none (or an outdated one), e.g. files written by an older version.
+        The file is scanned once, one group at a time, and the index is saved for next time.
+        """
+        metadata_path = self._get_subject_metadata_path(subject_name)
+        if not metadata_path.endswith(".json"):
+            return self._build_binary_metadata_index(subject_name, metadata_path)
+        with self._subject_lock(subject_name):
+            with open(metadata_path, "rb") as file:
+                # latin-1 maps every byte to one character, so string positions are byte offsets
+                text = file.read().decode("latin-1")
+            decoder = json.JSONDecoder()
+            videos_match = re.search(r'"videos"\s*:\s*\[', text)
+            headers, group_offsets = [], []
+            pos = videos_match.end() if videos_match else len(text)
+            while videos_match:
+                while pos < len(text) and text[pos] in " \t\r\n,":
+                    pos += 1
+                if pos >= len(text) or text[pos] == "]":
+                    break
+                video, end = decoder.raw_decode(text, pos)
+                headers.append({field: video.get(field) for field in INDEX_GROUP_FIELDS})
+                group_offsets.append((pos, end - pos))
+                pos = end
+            name_match = re.search(r'"name"\s*:\s*"([^"]*)"', text[:videos_match.start()] if videos_match else text)
+            metadata_headers = {"name": name_match.group(1) if name_match else subject_name, "videos": headers}
+            logging.debug(f"Built metadata index for subject: {subject_name}")
+            return self._save_metadata_index(subject_name, metadata_headers, group_offsets)
+
+    def _build_binary_metadata_index(self, subject_name, metadata_path):
+        """
+        Builds the index of a msgpack metadata file. Its group offsets are found by packing the loaded metadata
+        again; compressed files get no offsets (their groups are read by loading the whole file).
+        """
+        with self._subject_lock(subject_name):
+            with open(metadata_path, "rb") as file:
+                data = file.read()
+            metadata = self._decode_metadata(data)
+            buffer = io.BytesIO()
+            group_offsets = self._dump_msgpack(metadata, buffer)
+            if buffer.getvalue() != data:  # compressed, or packed differently than we pack
+                group_offsets = [None] * len(group_offsets)
+            logging.debug(f"Built metadata index for subject: {subject_name}")
+            return self._save_metadata_index(subject_name, metadata, group_offsets)
+
+    def load_metadata_index(self, subject_name):
+        """
+        Loads the index of a subject's metadata: the group headers (without fixations) and their byte offsets.
+        The index is rebuilt if it is missing or the metadata file changed since it was written.
+        """
+        metadata_path = self._get_subject_metadata_path(subject_name)
+        try:
+            stat = os.stat(metadata_path)
+        except FileNotFoundError:
+            logging.warning(f"No metadata file found for subject: {subject_name}.")
+            return {"source_size": None, "source_mtime_ns": None, "name": subject_name, "groups": []}
+        try:
+            with open(self._get_metadata_index_path(subject_name), "r") as file:
+                index = json.load(file)
+            if (index["source_size"], index["source_mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                return index
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        return self._build_metadata_index(subject_name)
+
+    def open_metadata_view(self, subject_name):
+        """
+        Returns a LazyMetadataView of a subject, which reads a single group's fixations only when asked to.
+        """
+        return LazyMetadataView(self, subject_name)
+
+    @staticmethod
+    def _replace_file(source, destination, attempts=20):
+        """
+        os.replace is atomic, but on Windows it fails while another process (e.g. a reader) has the file open,
+        so it is retried for a short while.
+        """
+        for attempt in range(attempts):
+            try:
+                os.replace(source, destination)
+                return
+            except PermissionError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(0.05)
+
     def add_video_snippet(self, subject_name, group_data):
         """
         Adds a video snippet and its associated group fixation data to a subject's metadata.
         :param subject_name: The name of the subject.
         :param group_data: A dictionary containing group-level and nested fixation data.
         """
-        try:
-            metadata = self.load_metadata(subject_name)
+        def add(metadata):
             # Add the snippet with its group data
             metadata["videos"].append({
                 "snippet_path": None,
                 **group_data  # Unpack the group-level and nested fixations
             })
-            group_id = group_data["group_id"]
+
+        group_id = group_data["group_id"]
+        try:
+            self._update_metadata(subject_name, add)
             logging.info(f"Added video snippet with fixations for subject {subject_name}, snippet {group_id}")
-            self.save_metadata(subject_name, metadata)
-        except WindowsError as e:
-            logging.warning(f"Metadata for subject {subject_name} already exists in the metadata folder. Delete if you wish to define new metadata")
+        except OSError as e:
+            logging.error(f"Failed to add video snippet {group_id} for subject {subject_name}. Error: {e}")
+            raise
+
+    def add_video_snippets(self, subject_name, groups_data):
+        """
+        Adds several video snippets at once (a single read-modify-write of the metadata file).
+        :param subject_name: The name of the subject.
+        :param groups_data: A list of group dictionaries, like the group_data of add_video_snippet.
+        """
+        def add(metadata):
+            for group_data in groups_data:
+                metadata["videos"].append({"snippet_path": None, **group_data})
 
-    def update_fixation_snippet_path(self, subject_name, snippet_path, idx):
+        self._update_metadata(subject_name, add)
+        logging.info(f"Added {len(groups_data)} video snippets with fixations for subject {subject_name}")
+
+    def replace_video_snippets(self, subject_name, trail, groups_data):
+        """
+        Replaces all groups of one trail with new ones, in a single read-modify-write of the metadata file.
+        :param subject_name: The name of the subject.
+        :param trail: The trail whose groups are replaced.
+        :param groups_data: A list of group dictionaries, like the group_data of add_video_snippet.
+        """
+        def replace(metadata):
+            metadata["videos"] = [video for video in metadata["videos"] if video.get("trail") != trail]
+            for group_data in groups_data:
+                metadata["videos"].append({"snippet_path": None, **group_data})
+
+        self._update_metadata(subject_name, replace)
+        logging.info(f"Wrote {len(groups_data)} video snippets of trail {trail} for subject {subject_name}")
+
+    def remove_video_snippets(self, subject_name, trail):
+        """
+        Removes all groups of one trail from the subject's metadata (e.g. before the trail is processed again).
+        The snippet files themselves are not deleted.
+        :param subject_name: The name of the subject.
+        :param trail: The trail whose groups are removed.
+        :return: The number of removed groups.
+        """
+        def remove(metadata):
+            kept = [video for video in metadata["videos"] if video.get("trail") != trail]
+            if len(kept) == len(metadata["videos"]):
+                return False
+            removed = len(metadata["videos"]) - len(kept)
+            metadata["videos"] = kept
+            return removed
+
+        if not os.path.exists(self._get_subject_metadata_path(subject_name)):
+            return 0
+        removed = self._update_metadata(subject_name, remove) or 0
+        logging.info(f"Removed {removed} video snippets of trail {trail} for subject {subject_name}")
+        return removed
+
+    def update_fixation_snippet_path(self, subject_name, snippet_path, idx, trail=None, fields=None):
         """
         Updates the snippet path of a fixation group in the subject's metadata.\
         :param subject_name: Subject's name.
         :param snippet_path: A path to the snippet video.
         :param idx: Number of group (int).
+        :param trail: The group's trail (group ids repeat in every trail). None matches the first group with the id.
+        :param fields: Other group fields to set with the path (e.g. the frame sampling, see frame_sampling).
         """
-        metadata = self.load_metadata(subject_name)
-        vid_lst = metadata["videos"]
-        L = len(vid_lst)
-        for group_id in range(L):
-            if vid_lst[group_id]["group_id"] == f"group_{idx}":
-                metadata["videos"][group_id]["snippet_path"] = snippet_path
-                break
+        def update(metadata):
+            vid_lst = metadata["videos"]
+            L = len(vid_lst)
+            for group_id in range(L):
+                if vid_lst[group_id]["group_id"] == f"group_{idx}" and (trail is None or vid_lst[group_id].get("trail") == trail):
+                    metadata["videos"][group_id]["snippet_path"] = snippet_path
+                    metadata["videos"][group_id].pop("virtual", None)  # it has a snippet file now
+                    metadata["videos"][group_id].update(fields or {})
+                    break
+
         try:
-            self.save_metadata(subject_name, metadata)
+            self._update_metadata(subject_name, update)
             logging.debug(f"Updated snippet path for subject: {subject_name} successfully, snippet_{idx}")
         except Exception as e:
             logging.error(f"There was a problem with updating the video snippet path for subject: {subject_name}, snippet_{idx}. error: {e}")
             raise e
-    def update_fixation_tag(self, subject_name, group_id, fixation_id, tag):
+    def update_snippet_paths(self, subject_name, snippet_paths):
+        """
+        Updates the snippet paths of many groups in one metadata commit.
+        :param subject_name: The name of the subject.
+        :param snippet_paths: A dict of {(trail, group_id) : snippet path}.
+        :return: The number of groups that were updated.
+        """
+        def update(metadata):
+            updated = 0
+            for video in metadata["videos"]:
+                key = (video.get("trail"), video["group_id"])
+                if key in snippet_paths:
+                    video["snippet_path"] = snippet_paths[key]
+                    video.pop("virtual", None)  # it has a snippet file now
+                    updated += 1
+            return updated or False
+
+        updated = self._update_metadata(subject_name, update) or 0
+        logging.info(f"Updated {updated} snippet paths for subject {subject_name}")
+        return updated
+
+    def update_fixation_tag(self, subject_name, group_id, fixation_id, tag, trail=None, tag_source="manual"):
         """
         Updates the tag of a fixation in the subject's metadata.
         :param subject_name: The name of the subject.
         :param group_id: The group ID where the fixation resides.
         :param fixation_id: The ID of the fixation to update.
         :param tag: The new tag value to assign.
+        :param trail: The group's trail (group ids repeat in every trail). None matches the first group with the id.
+        :param tag_source: Who set the tag, "manual" (a reviewer) or "auto" (see auto_tagger).
         """
-        metadata = self.load_metadata(subject_name)
-        for video in metadata["videos"]:
-            if video["group_id"] == group_id:
-                if fixation_id in video["fixations"]:  # Check if the fixation exists in the group
-                    video["fixations"][fixation_id]["tag"] = tag  # Update the tag
-                    logging.debug(
-                        f"Updated fixation {fixation_id} for subject {subject_name} in {group_id} with tag: {tag}")
-                    self.save_metadata(subject_name, metadata)
-                    return
-                else:
-                    logging.warning(f"Fixation {fixation_id} not found in group {group_id} for subject {subject_name}.")
-                    return
-        # in case group_id isn't found:
-        logging.error(f"{group_id} not found for subject {subject_name}. No changes made.")
+        def update(metadata):
+            for video in metadata["videos"]:
+                if video["group_id"] == group_id and (trail is None or video.get("trail") == trail):
+                    if fixation_id in video["fixations"]:  # Check if the fixation exists in the group
+                        video["fixations"][fixation_id]["tag"] = tag  # Update the tag
+                        video["fixations"][fixation_id]["tag_source"] = tag_source
+                        logging.debug(
+                            f"Updated fixation {fixation_id} for subject {subject_name} in {group_id} with tag: {tag}")
+                        return True
+                    else:
+                        logging.warning(f"Fixation {fixation_id} not found in group {group_id} for subject {subject_name}.")
+                        return False
+            # in case group_id isn't found:
+            logging.error(f"{group_id} not found for subject {subject_name}. No changes made.")
+            return False
+
+        self._update_metadata(subject_name, update)
+
+
+    def update_fixation_tags(self, subject_name, tag_updates, overwrite_manual=False):
+        """
+        Updates the tags of many fixations in one metadata commit.
+        :param subject_name: The name of the subject.
+        :param tag_updates: A list of dicts with trail, group_id, fixation_id and tag, every other key (e.g.
+                            tag_source, tag_confidence) is stored in the fixation as well.
+        :param overwrite_manual: Also replace a reviewer's tags (by default they are kept, see is_manual_tag).
+        :return: The number of fixations that were updated.
+        """
+        by_group = {}
+        for tag_update in tag_updates:
+            by_group.setdefault((tag_update["trail"], tag_update["group_id"]), []).append(tag_update)
+        updated = 0
+
+        def update(metadata):
+            nonlocal updated
+            updated = 0
+            for video in metadata["videos"]:
+                for tag_update in by_group.get((video.get("trail"), video["group_id"]), []):
+                    fixation = video["fixations"].get(tag_update["fixation_id"])
+                    if fixation is None:
+                        logging.warning(f"Fixation {tag_update['fixation_id']} not found in {video['group_id']} "
+                                        f"for subject {subject_name}.")
+                        continue
+                    if is_manual_tag(fixation) and not overwrite_manual:
+                        continue
+                    fixation.update({key: value for key, value in tag_update.items()
+                                     if key not in ("trail", "group_id", "fixation_id")})
+                    updated += 1
+            return updated > 0
+
+        self._update_metadata(subject_name, update)
+        logging.info(f"Updated {updated} fixation tags for subject {subject_name}")
+        return updated
+
+
+def is_manual_tag(fixation):
+    """
+    :return: True if a reviewer set the fixation's tag: its tag_source is "manual", or it has a tag but no
+             tag_source (tags saved before tag_source existed all came from the media player).
+    """
+    if "tag_source" in fixation:
+        return fixation["tag_source"] == "manual"
+    return fixation.get("tag") is not None
 
+
+class LazyMetadataView:
+    def __init__(self, metadata_manager, subject_name):
+        """
+        A read-only view of a subject's metadata that only loads the small index (group headers) up front.
+        A group, with its fixations, is read from the metadata file only when load_group is called.
+        :param metadata_manager: An instance of MetadataManager object.
+        :param subject_name: The name of the subject.
+        """
+        self.metadata_manager = metadata_manager
+        self.subject_name = subject_name
+        self.metadata_path = metadata_manager._get_subject_metadata_path(subject_name)
+        self._index = metadata_manager.load_metadata_index(subject_name)
+        self._videos = None  # all groups, only loaded for compressed files
+
+    @property
+    def groups(self):
+        """
+        The group headers (group_id, trail, start/end frame, total_fixations, snippet_path), in file order.
+        """
+        return self._index["groups"]
+
+    def __len__(self):
+        return len(self._index["groups"])
+
+    def _refresh_if_changed(self):
+        metadata_path = self.metadata_manager._get_subject_metadata_path(self.subject_name)  # the format may change
+        try:
+            stat = os.stat(metadata_path)
+        except FileNotFoundError:
+            return
+        if metadata_path != self.metadata_path or \
+                (self._index["source_size"], self._index["source_mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            self.metadata_path = metadata_path
+            self._index = self.metadata_manager.load_metadata_index(self.subject_name)
+            self._videos = None
+
+    def load_group(self, position):
+        """
+        Reads a single group (including its fixations) from the metadata file.
+        :param position: Position of the group in self.groups.
+        :return: The group dict, same as metadata["videos"][position].
+        """
+        self._refresh_if_changed()
+        header = self._index["groups"][position]
+        if header["offset"] is None:  # compressed file, no random access
+            if self._videos is None:
+                self._videos = self.metadata_manager.load_metadata(self.subject_name)["videos"]
+            return self._videos[position]
+        with open(self.metadata_path, "rb") as file:
+            file.seek(header["offset"])
+            chunk = file.read(header["length"])
+        if self.metadata_path.endswith(".json"):
+            return json.loads(chunk.decode("utf-8"))
+        return msgpack.unpackb(chunk, raw=False, strict_map_key=False)
@@ -0,0 +1,176 @@
+import os
+import sqlite3
+import logging
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subjects (
+    name TEXT PRIMARY KEY,
+    source_path TEXT NOT NULL,
+    source_mtime_ns INTEGER NOT NULL,
+    source_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS groups (
+    subject TEXT NOT NULL,
+    trail TEXT,
+    group_id TEXT NOT NULL,
+    start_frame INTEGER NOT NULL,
+    end_frame INTEGER NOT NULL,
+    total_fixations INTEGER NOT NULL,
+    snippet_path TEXT
+);
+CREATE TABLE IF NOT EXISTS fixations (
+    subject TEXT NOT NULL,
+    trail TEXT,
+    group_id TEXT NOT NULL,
+    fixation_id TEXT NOT NULL,
+    start_frame INTEGER NOT NULL,
+    end_frame INTEGER NOT NULL,
+    duration INTEGER NOT NULL,
+    tag TEXT,
+    tag_source TEXT,
+    tag_confidence REAL,
+    target_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS groups_subject ON groups (subject);
+CREATE INDEX IF NOT EXISTS fixations_subject ON fixations (subject);
+CREATE INDEX IF NOT EXISTS fixations_trail_tag ON fixations (trail, tag);
+CREATE INDEX IF NOT EXISTS fixations_target ON fixations (subject, trail, target_id);
+"""
+
+
+class MetadataStore:
+    def __init__(self, metadata_manager, db_path=None):
+        """
+        A derived SQLite store with flat group and fixation tables built from the subjects' metadata files.
+        The JSON files stay the source of truth, the store is only refreshed from them (see refresh).
+        :param metadata_manager: An instance of MetadataManager object.
+        :param db_path: Path of the SQLite file (default: metadata_store.sqlite inside the metadata directory).
+        """
+        self.metadata_manager = metadata_manager
+        self.db_path = db_path or os.path.join(metadata_manager.base_directory, "metadata_store.sqlite")
+        self.connection = sqlite3.connect(self.db_path)
+        self._create_schema()
+
+    def _create_schema(self):
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            # The store is derived data, so on a schema change it is simply rebuilt
+            logging.info(f"Metadata store schema changed ({version} -> {SCHEMA_VERSION}), rebuilding {self.db_path}")
+            self.connection.executescript("DROP TABLE IF EXISTS subjects; DROP TABLE IF EXISTS groups; "
+                                          "DROP TABLE IF EXISTS fixations;")
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def refresh(self):
+        """
+        Re-imports every subject whose metadata file changed (size or modification time) since the last refresh
+        and drops subjects whose file is gone. Unchanged subjects are not read at all.
+        :return: A list of the re-imported subject names.
+        """
+        known = {name: (mtime_ns, size) for name, mtime_ns, size in
+                 self.connection.execute("SELECT name, source_mtime_ns, source_size FROM subjects")}
+        subjects = self.metadata_manager.list_subjects()
+        refreshed = []
+        for subject_name in subjects:
+            source_path = self.metadata_manager._get_subject_metadata_path(subject_name)
+            stat = os.stat(source_path)
+            if known.get(subject_name) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            metadata = self.metadata_manager.load_metadata(subject_name)
+            with self.connection:  # one transaction per subject
+                self._delete_subject(subject_name)
+                self._insert_subject(subject_name, metadata)
+                self.connection.execute("INSERT INTO subjects VALUES (?, ?, ?, ?)",
+                                        (subject_name, source_path, stat.st_mtime_ns, stat.st_size))
+            refreshed.append(subject_name)
+
+        for subject_name in set(known) - set(subjects):
+            with self.connection:
+                self._delete_subject(subject_name)
+        logging.info(f"Metadata store refreshed, {len(refreshed)} of {len(subjects)} subjects re-imported")
+        return refreshed
+
+    def _delete_subject(self, subject_name):
+        for table, column in (("subjects", "name"), ("groups", "subject"), ("fixations", "subject")):
+            self.connection.execute(f"DELETE FROM {table} WHERE {column} = ?", (subject_name,))
+
+    def _insert_subject(self, subject_name, metadata):
+        group_rows = []
+        fixation_rows = []
+        for video in metadata.get("videos", []):
+            trail = video.get("trail")
+            group_rows.append((subject_name, trail, video["group_id"], video["start_frame"], video["end_frame"],
+                               video["total_fixations"], video.get("snippet_path")))
+            for fixation_id, fixation in video["fixations"].items():
+                # older metadata files repeat the fixations of previous groups, keep only the ones inside this group
+                if fixation["start_frame"] < video["start_frame"] or fixation["end_frame"] > video["end_frame"]:
+                    continue
+                fixation_rows.append((subject_name, trail, video["group_id"], fixation_id, fixation["start_frame"],
+                                      fixation["end_frame"], fixation["duration"], fixation["tag"],
+                                      fixation.get("tag_source"), fixation.get("tag_confidence"),
+                                      fixation.get("target_id")))
+        self.connection.executemany("INSERT INTO groups VALUES (?, ?, ?, ?, ?, ?, ?)", group_rows)
+        self.connection.executemany("INSERT INTO fixations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", fixation_rows)
+
+    def query(self, sql, params=()):
+        """
+        Runs any read query on the store.
+        :return: A list of row tuples.
+        """
+        return self.connection.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _where(subjects=None, trail=None):
+        clauses, params = [], []
+        if subjects:
+            clauses.append(f"subject IN ({', '.join('?' * len(subjects))})")
+            params.extend(subjects)
+        if trail is not None:
+            clauses.append("trail = ?")
+            params.append(trail)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def tag_distribution(self, subjects=None, trail=None):
+        """
+        Counts the fixations per tag (untagged fixations are counted under None).
+        :return: A dict of {tag : count}.
+        """
+        where, params = self._where(subjects, trail)
+        return dict(self.query(f"SELECT tag, COUNT(*) FROM fixations{where} GROUP BY tag ORDER BY tag", params))
+
+    def fixation_duration_stats(self, by="trail", subjects=None, trail=None):
+        """
+        Fixation duration statistics (in frames) grouped by a column.
+        :param by: "trail", "subject", "tag" or "group_id".
+        :return: A dict of {value of `by` : {"count", "mean", "std", "min", "max"}}.
+        """
+        if by not in ("trail", "subject", "tag", "group_id"):
+            raise ValueError(f"Cannot group fixation durations by {by}")
+        where, params = self._where(subjects, trail)
+        rows = self.query(f"SELECT {by}, COUNT(*), AVG(duration), AVG(duration * duration), MIN(duration), "
+                          f"MAX(duration) FROM fixations{where} GROUP BY {by} ORDER BY {by}", params)
+        return {key: {"count": count, "mean": mean, "std": max(mean_sq - mean * mean, 0.0) ** 0.5,
+                      "min": min_duration, "max": max_duration}
+                for key, count, mean, mean_sq, min_duration, max_duration in rows}
+
+    def group_summary(self, subjects=None, trail=None):
+        """
+        Per subject and trail: number of groups, number of fixations and the mean group length in frames.
+        :return: A list of (subject, trail, groups, fixations, mean_group_length) tuples.
+        """
+        where, params = self._where(subjects, trail)
+        return self.query(f"SELECT subject, trail, COUNT(*), SUM(total_fixations), "
+                          f"AVG(end_frame - start_frame + 1) FROM groups{where} "
+                          f"GROUP BY subject, trail ORDER BY subject, trail", params)
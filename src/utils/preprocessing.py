@@ -1,4 +1,5 @@
 import os
+from collections import deque
 from ctypes import pythonapi
 from pathlib import Path
 import numpy as np
@@ -12,6 +13,13 @@ from pandas.core.indexing import convert_from_missing_indexer_tuple
 # Our own libraries
 from CoreClasses import DataContainer,ProcessingContainer
 from src.utils.metadata_manager import MetadataManager
+from src.utils.seek_index import SeekIndex, seek_capture
+from src.utils.frame_hooks import create_frame_processors, save_frame_features
+from src.utils.encoders import get_encoder_profile
+from src.utils.frame_store import MANIFEST_EXTENSION, open_frame_store
+from src.utils.frame_sampling import get_frame_sampler
+from src.utils.progress import ProgressReporter
+from src.utils.unity_log import load_unity_log
 
 # Initializing log
 logging.basicConfig(
@@ -19,6 +27,10 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+TARGET_LENGTH = 180  # Length (in frames) of every snippet, this is the neural network input length
+# The trails every subject goes through, in recording order (each has a <subject>_<trail>.txt Unity file)
+UNITY_TRAILS = ["Reference_Calibration_1", "P1", "P1A", "T1", "P2", "P2A", "T2"]
+
 # class Preprocessor:
 #     def __init__(self, input_dir, output_dir=None):
 #         """
@@ -68,16 +80,92 @@ def validate_path(path, error_message):
         logging.error(error_message)
         raise FileNotFoundError(error_message)
 
+def match_pl_uni(subject_name, uni_path, pl_path):
+    """
+    Matches the names of folders and files of Pupil Labs and Unity so that
+    we know which PL folder matches which trial, using the "file modification timestamp" attribute.
+    :param subject_name: The name of the subject (e.g. YM696).
+    :param uni_path: The subject's Unity folder.
+    :param pl_path: The subject's Pupil Labs folder.
+    :return: A dict consisting of: (key : value) = (unity_txt_file_name : corresponding PL folder)
+    """
+
+    # I first create the file name lists, then check if everything is as expected and only then match the files.
+    unity_file_check_list = [f"{subject_name}_{trail}.txt" for trail in UNITY_TRAILS] # these are the expected names
+    unity_file_list = os.listdir(uni_path)
+    if len(unity_file_list) >= len(unity_file_check_list):
+        logging.debug(f"There are more files in {uni_path} than expected.")
+    for file in unity_file_check_list[:]:  # iterate over a copied list
+        if file not in unity_file_list:
+            unity_file_check_list.remove(file)  # modify the original list
+            logging.error(f"There is a missing file or a file with unexpected name in {uni_path}, file name: {file}")
+
+    # Checking if everything is as expected!
+    # First checking for missing files
+    for file in unity_file_check_list: # checking in unity folder
+        try:
+            if file not in unity_file_list: # check for missing files
+                unity_file_check_list.remove(file)
+                raise UserWarning(f"There is a missing file or a file with unexpected name in {uni_path}, file name: {file}")
+        except UserWarning as w:
+            logging.warning(f"There is a missing file or a file with unexpected name in {uni_path}, file name: {file}")
+            logging.debug(f"{file} have been removed from the Unity files list")
+
+    # Now checking if there are enough video dirs in PL's data
+    pl_dir_list = os.listdir(pl_path)
+    try:
+        if len(unity_file_list) > len(pl_dir_list):
+            raise Warning(f"There are not enough video directories in {pl_path}. Check for mismatches.")
+        else:
+            pass
+    except Warning:
+        logging.warning(f"There are not enough video directories in {pl_path}. Check for mismatches.")
+
+    # Extracting the creation timestamp
+    uni_file_dict = {} # a dictionary to save file modification timestamps (key:value)=(file_name:timestamp)
+    for file in unity_file_check_list:
+        file_path = os.path.join(uni_path, file)
+        uni_file_dict[file] = os.path.getmtime(file_path)
+
+    pl_dir_dict = {} # same but (dir_name:timestamps)
+    for _dir in pl_dir_list:
+        pl_file_path = os.path.join(pl_path, _dir)
+        ts_path = os.path.join(pl_file_path, 'world_timestamps.npy') # using the timestamps is ideal because it is created in the same exact moment as the UNI files
+        pl_dir_dict[_dir] = os.path.getmtime(ts_path)
+    # Now creating a dict where (key:value) = (UNI file name:matching PL dir)
+    # I also make sure the dictionaries are sorted by keys (this condition should be satisfied already, but it's kept for better readability
+    uni_file_dict_list = sorted(uni_file_dict.items(), key= lambda item: item[1])
+    pl_dir_dict_list = sorted(pl_dir_dict.items(), key= lambda item: item[1])
+
+    # Creating the synchronized dict:
+    sync_dict = {}
+    try:
+        if len(pl_dir_dict_list) == len(uni_file_dict_list):
+            for i in range(len(uni_file_dict_list)):
+                sync_dict[uni_file_dict_list[i][0]] = pl_dir_dict_list[i][0]
+        else:
+            logging.warning(f"Mismatch between Unity files ({len(uni_file_dict_list)}) and PL directories ({len(pl_dir_dict_list)}).")
+            for i in range(len(uni_file_dict_list)):
+                sync_dict[uni_file_dict_list[i][0]] = pl_dir_dict_list[i][0]
+    except Warning:
+        logging.error(f"Mismatch between Unity files ({len(uni_file_dict_list)}) and PL directories ({len(pl_dir_dict_list)}).")
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+    return sync_dict
+
+
 class VideoPreprocessor: # instead of inheriting ProcessingContainer im passing its attributes directly
-    def __init__(self, parent, trail, metadata_manager):
+    def __init__(self, parent, trail, metadata_manager, uni_pl_sync_dict=None):
         """
         This class holds and utilize data for video processing.
         :param parent: An instance of ProcessingContainer object.
         :param trail: Trail type (e.g. trail B)
         :param metadata_manager: An instance of MetadataManager object.
+        :param uni_pl_sync_dict: The subject's Unity file -> PL folder mapping (match_pl_uni), if it's already known.
         """
         # Creating metadata
         self.metadata_manager = metadata_manager
+        self.trail = trail
         # Creating the paths
         self.subject_name = parent.subject_name
         self.data_path = parent.data_path
@@ -87,7 +175,8 @@ class VideoPreprocessor: # instead of inheriting ProcessingContainer im passing
         self.uni_trail_name = self.subject_name + '_' + trail + '.txt'
         self.uni_trail_path = os.path.join(self.uni_path, self.uni_trail_name) # this is the path to unity's trail file
         # Creating a synchronized dict of matching Unity files and PL directory (for each trail there is one of each)
-        uni_pl_sync_dict = self.match_pl_uni()
+        if uni_pl_sync_dict is None:
+            uni_pl_sync_dict = self.match_pl_uni()
         self.pl_trail_name = uni_pl_sync_dict.get(self.uni_trail_name, None)
         if not self.pl_trail_name:
             logging.error(f"No matching PL directory found for {self.uni_trail_name} in Unity files {self.uni_path}.")
@@ -125,75 +214,17 @@ class VideoPreprocessor: # instead of inheriting ProcessingContainer im passing
 
     def match_pl_uni(self):
         """
-        Matches the names of folders and files of Pupil Labs and Unity so that
-        we know which PL folder matches which trial, using the "file modification timestamp" attribute.
+        Matches the subject's Unity files and PL folders, see the module level match_pl_uni.
         :return: A dict consisting of: (key : value) = (unity_txt_file_name : corresponding PL folder)
         """
+        return match_pl_uni(self.subject_name, self.uni_path, self.pl_path)
 
-        # I first create the file name lists, then check if everything is as expected and only then match the files.
-        unity_file_check_list = [self.subject_name + "_Reference_Calibration_1.txt", self.subject_name + "_P1.txt", self.subject_name + "_P1A.txt", self.subject_name + "_T1.txt", self.subject_name + "_P2.txt", self.subject_name + "_P2A.txt", self.subject_name + "_T2.txt"] # these are the expected names
-        unity_file_list = os.listdir(self.uni_path)
-        if len(unity_file_list) >= len(unity_file_check_list):
-            logging.debug(f"There are more files in {self.uni_path} than expected.")
-        for file in unity_file_check_list[:]:  # iterate over a copied list
-            if file not in unity_file_list:
-                unity_file_check_list.remove(file)  # modify the original list
-                logging.error(f"There is a missing file or a file with unexpected name in {self.uni_path}, file name: {file}")
-
-        # Checking if everything is as expected!
-        # First checking for missing files
-        for file in unity_file_check_list: # checking in unity folder
-            try:
-                if file not in unity_file_list: # check for missing files
-                    unity_file_check_list.remove(file)
-                    raise UserWarning(f"There is a missing file or a file with unexpected name in {self.uni_path}, file name: {file}")
-            except UserWarning as w:
-                logging.warning(f"There is a missing file or a file with unexpected name in {self.uni_path}, file name: {file}")
-                logging.debug(f"{file} have been removed from the Unity files list")
-
-        # Now checking if there are enough video dirs in PL's data
-        pl_dir_list = os.listdir(self.pl_path)
-        try:
-            if len(unity_file_list) > len(pl_dir_list):
-                raise Warning(f"There are not enough video directories in {self.pl_path}. Check for mismatches.")
-            else:
-                pass
-        except Warning:
-            logging.warning(f"There are not enough video directories in {self.pl_path}. Check for mismatches.")
-
-        # Extracting the creation timestamp
-        uni_file_dict = {} # a dictionary to save file modification timestamps (key:value)=(file_name:timestamp)
-        for file in unity_file_check_list:
-            file_path = os.path.join(self.uni_path, file)
-            uni_file_dict[file] = os.path.getmtime(file_path)
-
-        pl_dir_dict = {} # same but (dir_name:timestamps)
-        for _dir in pl_dir_list:
-            pl_file_path = os.path.join(self.pl_path, _dir)
-            ts_path = os.path.join(pl_file_path, 'world_timestamps.npy') # using the timestamps is ideal because it is created in the same exact moment as the UNI files
-            pl_dir_dict[_dir] = os.path.getmtime(ts_path)
-        # Now creating a dict where (key:value) = (UNI file name:matching PL dir)
-        # I also make sure the dictionaries are sorted by keys (this condition should be satisfied already, but it's kept for better readability
-        uni_file_dict_list = sorted(uni_file_dict.items(), key= lambda item: item[1])
-        pl_dir_dict_list = sorted(pl_dir_dict.items(), key= lambda item: item[1])
-
-        # Creating the synchronized dict:
-        sync_dict = {}
-        try:
-            if len(pl_dir_dict_list) == len(uni_file_dict_list):
-                for i in range(len(uni_file_dict_list)):
-                    sync_dict[uni_file_dict_list[i][0]] = pl_dir_dict_list[i][0]
-            else:
-                logging.warning(f"Mismatch between Unity files ({len(uni_file_dict_list)}) and PL directories ({len(pl_dir_dict_list)}).")
-                for i in range(len(uni_file_dict_list)):
-                    sync_dict[uni_file_dict_list[i][0]] = pl_dir_dict_list[i][0]
-        except Warning:
-            logging.error(f"Mismatch between Unity files ({len(uni_file_dict_list)}) and PL directories ({len(pl_dir_dict_list)}).")
-        except Exception as e:
-            logging.error(f"An error occurred: {e}")
-        return sync_dict
-
-
+    def load_unity_log(self, use_cache=True):
+        """
+        Loads the trail's Unity log as typed columns (cached in REC_ET/UNI_cache), see unity_log.UnityLog.
+        :return: A UnityLog.
+        """
+        return load_unity_log(self.uni_trail_path, use_cache)
 
     def _get_fixations_ts(self):
         """
@@ -213,7 +244,7 @@ class VideoPreprocessor: # instead of inheriting ProcessingContainer im passing
         return fixations_dict
 
     @staticmethod
-    def _merge_neighboring_fixations(fixation_dict, threshold=30):
+    def _merge_neighboring_fixations(fixation_dict, threshold=30, target_length=TARGET_LENGTH):
         """
         This is an internal function designed to merge consecutive fixations that are close in time, based on the following logic:
         If the end of fixation(i) is within a specified threshold (in frames) from the start of fixation(i+1), the fixations are merged.
@@ -223,98 +254,160 @@ class VideoPreprocessor: # instead of inheriting ProcessingContainer im passing
         If adding a fixation exceeds the 180 frames mark, it will not be included in the group. The remaining frames required to reach 180 will be padded with black frames later. This ensures a consistent snippet length of 180 frames across the entire project.
         :param fixation_dict: fixation dictionary in the correct format
         :param threshold: the frame threshold that below it fixations will be grouped.
+        :param target_length: the snippet length (180 frames by default), groups never grow past it.
         :return: merged fixations dictionary of {group id : (start frame, end frame, amount of fixations)}.
         """
-        merged_fixations_dict = {}
-        snippet_fixed_length = 180
+        fixations = ((idx, *fixation_dict[idx]) for idx in range(len(fixation_dict)))
+        merged_groups = VideoPreprocessor._iter_merged_groups(fixations, threshold, target_length)
+        return {group_id: (start_frame, end_frame, len(group_fixations))
+                for group_id, (start_frame, end_frame, group_fixations) in enumerate(merged_groups)}
+
+    @staticmethod
+    def _iter_merged_groups(fixations, threshold=30, target_length=TARGET_LENGTH):
+        """
+        The streaming version of _merge_neighboring_fixations (same grouping logic), it holds only the current group.
+        A group is yielded as soon as the next fixation can't join it, so the caller can process it right away.
+        Like _merge_neighboring_fixations, a last fixation that doesn't join the group before it is left out.
+        :param fixations: An iterable of (fixation id, start frame, end frame), sorted by time.
+        :param threshold: the frame threshold that below it fixations will be grouped.
+        :param target_length: the snippet length, groups never grow past it.
+        :return: A generator of (start frame, end frame, list of the group's (fixation id, start frame, end frame)).
+        """
+        group = None
         current_snippet_length = 0
-        fixations_amount = 0
-        group_id = 0
-        idx = 0
-        while idx < len(fixation_dict.keys()) - 1:
-            # current fixation data
-            start_frame_current_fixation = fixation_dict[idx][0]
-            end_frame_current_fixation = fixation_dict[idx][1]
-            # next fixation data
-            start_frame_next_fixation = fixation_dict[idx + 1][0]
-            end_frame_next_fixation = fixation_dict[idx + 1][1]
-
-            delta_frames = start_frame_next_fixation - end_frame_current_fixation
-
-            if current_snippet_length == 0:
-                fixation_length = end_frame_current_fixation - start_frame_current_fixation + 1 # unit is frames
-                merged_fixations_dict[group_id] = (start_frame_current_fixation, end_frame_current_fixation, fixations_amount+1)
-                current_snippet_length = fixation_length
-                fixations_amount += 1
-                # idx += 1
-                continue
-            elif delta_frames <= threshold:  # add fixations within the threshold
-                fixation_length = end_frame_next_fixation - end_frame_current_fixation + 1
-                snippet_length_if_grouped = current_snippet_length + fixation_length
-                if snippet_length_if_grouped <= snippet_fixed_length:
-                    merged_fixations_dict[group_id] = (merged_fixations_dict[group_id][0], end_frame_next_fixation, fixations_amount+1)
-                    current_snippet_length = merged_fixations_dict[group_id][1] - merged_fixations_dict[group_id][0]
-                    fixations_amount += 1
-                    idx += 1
-                elif snippet_length_if_grouped > snippet_fixed_length and idx + 1 == len(fixation_dict.keys()):
-                    # this handles the case in which the fixation group would be longer than 180 frames, but the next fixation would be the last fixation
-                    group_id += 1
-                    fixations_amount = 1
-                    merged_fixations_dict[group_id] = (start_frame_next_fixation, end_frame_next_fixation, fixations_amount+1)
-                    idx += 1
-                else:  # (if this snippet length exceeds 180 frames and is not the last fixation)
-                    group_id += 1  # creates key for the next fixations group in the merged dictionary
-                    fixations_amount = 0
-                    current_snippet_length = 0
-                    idx += 1
-                    continue
-            else:  # (this code block is accessed only if there are no temporal close fixations)
-                group_id += 1
-                fixations_amount = 0
-                current_snippet_length = 0
-                idx += 1
+        current_fixation = None
+        for next_fixation in fixations:
+            if current_fixation is None:
+                current_fixation = next_fixation
                 continue
-        return merged_fixations_dict
-
-    def create_metadata_for_subject(self, fixation_dict, merged_fixation_dict):
+            if group is None:  # the current fixation opens a new group
+                group = [current_fixation[1], current_fixation[2], [current_fixation]]
+                current_snippet_length = current_fixation[2] - current_fixation[1] + 1 # unit is frames
+
+            delta_frames = next_fixation[1] - current_fixation[2]
+            fixation_length = next_fixation[2] - current_fixation[2] + 1
+            if delta_frames <= threshold and current_snippet_length + fixation_length <= target_length:
+                group[1] = next_fixation[2]
+                group[2].append(next_fixation)
+                current_snippet_length = group[1] - group[0]
+            else:  # too far apart, or the group would be longer than 180 frames
+                yield tuple(group)
+                group = None
+            current_fixation = next_fixation
+        if group is not None:
+            yield tuple(group)
+
+    def _iter_fixations(self, chunksize=10000):
         """
-
-        :param fixation_dict:
-        :param merged_fixation_dict:
-        :return:
+        The streaming version of _get_fixations_ts, reads the fixations csv in chunks.
+        Like _get_fixations_ts, the last 3 rows are left out.
+        :param chunksize: Number of csv rows read at once.
+        :return: A generator of (fixation id, start frame, end frame).
+        """
+        held_back = deque()
+        fixation_id = 0
+        for chunk in pd.read_csv(self.pl_fixations, usecols=['start_frame_index', 'end_frame_index'],
+                                 chunksize=chunksize):
+            for start_frame, end_frame in zip(chunk['start_frame_index'].astype(int),
+                                              chunk['end_frame_index'].astype(int)):
+                held_back.append((fixation_id, start_frame, end_frame))
+                fixation_id += 1
+                if len(held_back) > 3:
+                    yield held_back.popleft()
+
+    def _group_metadata(self, group_idx, start_frame, end_frame, group_fixations, virtual=False):
         """
-        fixation_dict_length = len(fixation_dict)
-        fixation_groups_amount = len(merged_fixation_dict)
+        Creates the metadata of a single fixation group.
+        :param group_idx: Number of group (int).
+        :param group_fixations: A list of the group's (fixation id, start frame, end frame).
+        :param virtual: The group is read from the source video on purpose, it gets "virtual": True so it isn't
+                        taken for a snippet that is missing.
+        :return: The group metadata dict (as stored in the subject's metadata["videos"]).
+        """
+        group_metadata = {
+            "group_id" : f"group_{group_idx}",
+            "trail" : self.trail,
+            "source_video" : self.vid_path, # lets the group be read as a virtual snippet without a snippet file
+            "start_frame" : int(start_frame),
+            "end_frame" : int(end_frame),
+            "total_fixations" : len(group_fixations),
+            "fixations" : {
+                f"fixation_{fix_id}": {
+                    "start_frame": int(fix_start),
+                    "end_frame": int(fix_end),
+                    "duration": int(fix_end - fix_start + 1),
+                    "tag": None, # initialize the tag with None, update later
+                } for fix_id, fix_start, fix_end in group_fixations
+            },
+        }
+        if virtual:
+            group_metadata["virtual"] = True
+        return group_metadata
+
+    def create_metadata_for_subject(self, fixation_dict, merged_fixation_dict, replace=False, virtual=False):
+        """
+        Adds the metadata of every fixation group (and the fixations inside it) to the subject's metadata.
+        :param fixation_dict: fixation dictionary (outputted by _get_fixations_ts function)
+        :param merged_fixation_dict: merged fixations dictionary (outputted by _merge_neighboring_fixations function)
+        :param replace: Replace the trail's earlier groups (in one commit) instead of appending, so running the
+                        trail again (e.g. after a cancelled trimming) doesn't duplicate its groups.
+        :param virtual: The groups are virtual snippets on purpose (no snippet files will be written for them).
+        :return: None
+        """
+        groups = []
         group_start_fixation_id = 0
-        group_end_fixation_id = 0
-        group_fixations = {}
-        group_metadata = {}
         for key, value in merged_fixation_dict.items():
-            group_end_fixation_id += value[2] # this is the amount of fixations in the group
-            for fix_id in range(group_start_fixation_id,group_end_fixation_id):
-                group_fixations[f"fixation_{fix_id}"] = {
-                    "start_frame": int(fixation_dict[fix_id][0]),
-                    "end_frame": int(fixation_dict[fix_id][1]),
-                    "duration": int(fixation_dict[fix_id][1] - fixation_dict[fix_id][0] + 1),
-                    "tag": None, # initialize the tag with None, update later
-                }
-            group_metadata = {
-                "group_id" : f"group_{key}",
-                "start_frame" : int(merged_fixation_dict[key][0]),
-                "end_frame" : int(merged_fixation_dict[key][1]),
-                "total_fixations" : int(merged_fixation_dict[key][2]),
-                "fixations" : group_fixations
-            }
-            self.metadata_manager.add_video_snippet(subject_name=self.subject_name, group_data=group_metadata)
-            group_start_fixation_id += value[2]
+            group_end_fixation_id = group_start_fixation_id + value[2] # value[2] is the amount of fixations in the group
+            group_fixations = [(fix_id, *fixation_dict[fix_id]) for fix_id in range(group_start_fixation_id, group_end_fixation_id)]
+            group_metadata = self._group_metadata(key, value[0], value[1], group_fixations, virtual)
+            if replace:
+                groups.append(group_metadata)
+            else:
+                self.metadata_manager.add_video_snippet(subject_name=self.subject_name, group_data=group_metadata)
+            group_start_fixation_id = group_end_fixation_id
+        if replace:
+            self.metadata_manager.replace_video_snippets(self.subject_name, self.trail, groups)
 
+    def _count_frames(self, trimmer=None):
+        """
+        :return: The number of frames of the recording (from the container's header).
+        """
+        if trimmer is not None:
+            return trimmer.num_frames
+        capture = cv2.VideoCapture(self.vid_path)
+        try:
+            return int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        finally:
+            capture.release()
+
+    def _remove_stale_snippets(self, snippet_paths):
+        """
+        Removes the snippet files (and their sidecars, e.g. snippet_3.mp4.seekidx.npy) in the trail's snippet
+        folder that aren't in snippet_paths, i.e. the ones no group of the trail's new metadata points at.
+        :return: The number of removed files.
+        """
+        kept_names = {os.path.basename(path) for path in snippet_paths}
+        removed = 0
+        for file_name in os.listdir(self.vid_snippets_path):
+            path = os.path.join(self.vid_snippets_path, file_name)
+            # the file itself or everything before one of its dots (a sidecar) is a kept snippet
+            prefixes = [file_name] + [file_name[:i] for i, char in enumerate(file_name) if char == "."]
+            if not file_name.startswith("snippet_") or not os.path.isfile(path) or \
+                    any(prefix in kept_names for prefix in prefixes):
+                continue
+            os.remove(path)
+            removed += 1
+        if removed:
+            logging.info(f"Removed {removed} stale snippet files of trail {self.trail} for subject {self.subject_name}")
+        return removed
 
     def _create_out_path_for_video_snippets(self):
         """
-        Creates folder inside self.data_path.
+        Creates folder inside self.data_path. Every trail gets its own folder, so the snippets (and features) of
+        the subject's trails don't overwrite each other.
         :return: None
         """
-        path = os.path.join(self.out_path, self.subject_name, 'video_snippets')
+        path = os.path.join(self.out_path, self.subject_name, 'video_snippets', self.trail)
         try:
             os.makedirs(path, exist_ok=True)
             self.vid_snippets_path = path
@@ -322,65 +415,289 @@ class VideoPreprocessor: # instead of inheriting ProcessingContainer im passing
         except OSError as e:
             logging.error(f"Unable to create folder for video snippets in '{path}': {e}")
 
-    def trim_vid_around_fixations(self, merged_fixations_dict):
+    def trim_vid_around_fixations(self, merged_fixations_dict, frame_processors=None, encoder=None, frame_store=None,
+                                  progress_callback=None, cancel_event=None, sampler=None):
         """
         This function is used to trim the full videos around fixations. The trimming is exactly around fixations.
         No extra frames are taken.
         :param merged_fixations_dict: A dictionary containing merged fixations (outputted by _merge_neighboring_fixations function)
-        :return: A folder with video snippets that are trimmed around fixations frame indices.
+        :param frame_processors: Names (see frame_hooks.FRAME_PROCESSORS) and/or FrameProcessor instances that run
+                                 on every decoded frame. Their outputs are saved in the snippets' features folder.
+        :param encoder: Name of the snippets' encoder profile (see encoders.ENCODER_PROFILES), default fast_mpeg4.
+        :param frame_store: A FrameStore or its root folder. If given, every unique frame is stored once and the
+                            snippets are manifests of frame references (see frame_store.FrameStore).
+        :param progress_callback: Called after every snippet with a progress dict (see progress.ProgressReporter).
+        :param cancel_event: A threading.Event, once it is set the trimming stops after the current snippet. The
+                             groups that weren't trimmed keep snippet_path None (SnippetVerifier reports them as
+                             missing, they can still be read from the source video).
+        :param sampler: A frame sampler or its name (see frame_sampling.FRAME_SAMPLERS), e.g. every third frame.
+                        Sampled groups get frame_indices, snippet_length and sampling in their metadata.
+        :return: The number of snippets written, in a folder with video snippets that are trimmed around fixations frame indices.
         """
-        TARGET_LENGTH = 180  # Length for neural network input
-
         # consts and inits
         num_of_fixations = len(merged_fixations_dict)
+        trimmer = SnippetTrimmer(self.vid_path, frame_processors, encoder, frame_store, sampler)
+        progress = ProgressReporter(progress_callback, total_groups=num_of_fixations)
+        frames_done = 0
+        written = 0
         try:
-            full_video = cv2.VideoCapture(self.vid_path)
-            fps = int(full_video.get(cv2.CAP_PROP_FPS))
-            width = int(full_video.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(full_video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-
-            # pain loop. each fixation group is processed frame-by-frame in a nested loop
+            # each fixation group is processed frame-by-frame by the trimmer
             for fixation_group in range(num_of_fixations):
+                if cancel_event is not None and cancel_event.is_set():
+                    logging.info(f"Trimming cancelled after {written}/{num_of_fixations} snippets.")
+                    break
                 if fixation_group == 0: # create output folder in case this is the first snippet
                     self._create_out_path_for_video_snippets()
 
-                # params for current fixation group
                 start_frame = merged_fixations_dict[fixation_group][0]
                 end_frame = merged_fixations_dict[fixation_group][1]
-                snippet_length = end_frame - start_frame + 1
-                padding_needed = TARGET_LENGTH - snippet_length
-                if padding_needed < 0:
-                    logging.error(f"Snippet {fixation_group} length is more than 180 frames!")
-                    raise ValueError(f"Snippet length is more than 180 frames!")
-
-                # set video position and create snippet path
-                full_video.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-                snippet_path = os.path.join(self.vid_snippets_path, f"snippet_{fixation_group}.mp4")
-                vid_snippet = cv2.VideoWriter(snippet_path, fourcc, fps, (width, height))
-                self.metadata_manager.update_fixation_snippet_path(self.subject_name, snippet_path, fixation_group)
-
-                # write actual frames
-                for frame_number in range(start_frame, end_frame + 1):
-                    ret, frame = full_video.read()
-                    if not ret:
-                        logging.warning(f"Frame {frame_number} could not be read. Skipping.")
-                        break
-                    vid_snippet.write(frame)
-
-                # write padding frames (black frames)
-                black_frame = np.zeros((height, width, 3), dtype=np.uint8)
-                logging.debug(f"Padding snippet {fixation_group} with {padding_needed} black frames.")
-                if padding_needed > 0:
-                    for pad in range(padding_needed):
-                        vid_snippet.write(black_frame)
-
-                vid_snippet.release()
-                logging.debug(f"Video snippet {fixation_group} saved successfully at {snippet_path}.")
+                snippet_path = os.path.join(self.vid_snippets_path, f"snippet_{fixation_group}{trimmer.snippet_extension}")
+                frame_indices = trimmer.write_snippet(snippet_path, start_frame, end_frame)
+                sampling = None if trimmer.sampler.is_full else \
+                    trimmer.sampler.group_metadata(frame_indices, trimmer.output_length)
+                self.metadata_manager.update_fixation_snippet_path(self.subject_name, snippet_path, fixation_group,
+                                                                   trail=self.trail, fields=sampling)
+                written += 1
+                frames_done += end_frame - start_frame + 1
+                progress.update(written, frames_done, end_frame)
+        finally:
+            trimmer.release()
+        if written:
+            trimmer.save_features(self.vid_snippets_path)
+        if written == num_of_fixations:
+            logging.info("All video snippets created successfully.")
+        return written
+
+    def process_streaming(self, threshold=30, chunksize=10000, metadata_batch=50, write_snippets=True,
+                          frame_processors=None, encoder=None, frame_store=None, progress_callback=None,
+                          cancel_event=None, sampler=None, abort_event=None):
+        """
+        Runs the whole pipeline (fixations -> groups -> metadata -> snippets) as a stream: the fixations, frames
+        and snippets are handled one group at a time, so their memory use stays flat no matter how long the
+        recording is. Each group is trimmed as soon as it is complete, and the metadata is written in batches of
+        metadata_batch groups (with the snippet paths already set). The metadata is not streamed: every batch
+        commit loads and rewrites the subject's metadata file, so its cost grows with the number of groups (use
+        metadata_batch=None, one commit per trail, for long recordings). Once the metadata is written, snippet
+        files of the trail that no group points at anymore (e.g. from an earlier, longer run) are removed.
+        :param threshold: the frame threshold that below it fixations will be grouped.
+        :param chunksize: Number of fixation csv rows read at once.
+        :param metadata_batch: Number of groups collected before they are written to the metadata. The trail's earlier
+                               groups are removed once before the first group, so running a trail again doesn't
+                               add its groups twice. None writes the trail's metadata in one commit at the end,
+                               replacing the trail's earlier groups (nothing is written if the processing fails).
+        :param write_snippets: If False no snippet files are written, the groups are marked virtual and are read as
+                               virtual snippets.
+        :param frame_processors: Per-frame processors run while trimming, see trim_vid_around_fixations.
+        :param encoder: Name of the snippets' encoder profile, see trim_vid_around_fixations.
+        :param frame_store: Write the snippets as manifests into a frame store, see trim_vid_around_fixations.
+        :param progress_callback: Called after every group with a progress dict (see progress.ProgressReporter),
+                                  the fraction done is the position in the recording.
+        :param cancel_event: A threading.Event, once it is set the processing stops after the current group. The
+                             groups done so far are written to the metadata (with metadata_batch=None too, they
+                             replace the trail's earlier groups), so the metadata matches the snippets on disk.
+        :param sampler: A frame sampler or its name, see trim_vid_around_fixations. Without snippets the sampled
+                        frame indices are still written to the metadata (for the virtual snippets).
+        :param abort_event: A threading.Event that is set once this run's results aren't wanted anymore (e.g. its job
+                            was reclaimed by another worker, see job_queue). Unlike cancel_event, nothing more is
+                            written to the metadata: the processing stops before the next group and the groups that
+                            weren't committed yet are dropped. It is checked before every metadata commit.
+        :return: The number of groups.
+        """
+        def aborted():
+            return abort_event is not None and abort_event.is_set()
+
+        sampler = get_frame_sampler(sampler)
+        trimmer = None
+        batch = []
+        written_paths = set()
+        num_of_groups = 0
+        frames_done = 0
+        try:
+            if write_snippets:
+                self._create_out_path_for_video_snippets()
+                trimmer = SnippetTrimmer(self.vid_path, frame_processors, encoder, frame_store, sampler)
+            progress = ProgressReporter(progress_callback, total_frames=self._count_frames(trimmer)
+                                        if progress_callback is not None else None)
+            if metadata_batch is not None:
+                self.metadata_manager.remove_video_snippets(self.subject_name, self.trail)
+            fixations = self._iter_fixations(chunksize)
+            for group_idx, (start_frame, end_frame, group_fixations) in enumerate(self._iter_merged_groups(fixations, threshold)):
+                if cancel_event is not None and cancel_event.is_set():
+                    logging.info(f"Processing of trail {self.trail} cancelled after {num_of_groups} groups.")
+                    break
+                if aborted():
+                    break
+                group_metadata = self._group_metadata(group_idx, start_frame, end_frame, group_fixations,
+                                                      virtual=trimmer is None)
+                fixation_ranges = [(fix_start, fix_end) for _, fix_start, fix_end in group_fixations]
+                if trimmer is not None:
+                    snippet_path = os.path.join(self.vid_snippets_path, f"snippet_{group_idx}{trimmer.snippet_extension}")
+                    frame_indices = trimmer.write_snippet(snippet_path, start_frame, end_frame, fixation_ranges)
+                    group_metadata["snippet_path"] = snippet_path
+                    written_paths.add(snippet_path)
+                elif not sampler.is_full:
+                    frame_indices = sampler.select(start_frame, end_frame, fixation_ranges)
+                if not sampler.is_full:
+                    group_metadata.update(sampler.group_metadata(frame_indices, sampler.snippet_length(TARGET_LENGTH)))
+                batch.append(group_metadata)
+                num_of_groups += 1
+                frames_done += end_frame - start_frame + 1
+                progress.update(num_of_groups, frames_done, end_frame)
+                if metadata_batch is not None and len(batch) >= metadata_batch and not aborted():
+                    self.metadata_manager.add_video_snippets(self.subject_name, batch)
+                    batch = []
+            if metadata_batch is None and not aborted():
+                self.metadata_manager.replace_video_snippets(self.subject_name, self.trail, batch)
+                batch = []
         finally:
-            full_video.release()
-        logging.info("All video snippets created successfully.")
+            # groups that are already trimmed must not be lost from the metadata, unless the run was aborted
+            if batch and metadata_batch is not None and not aborted():
+                self.metadata_manager.add_video_snippets(self.subject_name, batch)
+            if trimmer is not None:
+                trimmer.release()
+        if aborted():
+            logging.warning(f"Processing of trail {self.trail} of subject {self.subject_name} aborted after "
+                            f"{num_of_groups} groups, {len(batch)} of them were not written to the metadata.")
+            return num_of_groups
+        if trimmer is not None:
+            trimmer.save_features(self.vid_snippets_path)
+            self._remove_stale_snippets(written_paths)
+        logging.info(f"Streamed {num_of_groups} fixation groups for subject {self.subject_name}")
+        return num_of_groups
+
+
+class SnippetTrimmer:
+    def __init__(self, vid_path, frame_processors=None, encoder=None, frame_store=None, sampler=None):
+        """
+        Writes fixation group snippets out of one full video. It keeps the video open between snippets and tracks
+        its position, so groups in time order are read with (almost) no seeking.
+        :param vid_path: Path to the full video (world.mp4).
+        :param frame_processors: Names and/or FrameProcessor instances, each is called once with every decoded frame.
+        :param encoder: Encoder profile name or EncoderProfile of the snippets (default: fast_mpeg4, cv2's mp4v).
+        :param frame_store: A FrameStore (or its root folder). If given, the snippets are manifests that reference
+                            the store's frames instead of videos, see frame_store.FrameStore.
+        :param sampler: A FrameSampler or its name (see frame_sampling.FRAME_SAMPLERS), default every frame. Frames
+                        the sampler skips are only grabbed (not converted, processed or encoded).
+        """
+        self.vid_path = vid_path
+        self.full_video = cv2.VideoCapture(vid_path)
+        self.fps = int(self.full_video.get(cv2.CAP_PROP_FPS))
+        self.width = int(self.full_video.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.full_video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.num_frames = int(self.full_video.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.encoder = get_encoder_profile(encoder)
+        self.frame_store = open_frame_store(frame_store)
+        self.sampler = get_frame_sampler(sampler)
+        self.output_length = self.sampler.snippet_length(TARGET_LENGTH)  # frames of every snippet, padding included
+        self.seek_index = SeekIndex.load_or_build(vid_path)
+        self.position = 0  # the frame full_video.read() returns next
+        self.black_frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self.frame_processors = create_frame_processors(frame_processors)
+        self.processed_frames = []  # recording frame index of every frame the processors got
+
+    @property
+    def snippet_extension(self):
+        return MANIFEST_EXTENSION if self.frame_store is not None else self.encoder.extension
+
+    def _read_frames(self, start_frame, end_frame, frame_indices=None):
+        """
+        Decodes frames start_frame..end_frame of the video and runs the frame processors on them.
+        :param frame_indices: Only these frames (sorted, within the range) are returned, the others are grabbed.
+        :return: A generator of (frame index, BGR frame), it stops early if a frame can't be read.
+        """
+        wanted = None
+        if frame_indices is not None:
+            if not len(frame_indices):
+                return
+            wanted = set(int(frame_index) for frame_index in frame_indices)
+            start_frame, end_frame = int(frame_indices[0]), int(frame_indices[-1])
+        # set video position (from the closest keyframe, or by reading forward)
+        seek_capture(self.full_video, self.seek_index, self.position, start_frame)
+        self.position = start_frame
+        for frame_number in range(start_frame, end_frame + 1):
+            if wanted is not None and frame_number not in wanted:
+                # advance without converting the frame
+                if not self.full_video.grab():
+                    logging.warning(f"Frame {frame_number} could not be read. Skipping.")
+                    self.position = -1
+                    return
+                self.position = frame_number + 1
+                continue
+            ret, frame = self.full_video.read()
+            if not ret:
+                logging.warning(f"Frame {frame_number} could not be read. Skipping.")
+                self.position = -1  # unknown, the next snippet seeks from its keyframe
+                return
+            self.position = frame_number + 1
+            # neighbouring groups can share a frame, the processors get each frame once
+            if self.frame_processors and (not self.processed_frames or frame_number > self.processed_frames[-1]):
+                for processor in self.frame_processors:
+                    processor(frame, frame_number)
+                self.processed_frames.append(frame_number)
+            yield frame_number, frame
+
+    def write_snippet(self, snippet_path, start_frame, end_frame, fixations=None):
+        """
+        Writes the sampler's frames of start_frame..end_frame (every frame by default) into snippet_path and pads it
+        with black frames up to output_length frames (TARGET_LENGTH without a sampler).
+        :param fixations: The group's fixations as (start frame, end frame) pairs, for the fixation centred sampler.
+        :return: The recording frame index of every real frame written.
+        """
+        frame_indices = self.sampler.select(start_frame, end_frame, fixations)
+        padding_needed = self.output_length - len(frame_indices)
+        if padding_needed < 0:
+            logging.error(f"Snippet {snippet_path} length is more than {self.output_length} frames!")
+            raise ValueError(f"Snippet length is more than {self.output_length} frames!")
+        read_indices = None if self.sampler.is_full else frame_indices
+        if self.frame_store is not None:
+            return self._write_manifest(snippet_path, start_frame, end_frame, read_indices, frame_indices)
+
+        written = []
+        vid_snippet = self.encoder.open_writer(snippet_path, self.fps, self.width, self.height)
+        try:
+            # write actual frames
+            for frame_number, frame in self._read_frames(start_frame, end_frame, read_indices):
+                vid_snippet.write(frame)
+                written.append(frame_number)
+
+            # write padding frames (black frames)
+            logging.debug(f"Padding snippet {snippet_path} with {padding_needed} black frames.")
+            for pad in range(padding_needed):
+                vid_snippet.write(self.black_frame)
+        finally:
+            vid_snippet.release()
+        logging.debug(f"Video snippet saved successfully at {snippet_path}.")
+        return written
+
+    def _write_manifest(self, manifest_path, start_frame, end_frame, read_indices, frame_indices):
+        """
+        Stores the snippet's frames that the frame store doesn't have yet and writes the snippet's manifest.
+        When every frame is already stored (and there are no frame processors) the video isn't decoded at all.
+        :return: The recording frame index of every frame in the manifest.
+        """
+        store = self.frame_store
+        source_id = store.recording_id(self.vid_path)
+        frame_indices = [int(frame_number) for frame_number in frame_indices]
+        stored = all(store.has(store.frame_key(source_id, frame_number)) for frame_number in frame_indices)
+        if self.frame_processors or not stored:
+            frame_indices = []
+            for frame_number, frame in self._read_frames(start_frame, end_frame, read_indices):
+                store.put(store.frame_key(source_id, frame_number), frame)
+                frame_indices.append(frame_number)
+        padding_needed = self.output_length - len(frame_indices)  # like the video snippets, unread frames are dropped
+        store.write_manifest(manifest_path, self.vid_path, frame_indices, padding_needed, self.width, self.height,
+                             self.fps, encoder=self.encoder.name)
+        logging.debug(f"Snippet manifest saved successfully at {manifest_path}.")
+        return frame_indices
+
+    def save_features(self, out_dir):
+        """
+        Saves the outputs of the frame processors (if any) in out_dir/features.
+        """
+        return save_frame_features(self.frame_processors, self.processed_frames, out_dir)
 
+    def release(self):
+        self.full_video.release()
 
 
 
@@ -0,0 +1,60 @@
+import time
+import logging
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+class ProgressReporter:
+    def __init__(self, callback, total_groups=None, total_frames=None):
+        """
+        Turns "this many groups/frames are done" into progress reports with speed and ETA for a progress_callback.
+        The fraction done is taken from the groups when their number is known up front, otherwise from the
+        position in the recording (the streaming pipeline doesn't know how many groups there will be).
+        :param callback: Called with a progress dict after every group (see update), may be None.
+        :param total_groups: Number of groups that will be processed, if known.
+        :param total_frames: Number of frames of the recording, used with the position of the last group.
+        """
+        self.callback = callback
+        self.total_groups = total_groups
+        self.total_frames = total_frames
+        self.start_time = time.perf_counter()
+
+    def update(self, groups_done, frames_done, position=None):
+        """
+        :param groups_done: Number of groups processed so far.
+        :param frames_done: Number of source frames processed so far.
+        :param position: Last recording frame processed so far.
+        :return: The progress dict: group, total_groups, frames, fps, fraction and eta_s (None when unknown).
+        """
+        elapsed = time.perf_counter() - self.start_time
+        if self.total_groups:
+            fraction = groups_done / self.total_groups
+        elif self.total_frames and position is not None:
+            fraction = min((position + 1) / self.total_frames, 1.0)
+        else:
+            fraction = None
+        progress = {
+            "group": groups_done,
+            "total_groups": self.total_groups,
+            "frames": frames_done,
+            "fps": frames_done / elapsed if elapsed > 0 else 0.0,
+            "fraction": fraction,
+            "eta_s": elapsed * (1 - fraction) / fraction if fraction else None,
+        }
+        if self.callback is not None:
+            self.callback(progress)
+        return progress
+
+
+def format_progress(progress):
+    """
+    :return: A one line description of a progress dict, e.g. "group 12/40, 215.3 fps, ETA 0:41".
+    """
+    total = f"/{progress['total_groups']}" if progress["total_groups"] else ""
+    eta = progress["eta_s"]
+    eta_text = f"{int(eta // 60)}:{int(eta % 60):02d}" if eta is not None else "?"
+    return f"group {progress['group']}{total}, {progress['fps']:.1f} fps, ETA {eta_text}"
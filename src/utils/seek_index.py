@@ -0,0 +1,137 @@
+import os
+import logging
+import numpy as np
+import av
+import cv2
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+SEEK_INDEX_VERSION = 1
+
+
+def seek_index_path(video_path):
+    """
+    Returns the path of a video's seek index sidecar (e.g. world.mp4 -> world.mp4.seekidx.npy).
+    """
+    return f"{video_path}.seekidx.npy"
+
+
+class SeekIndex:
+    def __init__(self, pts, keyframe_index):
+        """
+        Frame index -> presentation timestamp -> nearest preceding keyframe, for one video.
+        Use SeekIndex.load_or_build rather than creating it directly.
+        :param pts: int array, the PTS of every frame in presentation order (in the stream's time base).
+        :param keyframe_index: int array, for every frame the index of the last keyframe at or before it.
+        """
+        self.pts = pts
+        self.keyframe_index = keyframe_index
+
+    def __len__(self):
+        return len(self.pts)
+
+    def keyframe_before(self, frame_index):
+        """
+        :return: The index of the last keyframe at or before frame_index (decoding has to start there).
+        """
+        frame_index = min(max(int(frame_index), 0), len(self.keyframe_index) - 1)
+        return int(self.keyframe_index[frame_index])
+
+    @classmethod
+    def build(cls, video_path):
+        """
+        Scans the video's packets once (demuxing only, nothing is decoded) and builds its seek index.
+        """
+        with av.open(video_path) as container:
+            stream = container.streams.video[0]
+            packet_pts, packet_is_key = [], []
+            for packet in container.demux(stream):
+                if packet.pts is None:  # the flushing packet at the end of the stream
+                    continue
+                packet_pts.append(packet.pts)
+                packet_is_key.append(packet.is_keyframe)
+        # packets come in decode order, frame indices are in presentation order
+        order = np.argsort(np.asarray(packet_pts, dtype=np.int64), kind="stable")
+        pts = np.asarray(packet_pts, dtype=np.int64)[order]
+        is_key = np.asarray(packet_is_key, dtype=bool)[order]
+        if len(is_key):
+            is_key[0] = True  # decoding always starts at the first frame
+        frame_numbers = np.arange(len(pts), dtype=np.int64)
+        keyframe_index = np.maximum.accumulate(np.where(is_key, frame_numbers, 0))
+        return cls(pts, keyframe_index)
+
+    def save(self, video_path):
+        """
+        Saves the index as a sidecar .npy. The first row holds the version and the video's size and modification
+        time, the other rows hold (frame index, pts, keyframe index).
+        """
+        stat = os.stat(video_path)
+        header = np.array([[SEEK_INDEX_VERSION, stat.st_size, stat.st_mtime_ns]], dtype=np.int64)
+        rows = np.column_stack([np.arange(len(self.pts), dtype=np.int64), self.pts, self.keyframe_index])
+        path = seek_index_path(video_path)
+        temp_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(temp_path, np.concatenate([header, rows.reshape(-1, 3)]))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, video_path):
+        """
+        Loads the sidecar of a video.
+        :return: A SeekIndex, or None if there is no sidecar or it is outdated (the video's size or mtime changed).
+        """
+        path = seek_index_path(video_path)
+        try:
+            table = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        stat = os.stat(video_path)
+        if table.ndim != 2 or len(table) == 0 or \
+                tuple(table[0]) != (SEEK_INDEX_VERSION, stat.st_size, stat.st_mtime_ns):
+            logging.debug(f"Seek index of {video_path} is outdated")
+            return None
+        return cls(table[1:, 1], table[1:, 2])
+
+    @classmethod
+    def load_or_build(cls, video_path):
+        """
+        Loads the sidecar of a video, or builds and saves it if it is missing or outdated.
+        """
+        index = cls.load(video_path)
+        if index is None:
+            index = cls.build(video_path)
+            try:
+                index.save(video_path)
+                logging.info(f"Built seek index for {video_path} ({len(index)} frames)")
+            except OSError as e:
+                logging.warning(f"Could not save the seek index of {video_path}: {e}")
+        return index
+
+
+def seek_capture(capture, seek_index, position, frame_index):
+    """
+    Moves a cv2.VideoCapture so that its next read() returns frame_index, decoding as few frames as possible:
+    if the target is ahead of the current position and no keyframe lies in between, it reads forward,
+    otherwise it jumps to the keyframe before the target and reads forward from there.
+    Frames are skipped with grab(), which decodes without converting the frame.
+    :param capture: An open cv2.VideoCapture.
+    :param seek_index: The SeekIndex of the capture's video (None falls back to CAP_PROP_POS_FRAMES).
+    :param position: Index of the frame the capture's next read() would return (-1 if unknown).
+    :param frame_index: The frame to move to.
+    :return: The number of frames that were skipped with grab().
+    """
+    if seek_index is None:
+        if position != frame_index:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        return 0
+    keyframe = seek_index.keyframe_before(frame_index)
+    if not keyframe <= position <= frame_index:
+        # a keyframe is always decoded exactly, so setting the position there is frame accurate
+        capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+        position = keyframe
+    for _ in range(frame_index - position):
+        capture.grab()
+    return frame_index - position
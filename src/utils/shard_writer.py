@@ -0,0 +1,322 @@
+import io
+import os
+import json
+import tarfile
+import logging
+import tempfile
+
+# Our own libraries
+from src.utils.preprocessing import TARGET_LENGTH
+from src.utils.encoders import get_encoder_profile
+from src.utils.frame_store import is_manifest, load_manifest, expand_manifest
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+INDEX_FILE_NAME = "index.json"
+# A group's snippet_path after its snippet file was packed and removed: shard:<shard directory>#<sample key>
+SHARD_REFERENCE_PREFIX = "shard:"
+
+
+def shard_reference(shard_dir, key):
+    return f"{SHARD_REFERENCE_PREFIX}{os.path.abspath(shard_dir)}#{key}"
+
+
+def is_shard_reference(snippet_path):
+    return bool(snippet_path) and snippet_path.startswith(SHARD_REFERENCE_PREFIX)
+
+
+def parse_shard_reference(snippet_path):
+    """
+    :return: (shard directory, sample key) of a shard reference.
+    """
+    shard_dir, key = snippet_path[len(SHARD_REFERENCE_PREFIX):].rsplit("#", 1)
+    return shard_dir, key
+
+
+class ShardWriter:
+    def __init__(self, out_dir, max_shard_bytes=256 * 1024 ** 2, prefix="shard"):
+        """
+        Packs samples into sequential tar shards (WebDataset layout: every file of a sample shares the same key,
+        e.g. AN755_T1_group_0.mp4 and AN755_T1_group_0.json) and keeps an index of where each member lives.
+        A new shard is started once the current one reaches max_shard_bytes, so a sample is never split.
+        If out_dir already has an index, the writer continues it: its shards are kept (earlier shard references
+        still point into them), new samples go into new shards and a sample packed again replaces its index entry.
+        :param out_dir: Directory for the shards and the index file.
+        :param max_shard_bytes: Size limit of a single shard.
+        :param prefix: File name prefix of the shards (shard-000000.tar, shard-000001.tar, ...).
+        """
+        self.out_dir = out_dir
+        self.max_shard_bytes = max_shard_bytes
+        self.prefix = prefix
+        self.shards = []
+        self.samples = []
+        self._tar = None
+        self._shard_name = None
+        self._packed_files = []  # (metadata manager, subject, trail, group id, snippet path, key) to remove on close
+        os.makedirs(self.out_dir, exist_ok=True)
+        if os.path.isfile(os.path.join(self.out_dir, INDEX_FILE_NAME)):
+            index = load_shard_index(self.out_dir)
+            self.shards, self.samples = index["shards"], index["samples"]
+            logging.info(f"Continuing the {len(self.samples)} samples in {len(self.shards)} shards of {self.out_dir}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # after an error the shards are still closed, but no snippet file is removed
+        self.close(remove_packed=exc_type is None)
+
+    def _open_next_shard(self):
+        self._close_shard()
+        self._shard_name = f"{self.prefix}-{len(self.shards):06d}.tar"
+        self._tar = tarfile.open(os.path.join(self.out_dir, self._shard_name), "w")
+        self.shards.append({"name": self._shard_name, "samples": 0, "bytes": 0})
+        logging.debug(f"Opened shard {self._shard_name}")
+
+    def _close_shard(self):
+        if self._tar is not None:
+            self._tar.close()
+            shard_path = os.path.join(self.out_dir, self._shard_name)
+            with open(shard_path, "rb+") as file:
+                os.fsync(file.fileno())  # on disk before any packed snippet file is removed
+            self.shards[-1]["bytes"] = os.path.getsize(shard_path)
+            self._tar = None
+
+    def add_sample(self, key, members):
+        """
+        Writes one sample to the current shard.
+        :param key: The sample key (must be unique, no dots).
+        :param members: A dict of {extension : bytes}, e.g. {"mp4": video_bytes, "json": metadata_bytes}.
+        """
+        sample_bytes = sum(len(data) for data in members.values())
+        if self._tar is None or (self.shards[-1]["samples"] > 0 and
+                                 self._tar.offset + sample_bytes > self.max_shard_bytes):
+            self._open_next_shard()
+
+        entry = {"key": key, "shard": self._shard_name, "members": {}}
+        for ext, data in members.items():
+            info = tarfile.TarInfo(name=f"{key}.{ext}")
+            info.size = len(data)
+            self._tar.addfile(info, io.BytesIO(data))
+            # the data is the last (block padded) part of what was just written, readers can seek straight to it
+            padded_size = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            entry["members"][ext] = {"offset": self._tar.offset - padded_size, "size": info.size}
+        self.shards[-1]["samples"] += 1
+        # a sample packed again (e.g. a subject processed again) replaces its entry, the old bytes stay in their shard
+        self.samples = [sample for sample in self.samples if sample["key"] != key]
+        self.samples.append(entry)
+
+    def remove_after_close(self, metadata_manager, subject_name, video, key):
+        """
+        Marks a packed group's snippet file for removal. The file is only removed once close() has written the
+        shards and the index, and the group's snippet_path then becomes a shard reference (see shard_reference).
+        """
+        self._packed_files.append((metadata_manager, subject_name, video.get("trail"), video["group_id"],
+                                   video["snippet_path"], key))
+
+    def close(self, remove_packed=True):
+        """
+        Closes the last shard and writes the index file, then removes the snippet files marked by
+        remove_after_close (the metadata is pointed at the shards first).
+        :param remove_packed: False keeps the marked snippet files (and their snippet paths).
+        :return: Path to the index file.
+        """
+        self._close_shard()
+        index_path = os.path.join(self.out_dir, INDEX_FILE_NAME)
+        temp_path = f"{index_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"shards": self.shards, "samples": self.samples}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, index_path)
+        logging.info(f"Wrote {len(self.samples)} samples into {len(self.shards)} shards in {self.out_dir}")
+        if remove_packed:
+            self._remove_packed_files()
+        self._packed_files = []
+        return index_path
+
+    def _remove_packed_files(self):
+        by_subject = {}
+        for metadata_manager, subject_name, trail, group_id, snippet_path, key in self._packed_files:
+            by_subject.setdefault((id(metadata_manager), subject_name), (metadata_manager, subject_name, {}, []))
+            _, _, snippet_paths, files = by_subject[(id(metadata_manager), subject_name)]
+            snippet_paths[(trail, group_id)] = shard_reference(self.out_dir, key)
+            files.append(snippet_path)
+        for metadata_manager, subject_name, snippet_paths, files in by_subject.values():
+            # the metadata points at the shards before the files go, a crash in between only leaves extra files
+            metadata_manager.update_snippet_paths(subject_name, snippet_paths)
+            for snippet_path in files:
+                try:
+                    os.remove(snippet_path)
+                except FileNotFoundError:
+                    pass
+            logging.info(f"Removed {len(files)} packed snippet files of subject {subject_name}")
+
+
+def padding_mask(start_frame, end_frame, target_length=TARGET_LENGTH, num_frames=None):
+    """
+    :param num_frames: The number of real frames if the group is sampled (default: every frame of the range).
+    :return: A list of target_length ints, 1 for a real frame and 0 for a black padding frame.
+    """
+    real_frames = min(end_frame - start_frame + 1 if num_frames is None else num_frames, target_length)
+    return [1] * real_frames + [0] * (target_length - real_frames)
+
+
+def group_sample_metadata(subject_name, video, target_length=TARGET_LENGTH):
+    """
+    Builds the metadata stored next to each snippet in a shard.
+    :param subject_name: The name of the subject.
+    :param video: A single entry of the subject's metadata["videos"] list.
+    :return: A dict with the group range, its fixation ranges and tags, and the padding mask. Sampled groups also
+             get the recording index of every snippet frame (frame_indices).
+    """
+    frame_indices = video.get("frame_indices")
+    target_length = video.get("snippet_length", target_length)
+    sample_metadata = {
+        "subject": subject_name,
+        "trail": video.get("trail"),
+        "group_id": video["group_id"],
+        "start_frame": video["start_frame"],
+        "end_frame": video["end_frame"],
+        "total_fixations": video["total_fixations"],
+        "fixations": {fix_id: {"start_frame": fix["start_frame"], "end_frame": fix["end_frame"], "tag": fix["tag"]}
+                      for fix_id, fix in video["fixations"].items()},
+        "padding_mask": padding_mask(video["start_frame"], video["end_frame"], target_length,
+                                     None if frame_indices is None else len(frame_indices)),
+    }
+    if frame_indices is not None:
+        sample_metadata["frame_indices"] = frame_indices
+    return sample_metadata
+
+
+def _expand_manifest_bytes(manifest_path):
+    """
+    Expands a frame store manifest into a video (with the manifest's encoder profile).
+    :return: (video bytes, extension without the dot)
+    """
+    with tempfile.TemporaryDirectory(prefix="ctt_manifest_") as temp_dir:
+        profile = get_encoder_profile(load_manifest(manifest_path)[0].get("encoder"))
+        video_path = expand_manifest(manifest_path, os.path.join(temp_dir, "snippet" + profile.extension), profile.name)
+        with open(video_path, "rb") as file:
+            return file.read(), os.path.splitext(video_path)[1].lstrip(".")
+
+
+def sample_key(subject_name, video):
+    """
+    The shard key of a group, group ids restart in every trail (e.g. AN755_T1_group_0).
+    """
+    if video.get("trail"):
+        return f"{subject_name}_{video['trail']}_{video['group_id']}"
+    return f"{subject_name}_{video['group_id']}"
+
+
+def pack_subject_snippets(metadata_manager, subject_name, shard_writer, remove_snippets=False):
+    """
+    Packs all existing snippets of a subject (and their metadata) into shards.
+    Several subjects can be packed into the same ShardWriter.
+    :param metadata_manager: An instance of MetadataManager object.
+    :param subject_name: The name of the subject.
+    :param shard_writer: An open ShardWriter.
+    :param remove_snippets: Delete the packed snippet files when the shard writer is closed, their snippet_path
+                            becomes a shard reference (shard:<shard dir>#<key>).
+    :return: The number of packed snippets.
+    """
+    metadata = metadata_manager.load_metadata(subject_name)
+    packed = 0
+    for video in metadata["videos"]:
+        snippet_path = video.get("snippet_path")
+        if is_shard_reference(snippet_path):  # already packed, its file was removed
+            continue
+        if not snippet_path or not os.path.isfile(snippet_path):
+            logging.warning(f"Snippet of {video['group_id']} for subject {subject_name} not found, skipping.")
+            continue
+        if is_manifest(snippet_path):  # frame store snippets are packed as videos
+            video_bytes, ext = _expand_manifest_bytes(snippet_path)
+        else:
+            with open(snippet_path, "rb") as file:
+                video_bytes = file.read()
+            ext = os.path.splitext(snippet_path)[1].lstrip(".") or "mp4"
+        key = sample_key(subject_name, video)
+        sample_metadata = json.dumps(group_sample_metadata(subject_name, video)).encode("utf-8")
+        shard_writer.add_sample(key, {ext: video_bytes, "json": sample_metadata})
+        packed += 1
+        if remove_snippets:
+            shard_writer.remove_after_close(metadata_manager, subject_name, video, key)
+    logging.info(f"Packed {packed} snippets of subject {subject_name}")
+    return packed
+
+
+def load_shard_index(shard_dir):
+    """
+    Loads the index of a shard directory.
+    """
+    with open(os.path.join(shard_dir, INDEX_FILE_NAME), "r") as file:
+        return json.load(file)
+
+
+def read_sample(shard_dir, entry):
+    """
+    Random access to a single sample using the offsets in the index (no tar parsing).
+    :param shard_dir: The shard directory.
+    :param entry: An item of index["samples"].
+    :return: A dict of {extension : bytes}.
+    """
+    sample = {}
+    with open(os.path.join(shard_dir, entry["shard"]), "rb") as file:
+        for ext, member in entry["members"].items():
+            file.seek(member["offset"])
+            sample[ext] = file.read(member["size"])
+    return sample
+
+
+def iter_shard_samples(shard_dir):
+    """
+    Streams all samples shard by shard, reading every shard sequentially from start to end. Samples that were
+    packed again later (the index points at their newer copy) are skipped.
+    :param shard_dir: The shard directory.
+    :return: A generator of (key, {extension : bytes}).
+    """
+    index = load_shard_index(shard_dir)
+    entries = {sample["key"]: sample for sample in index["samples"]}
+
+    def is_current(key, shard_name, offsets):
+        entry = entries.get(key)
+        return entry is not None and entry["shard"] == shard_name and \
+            offsets == {ext: member["offset"] for ext, member in entry["members"].items()}
+
+    for shard in index["shards"]:
+        with tarfile.open(os.path.join(shard_dir, shard["name"]), "r|") as tar:
+            key, sample, offsets = None, {}, {}
+            for member in tar:
+                member_key, ext = member.name.split(".", 1)
+                if key is not None and member_key != key:
+                    if is_current(key, shard["name"], offsets):
+                        yield key, sample
+                    sample, offsets = {}, {}
+                key = member_key
+                sample[ext] = tar.extractfile(member).read()
+                offsets[ext] = member.offset_data
+            if key is not None and is_current(key, shard["name"], offsets):
+                yield key, sample
+
+
+if __name__ == "__main__":
+    import argparse
+    from src.utils.metadata_manager import MetadataManager
+
+    parser = argparse.ArgumentParser(description="Pack the video snippets of subjects into tar shards.")
+    parser.add_argument("subjects", nargs="+", help="Subject names (e.g. AN755)")
+    parser.add_argument("--metadata", required=True, help="Metadata directory")
+    parser.add_argument("--out", required=True, help="Output directory for the shards")
+    parser.add_argument("--max-shard-mb", type=int, default=256)
+    parser.add_argument("--remove-snippets", action="store_true", help="Delete snippet files once packed")
+    args = parser.parse_args()
+
+    manager = MetadataManager(base_directory=args.metadata)
+    with ShardWriter(args.out, max_shard_bytes=args.max_shard_mb * 1024 ** 2) as writer:
+        for subject in args.subjects:
+            pack_subject_snippets(manager, subject, writer, remove_snippets=args.remove_snippets)
@@ -0,0 +1,220 @@
+import logging
+import queue
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+# Our own libraries
+from src.utils.preprocessing import TARGET_LENGTH
+from src.utils.virtual_snippets import open_snippet
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+_END = object()  # marks the end of the batches in the prefetch queue
+
+
+class SnippetDataset:
+    def __init__(self, metadata_manager, subjects=None, trail=None, batch_size=8, num_workers=4, prefetch_batches=2,
+                 shuffle_buffer=0, seed=None, target_length=TARGET_LENGTH, frame_size=None, tag_vocabulary=None,
+                 drop_last=False):
+        """
+        An iterable over batches of fixation group snippets, built on the subjects' metadata. It doesn't depend on
+        a training framework: batches are dicts of numpy arrays (wrap them with torch.from_numpy etc.).
+        Snippets are decoded by a pool of worker threads (snippet files, or the source video for groups without a
+        snippet file) and batches are prepared in the background, prefetch_batches ahead of the consumer.
+        Each batch is a dict with:
+            "frames": uint8 (batch, target_length, height, width, 3), BGR
+            "mask": bool (batch, target_length), False for padding frames
+            "frame_tags": int16 (batch, target_length), index of the tag in tag_vocabulary of the fixation shown
+                          in each frame, -1 for frames without a tagged fixation and padding
+            "tags": per snippet, a {fixation_id : tag} dict
+            "subjects", "group_ids": per snippet
+        :param metadata_manager: An instance of MetadataManager object.
+        :param subjects: The subjects to read (default: all subjects in the metadata directory).
+        :param trail: Only read groups of this trail (default: all).
+        :param batch_size: Snippets per batch.
+        :param num_workers: Decoding threads.
+        :param prefetch_batches: Number of batches prepared ahead of the consumer.
+        :param shuffle_buffer: Snippets are decoded in metadata order (sequential reads of the source videos) and
+                               shuffled through a buffer of this many decoded snippets. 0 keeps the order.
+        :param seed: Seed of the shuffling.
+        :param target_length: Frames per snippet (shorter snippets are padded, longer ones are cut).
+        :param frame_size: (width, height) the frames are resized to. Required if the videos' sizes differ.
+        :param tag_vocabulary: List of the tags frame_tags refers to (default: the sorted tags in the metadata).
+        :param drop_last: Drop the last batch if it is smaller than batch_size.
+        """
+        self.metadata_manager = metadata_manager
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.prefetch_batches = prefetch_batches
+        self.shuffle_buffer = shuffle_buffer
+        self.target_length = target_length
+        self.frame_size = frame_size
+        self.drop_last = drop_last
+        self._random = random.Random(seed)
+        self.samples = self._load_samples(subjects or metadata_manager.list_subjects(), trail)
+        if tag_vocabulary is None:
+            tag_vocabulary = sorted({fixation["tag"] for _, video in self.samples
+                                     for fixation in video["fixations"].values() if fixation["tag"] is not None})
+        self.tag_vocabulary = list(tag_vocabulary)
+        self._tag_index = {tag: idx for idx, tag in enumerate(self.tag_vocabulary)}
+
+    def _load_samples(self, subjects, trail):
+        samples = []
+        for subject_name in subjects:
+            for video in self.metadata_manager.load_metadata(subject_name).get("videos", []):
+                if trail is not None and video.get("trail") != trail:
+                    continue
+                # older metadata files repeat the fixations of previous groups, keep only the ones inside this group
+                video = dict(video, fixations={
+                    fixation_id: fixation for fixation_id, fixation in video["fixations"].items()
+                    if video["start_frame"] <= fixation["start_frame"] and fixation["end_frame"] <= video["end_frame"]})
+                samples.append((subject_name, video))
+        logging.info(f"SnippetDataset: {len(samples)} snippets of {len(subjects)} subjects")
+        return samples
+
+    def __len__(self):
+        """
+        :return: The number of batches per epoch.
+        """
+        if self.drop_last:
+            return len(self.samples) // self.batch_size
+        return -(-len(self.samples) // self.batch_size)
+
+    def _decode(self, sample):
+        """
+        Decodes one snippet (runs in a worker thread, each thread has its own open videos).
+        :return: The sample dict, or None if the snippet can't be read.
+        """
+        subject_name, video = sample
+        try:
+            frames, mask = open_snippet(video, self.target_length).read_all()
+        except Exception as e:
+            logging.warning(f"Skipping {subject_name} {video['group_id']}: {e}")
+            return None
+        if self.frame_size is not None and (frames.shape[2], frames.shape[1]) != tuple(self.frame_size):
+            frames = np.stack([cv2.resize(frame, tuple(self.frame_size), interpolation=cv2.INTER_AREA)
+                               for frame in frames])
+        frame_tags = np.full(self.target_length, -1, dtype=np.int16)
+        # recording frame index of every snippet frame (a sampled group lists them, see frame_sampling)
+        frame_indices = np.asarray(video.get("frame_indices") or range(video["start_frame"], video["end_frame"] + 1))
+        frame_indices = frame_indices[:self.target_length]
+        tags = {}
+        for fixation_id, fixation in video["fixations"].items():
+            tags[fixation_id] = fixation["tag"]
+            if fixation["tag"] in self._tag_index:
+                in_fixation = (frame_indices >= fixation["start_frame"]) & (frame_indices <= fixation["end_frame"])
+                frame_tags[:len(frame_indices)][in_fixation] = self._tag_index[fixation["tag"]]
+        frame_tags[~mask] = -1
+        return {"frames": frames, "mask": mask, "frame_tags": frame_tags, "tags": tags,
+                "subject": subject_name, "group_id": video["group_id"]}
+
+    def _iter_decoded(self, executor, stop):
+        """
+        Decodes the samples in metadata order with a bounded number of snippets in flight.
+        """
+        subjects = list(dict.fromkeys(subject_name for subject_name, _ in self.samples))
+        if self.shuffle_buffer:
+            self._random.shuffle(subjects)  # the subjects' order changes every epoch, their groups stay in order
+        order = {subject_name: idx for idx, subject_name in enumerate(subjects)}
+        samples = sorted(self.samples, key=lambda sample: order[sample[0]])
+        in_flight = deque()
+        max_in_flight = self.num_workers * 2
+        for sample in samples:
+            if stop.is_set():
+                return
+            in_flight.append(executor.submit(self._decode, sample))
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().result()
+        while in_flight and not stop.is_set():
+            yield in_flight.popleft().result()
+
+    def _iter_shuffled(self, decoded):
+        """
+        Shuffles a stream of decoded snippets through a buffer of shuffle_buffer snippets.
+        """
+        buffer = []
+        for sample in decoded:
+            if sample is None:
+                continue
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+            if not buffer:
+                yield sample
+                continue
+            idx = self._random.randrange(len(buffer))
+            yield buffer[idx]
+            buffer[idx] = sample
+        self._random.shuffle(buffer)
+        yield from buffer
+
+    def _collate(self, batch):
+        shapes = {sample["frames"].shape for sample in batch}
+        if len(shapes) > 1:
+            raise ValueError(f"Snippets of different frame sizes {shapes} in one batch, set frame_size")
+        return {
+            "frames": np.stack([sample["frames"] for sample in batch]),
+            "mask": np.stack([sample["mask"] for sample in batch]),
+            "frame_tags": np.stack([sample["frame_tags"] for sample in batch]),
+            "tags": [sample["tags"] for sample in batch],
+            "subjects": [sample["subject"] for sample in batch],
+            "group_ids": [sample["group_id"] for sample in batch],
+        }
+
+    def _produce(self, batches, stop):
+        """
+        Background thread: decodes, shuffles and collates batches into the prefetch queue.
+        """
+        try:
+            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                batch = []
+                for sample in self._iter_shuffled(self._iter_decoded(executor, stop)):
+                    batch.append(sample)
+                    if len(batch) == self.batch_size:
+                        if not self._put(batches, self._collate(batch), stop):
+                            return
+                        batch = []
+                if batch and not self.drop_last:
+                    self._put(batches, self._collate(batch), stop)
+        except Exception as e:
+            self._put(batches, e, stop)
+        finally:
+            self._put(batches, _END, stop)
+
+    @staticmethod
+    def _put(batches, item, stop):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        """
+        Iterates over one epoch of batches. Stopping early (break) stops the background decoding.
+        """
+        batches = queue.Queue(maxsize=max(self.prefetch_batches, 1))
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(batches, stop), daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            producer.join()
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import av
+
+# Our own libraries
+from src.utils.preprocessing import TARGET_LENGTH
+from src.utils.frame_store import is_manifest, load_manifest
+from src.utils.shard_writer import is_shard_reference, parse_shard_reference, load_shard_index
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Statuses of a verified group. Everything but "ok" and "virtual" (a group marked virtual in the metadata, read from
+# its source video on purpose) needs the group to be generated again.
+OK, VIRTUAL, MISSING, TRUNCATED, MISMATCHED, CORRUPT = "ok", "virtual", "missing", "truncated", "mismatched", "corrupt"
+FAILED_STATUSES = (MISSING, TRUNCATED, MISMATCHED, CORRUPT)
+# Files in the snippet folders that aren't snippets
+SIDECAR_SUFFIXES = (".seekidx.npy", ".tmp")
+
+
+def probe_snippet(snippet_path, count_packets=False):
+    """
+    Reads a video's frame count and stream info from its container, no frame is decoded.
+    :param count_packets: Count the video packets instead of trusting the header's frame count (still no decoding,
+                          catches files whose header promises more than they hold). Containers without a frame count
+                          in the header (e.g. mkv) are always counted.
+    :return: A dict with frames, width, height and codec.
+    """
+    with av.open(snippet_path) as container:
+        stream = container.streams.video[0]
+        frames = stream.frames
+        info = {"width": stream.codec_context.width, "height": stream.codec_context.height,
+                "codec": stream.codec_context.name}
+        if count_packets or not frames:
+            frames = sum(1 for packet in container.demux(stream) if packet.size)
+    return {"frames": int(frames), **info}
+
+
+class SnippetVerifier:
+    def __init__(self, metadata_manager, target_length=TARGET_LENGTH, count_packets=False, max_workers=8):
+        """
+        Checks the snippets of subjects against their metadata without decoding them: every snippet_path exists,
+        has target_length frames and the resolution of its source recording. A group without a snippet_path is
+        missing unless the metadata marks it virtual. Frame store manifests are checked
+        for their length, their frame range and that the store has all their frames.
+        :param metadata_manager: An instance of MetadataManager object.
+        :param target_length: The expected number of frames of a snippet (padding included).
+        :param count_packets: See probe_snippet.
+        :param max_workers: Snippets probed at the same time (probing is mostly waiting for the disk).
+        """
+        self.metadata_manager = metadata_manager
+        self.target_length = target_length
+        self.count_packets = count_packets
+        self.max_workers = max_workers
+        self._source_sizes = {}  # source video path : (width, height) or None
+        self._shard_indexes = {}  # shard directory : {key : index entry} or None
+        self._lock = threading.Lock()
+
+    def _source_size(self, source_video):
+        with self._lock:
+            if source_video in self._source_sizes:
+                return self._source_sizes[source_video]
+        size = None
+        if source_video and os.path.isfile(source_video):
+            try:
+                with av.open(source_video) as container:
+                    codec_context = container.streams.video[0].codec_context
+                    size = (codec_context.width, codec_context.height)
+            except av.error.FFmpegError as e:
+                logging.warning(f"Cannot read the source video {source_video}: {e}")
+        with self._lock:
+            self._source_sizes[source_video] = size
+        return size
+
+    def verify_group(self, subject_name, video):
+        """
+        Verifies the snippet of one group.
+        :param video: A single entry of the subject's metadata["videos"] list.
+        :return: A report entry: subject, trail, group_id, snippet_path, status, problems and the probed info.
+        """
+        snippet_path = video.get("snippet_path")
+        entry = {"subject": subject_name, "trail": video.get("trail"), "group_id": video["group_id"],
+                 "snippet_path": snippet_path, "status": OK, "problems": []}
+        if not snippet_path and video.get("virtual"):
+            entry["status"] = VIRTUAL  # never written on purpose, read from the source video (see virtual_snippets)
+            return entry
+        if not snippet_path:
+            entry["status"] = MISSING
+            entry["problems"].append("no snippet_path (the group was never trimmed)")
+            return entry
+        if is_shard_reference(snippet_path):
+            self._check_shard(snippet_path, entry)
+            return entry
+        if not os.path.isfile(snippet_path):
+            entry["status"] = MISSING
+            entry["problems"].append("snippet file not found")
+            return entry
+        try:
+            if is_manifest(snippet_path):
+                self._check_manifest(snippet_path, video, entry)
+            else:
+                self._check_video(snippet_path, video, entry)
+        except (av.error.FFmpegError, OSError, ValueError, KeyError, IndexError) as e:
+            entry["status"] = CORRUPT
+            entry["problems"].append(f"cannot be read: {e}")
+        return entry
+
+    def _target_length(self, video):
+        return video.get("snippet_length", self.target_length)  # sampled groups have their own length
+
+    def _check_video(self, snippet_path, video, entry):
+        info = probe_snippet(snippet_path, self.count_packets)
+        entry.update(info)
+        target_length = self._target_length(video)
+        if info["frames"] < target_length:
+            entry["status"] = TRUNCATED
+            entry["problems"].append(f"{info['frames']} frames instead of {target_length}")
+        elif info["frames"] > target_length:
+            entry["status"] = MISMATCHED
+            entry["problems"].append(f"{info['frames']} frames instead of {target_length}")
+        source_size = self._source_size(video.get("source_video"))
+        if source_size is not None and (info["width"], info["height"]) != source_size:
+            entry["status"] = MISMATCHED
+            entry["problems"].append(f"{info['width']}x{info['height']} instead of {source_size[0]}x{source_size[1]}")
+
+    def _check_manifest(self, manifest_path, video, entry):
+        manifest, store = load_manifest(manifest_path)
+        frames = len(manifest["frames"]) + manifest["padding"]
+        entry.update({"frames": frames, "width": manifest["width"], "height": manifest["height"],
+                      "codec": manifest["frame_codec"]})
+        target_length = self._target_length(video)
+        if frames != target_length:
+            entry["status"] = TRUNCATED if frames < target_length else MISMATCHED
+            entry["problems"].append(f"{frames} frames instead of {target_length}")
+        expected_indices = video.get("frame_indices") or list(range(video["start_frame"], video["end_frame"] + 1))
+        if manifest["frame_indices"] != expected_indices[:len(manifest["frame_indices"])] or not manifest["frame_indices"]:
+            entry["status"] = MISMATCHED
+            entry["problems"].append("frame range doesn't match the group")
+        elif len(manifest["frame_indices"]) < len(expected_indices):
+            entry["status"] = TRUNCATED
+            entry["problems"].append(f"{len(manifest['frame_indices'])} of the group's {len(expected_indices)} frames")
+        missing = sum(not store.has(key) for key in manifest["frames"])
+        if manifest["padding"] and not store.has(manifest["padding_key"]):
+            missing += 1
+        if missing:
+            entry["status"] = MISSING
+            entry["problems"].append(f"{missing} frames missing from the frame store")
+
+    def _shard_index(self, shard_dir):
+        with self._lock:
+            if shard_dir not in self._shard_indexes:
+                try:
+                    index = load_shard_index(shard_dir)
+                    self._shard_indexes[shard_dir] = {sample["key"]: sample for sample in index["samples"]}
+                except (OSError, ValueError, KeyError):
+                    self._shard_indexes[shard_dir] = None
+            return self._shard_indexes[shard_dir]
+
+    def _check_shard(self, snippet_path, entry):
+        """
+        A snippet packed into shards (its file was removed): the sample must be in the index and its shard must
+        hold all of its bytes.
+        """
+        shard_dir, key = parse_shard_reference(snippet_path)
+        index = self._shard_index(shard_dir)
+        sample = index.get(key) if index is not None else None
+        if sample is None:
+            entry["status"] = MISSING
+            entry["problems"].append(f"sample {key} not found in the shard index of {shard_dir}")
+            return
+        shard_path = os.path.join(shard_dir, sample["shard"])
+        end = max(member["offset"] + member["size"] for member in sample["members"].values())
+        if not os.path.isfile(shard_path):
+            entry["status"] = MISSING
+            entry["problems"].append(f"shard {sample['shard']} not found")
+        elif os.path.getsize(shard_path) < end:
+            entry["status"] = TRUNCATED
+            entry["problems"].append(f"shard {sample['shard']} is shorter than sample {key}")
+
+    def find_orphans(self, subject_name, videos):
+        """
+        :return: Snippet files in the subject's snippet folders that no group of the metadata points at.
+        """
+        referenced = {os.path.abspath(video["snippet_path"]) for video in videos
+                      if video.get("snippet_path") and not is_shard_reference(video["snippet_path"])}
+        folders = {os.path.dirname(path) for path in referenced}
+        orphans = []
+        for folder in sorted(folders):
+            for file_name in sorted(os.listdir(folder)):
+                path = os.path.join(folder, file_name)
+                if (file_name.startswith("snippet_") and os.path.isfile(path) and path not in referenced
+                        and not file_name.endswith(SIDECAR_SUFFIXES)):
+                    orphans.append(path)
+        return orphans
+
+    def verify(self, subjects, trails=None):
+        """
+        Verifies the snippets of several subjects in parallel.
+        :param subjects: Subject names.
+        :param trails: Only verify these trails (default: all of them).
+        :return: The report dict: the counts per status, the entries that need to be generated again
+                 ("failed", grouped by subject and trail in "regenerate"), orphan files and every entry.
+        """
+        start_time = time.perf_counter()
+        work, orphans = [], []
+        for subject_name in subjects:
+            videos = [video for video in self.metadata_manager.load_metadata(subject_name)["videos"]
+                      if trails is None or video.get("trail") in trails]
+            work.extend((subject_name, video) for video in videos)
+            orphans.extend(self.find_orphans(subject_name, videos))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            entries = list(executor.map(lambda item: self.verify_group(*item), work))
+
+        counts = {}
+        for entry in entries:
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        failed = [entry for entry in entries if entry["status"] in FAILED_STATUSES]
+        regenerate = {}
+        for entry in failed:
+            regenerate.setdefault(entry["subject"], {}).setdefault(entry["trail"], []).append(entry["group_id"])
+        return {
+            "target_length": self.target_length,
+            "seconds": time.perf_counter() - start_time,
+            "counts": counts,
+            "failed": failed,
+            "regenerate": regenerate,
+            "orphans": orphans,
+            "entries": entries,
+        }
+
+
+def write_report(report, report_path):
+    with open(report_path, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    import argparse
+    from src.utils.metadata_manager import MetadataManager
+
+    parser = argparse.ArgumentParser(description="Verify snippet files against the metadata without decoding them.")
+    parser.add_argument("subjects", nargs="*", help="Subject names (default: every subject in the metadata)")
+    parser.add_argument("--metadata", required=True, help="Metadata directory")
+    parser.add_argument("--trails", help="Comma separated trails (default: all)")
+    parser.add_argument("--report", default="snippet_report.json", help="Path of the JSON report")
+    parser.add_argument("--count-packets", action="store_true", help="Count packets instead of trusting headers")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    metadata_manager = MetadataManager(base_directory=args.metadata)
+    verifier = SnippetVerifier(metadata_manager, count_packets=args.count_packets, max_workers=args.workers)
+    report = verifier.verify(args.subjects or metadata_manager.list_subjects(),
+                             trails=args.trails.split(",") if args.trails else None)
+    write_report(report, args.report)
+    print(f"{len(report['entries'])} groups verified in {report['seconds']:.2f}s: {report['counts']}, "
+          f"{len(report['orphans'])} orphan files. Report written to {args.report}")
+    if report["failed"]:
+        raise SystemExit(1)
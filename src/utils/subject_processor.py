@@ -0,0 +1,65 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Our own libraries
+from src.utils.preprocessing import VideoPreprocessor, UNITY_TRAILS, match_pl_uni
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+class SubjectProcessor:
+    def __init__(self, parent, metadata_manager, trails=None):
+        """
+        Processes every trail of a subject in one pass. The Unity <-> PL mapping is resolved once and shared by
+        the trails' VideoPreprocessors, the trails run concurrently (decoding and encoding release the GIL), and
+        each trail's metadata is written in one commit when the trail is done.
+        :param parent: An instance of ProcessingContainer object (with its output path created).
+        :param metadata_manager: An instance of MetadataManager object.
+        :param trails: The trails to process (default: every trail of UNITY_TRAILS that has an exported recording).
+        """
+        self.parent = parent
+        self.subject_name = parent.subject_name
+        self.metadata_manager = metadata_manager
+        self.uni_pl_sync_dict = match_pl_uni(parent.subject_name, parent.uni_path, parent.pl_path)
+        self.video_processors = {}
+        for trail in trails or UNITY_TRAILS:
+            try:
+                self.video_processors[trail] = VideoPreprocessor(parent, trail=trail, metadata_manager=metadata_manager,
+                                                                 uni_pl_sync_dict=self.uni_pl_sync_dict)
+            except (KeyError, FileNotFoundError) as e:
+                if trails is not None:  # a trail that was asked for explicitly must exist
+                    raise
+                logging.info(f"Skipping trail {trail} of subject {self.subject_name}: {e}")
+
+    @property
+    def trails(self):
+        return list(self.video_processors)
+
+    def process(self, max_workers=None, **options):
+        """
+        Runs VideoPreprocessor.process_streaming for every trail. The longest recordings are started first, so
+        the subject takes about as long as its longest trail when there are enough workers.
+        :param max_workers: Trails processed at the same time (default: all of them).
+        :param options: Keyword arguments of process_streaming (e.g. threshold, encoder, write_snippets).
+        :return: A dict of {trail : number of groups}. Trails that failed are logged and left out, their
+                 metadata isn't touched.
+        """
+        options = {**options, "metadata_batch": None}  # one metadata commit per trail
+        trails = sorted(self.video_processors, key=lambda trail: os.path.getsize(self.video_processors[trail].vid_path),
+                        reverse=True)
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers or max(len(trails), 1)) as executor:
+            futures = {trail: executor.submit(self.video_processors[trail].process_streaming, **options)
+                       for trail in trails}
+            for trail, future in futures.items():
+                try:
+                    results[trail] = future.result()
+                except Exception as e:
+                    logging.error(f"Processing trail {trail} of subject {self.subject_name} failed: {e}")
+        logging.info(f"Processed {len(results)}/{len(trails)} trails of subject {self.subject_name}")
+        return results
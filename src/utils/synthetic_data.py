@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+import numpy as np
+import cv2
+
+# Our own libraries
+from src.utils.preprocessing import UNITY_TRAILS
+from src.utils.unity_log import UNITY_COLUMNS
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+FIXATION_COLUMNS = ["id", "start_timestamp", "duration", "start_frame_index", "end_frame_index",
+                    "norm_pos_x", "norm_pos_y", "dispersion", "confidence", "method",
+                    "gaze_point_3d_x", "gaze_point_3d_y", "gaze_point_3d_z", "base_data"]
+
+
+def _synthetic_fixations(rng, num_frames, fps, fixations_per_minute):
+    """
+    Draws fixations (start frame, end frame) that do not overlap and are sorted in time.
+    Durations are 100-500ms and the gaps between them are exponential, so some of them are close enough to be merged.
+    :return: Two int arrays (start frames, end frames).
+    """
+    mean_period = 60.0 * fps / max(fixations_per_minute, 1e-6)  # frames between fixation onsets
+    durations_range = (max(int(0.1 * fps), 1), max(int(0.5 * fps), 2))
+    starts, ends = [], []
+    frame = int(rng.integers(0, max(int(mean_period), 1)))
+    while frame < num_frames:
+        duration = int(rng.integers(*durations_range))
+        end = min(frame + duration - 1, num_frames - 1)
+        starts.append(frame)
+        ends.append(end)
+        gap = int(rng.exponential(max(mean_period - duration, 1.0)))
+        frame = end + 1 + gap
+    return np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+
+
+def _write_world_video(video_path, num_frames, fps, resolution, rng):
+    """
+    Writes a world video with moving content (so the codec has real work to do).
+    """
+    width, height = resolution
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    writer = cv2.VideoWriter(video_path, fourcc, fps, (width, height))
+    try:
+        xx = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+        yy = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        noise = rng.integers(0, 40, size=(height, width), dtype=np.uint8)
+        square = max(min(width, height) // 8, 4)
+        for frame_number in range(num_frames):
+            frame = np.empty((height, width, 3), dtype=np.uint8)
+            frame[..., 0] = (xx + frame_number) % 256
+            frame[..., 1] = (yy + 2 * frame_number) % 256
+            frame[..., 2] = noise
+            x = (frame_number * 7) % max(width - square, 1)
+            y = (frame_number * 3) % max(height - square, 1)
+            frame[y:y + square, x:x + square] = 255
+            cv2.putText(frame, str(frame_number), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+            writer.write(frame)
+    finally:
+        writer.release()
+
+
+def _write_unity_log(uni_file_path, timestamps, fix_starts, fix_ends, num_balls, rng, sample_rate=10):
+    """
+    Writes a Unity trail log. The balls are spawned once, then the camera/gaze is sampled at sample_rate Hz.
+    During a fixation the gaze points at one ball, in between it wanders. Each ball is prompted once and found later.
+    """
+    ball_positions = np.column_stack([
+        rng.uniform(-2.0, 2.0, num_balls),
+        rng.uniform(0.5, 2.0, num_balls),
+        rng.uniform(2.0, 4.0, num_balls),
+    ])
+    cam = np.array([0.0, 1.2, 0.0])
+    rows = []
+    t0 = timestamps[0]
+    for ball_id, (x, y, z) in enumerate(ball_positions):
+        rows.append((t0, "spawn", ball_id, x, y, z, "", "", "", "", "", ""))
+
+    # which ball each fixation looks at
+    fixated_balls = rng.integers(0, num_balls, size=len(fix_starts))
+    sample_times = np.arange(t0, timestamps[-1], 1.0 / sample_rate)
+    fixation_of_sample = np.searchsorted(timestamps[fix_starts], sample_times, side="right") - 1
+    for t, fix_idx in zip(sample_times, fixation_of_sample):
+        if fix_idx >= 0 and t <= timestamps[fix_ends[fix_idx]]:
+            direction = ball_positions[fixated_balls[fix_idx]] - cam + rng.normal(0, 0.02, 3)
+        else:
+            direction = rng.normal(0, 1.0, 3)
+            direction[2] = abs(direction[2])
+        direction /= np.linalg.norm(direction)
+        rows.append((t, "gaze", -1, "", "", "", *cam, *direction))
+
+    # Each ball is prompted in order and found after a random search latency
+    prompt_times = np.linspace(t0, timestamps[-1], num_balls + 2)[1:-1]
+    for ball_id, prompt_time in enumerate(prompt_times):
+        rows.append((prompt_time, "prompt", ball_id, "", "", "", "", "", "", "", "", ""))
+        rows.append((prompt_time + rng.uniform(0.5, 4.0), "found", ball_id, "", "", "", "", "", "", "", "", ""))
+
+    rows.sort(key=lambda row: row[0])
+    with open(uni_file_path, "w") as file:
+        file.write(",".join(UNITY_COLUMNS) + "\n")
+        for row in rows:
+            file.write(",".join(f"{value:.6f}" if isinstance(value, (float, np.floating)) else str(value)
+                                for value in row) + "\n")
+    return fixated_balls
+
+
+def generate_synthetic_subject(data_path, subject_name, duration_s=60.0, fps=30, resolution=(640, 480),
+                               fixations_per_minute=120, num_balls=25, trails=None, seed=0):
+    """
+    Builds a synthetic subject tree in the layout ProcessingContainer and VideoPreprocessor expect:
+    <data_path>/<subject>/REC_ET/PL/<nnn>/exports/000/(world.mp4, world_timestamps.csv, fixations.csv, export_info.csv)
+    and <data_path>/<subject>/REC_ET/UNI/<subject>_<trail>.txt.
+    Every Unity trail gets a PL directory (with world_timestamps.npy, which match_pl_uni uses for matching),
+    but only the trails in `trails` get a full recording and export.
+    :param data_path: Root data folder (will be created if needed).
+    :param subject_name: Name of the synthetic subject (e.g. SY001).
+    :param duration_s: Length of each recording in seconds.
+    :param fps: Frames per second of the world video.
+    :param resolution: (width, height) of the world video.
+    :param fixations_per_minute: Average fixation density.
+    :param num_balls: Number of balls in the Unity scene.
+    :param trails: Trails to generate a full recording for (default: all of UNITY_TRAILS).
+    :param seed: Random seed, the same seed always gives the same subject.
+    :return: A dict with the subject paths, the PL directory of each trail, the frame/fixation counts and the ball
+             each fixation looks at.
+    """
+    trails = UNITY_TRAILS if trails is None else trails
+    rng = np.random.default_rng(seed)
+    rec_path = os.path.join(data_path, subject_name, 'REC_ET')
+    pl_path = os.path.join(rec_path, 'PL')
+    uni_path = os.path.join(rec_path, 'UNI')
+    os.makedirs(pl_path, exist_ok=True)
+    os.makedirs(uni_path, exist_ok=True)
+
+    num_frames = int(round(duration_s * fps))
+    base_mtime = time.time() - 3600 * len(UNITY_TRAILS)
+    summary = {"subject_dir": os.path.join(data_path, subject_name), "pl_path": pl_path, "uni_path": uni_path,
+               "num_frames": num_frames, "fps": fps, "resolution": tuple(resolution), "trails": {}}
+
+    for i, trail in enumerate(UNITY_TRAILS):
+        trail_dir = os.path.join(pl_path, f"{i:03d}")
+        os.makedirs(trail_dir, exist_ok=True)
+        start_ts = 1000.0 + i * (duration_s + 60.0)
+        timestamps = start_ts + np.arange(num_frames, dtype=np.float64) / fps
+        ts_npy = os.path.join(trail_dir, 'world_timestamps.npy')
+        np.save(ts_npy, timestamps)
+        uni_file = os.path.join(uni_path, f"{subject_name}_{trail}.txt")
+        fix_starts, fix_ends = _synthetic_fixations(rng, num_frames, fps, fixations_per_minute)
+
+        if trail in trails:
+            export_path = os.path.join(trail_dir, 'exports', '000')
+            os.makedirs(export_path, exist_ok=True)
+            _write_world_video(os.path.join(export_path, 'world.mp4'), num_frames, fps, resolution, rng)
+            np.savetxt(os.path.join(export_path, 'world_timestamps.csv'), timestamps, fmt="%.6f",
+                       header="# timestamps [seconds]", comments="")
+            _write_fixations_csv(os.path.join(export_path, 'fixations.csv'), timestamps, fix_starts, fix_ends, rng)
+            with open(os.path.join(export_path, 'export_info.csv'), "w") as file:
+                file.write("key,value\n")
+                file.write("Player Software Version,synthetic\n")
+                file.write("Data Format Version,2.0\n")
+                file.write(f"Frame Index Range:,0 - {num_frames - 1}\n")
+                file.write(f"Absolute Time Range,{timestamps[0]:.6f} - {timestamps[-1]:.6f}\n")
+            fixated_balls = _write_unity_log(uni_file, timestamps, fix_starts, fix_ends, num_balls, rng)
+            summary["trails"][trail] = {"pl_dir": trail_dir, "export_path": export_path,
+                                        "num_fixations": len(fix_starts),
+                                        "fixated_balls": fixated_balls}  # ground truth, by fixation id
+        else:
+            with open(uni_file, "w") as file:
+                file.write(",".join(UNITY_COLUMNS) + "\n")
+
+        # match_pl_uni pairs UNI files and PL directories by modification time, so keep them in recording order
+        mtime = base_mtime + i * 3600
+        os.utime(uni_file, (mtime, mtime))
+        os.utime(ts_npy, (mtime, mtime))
+
+    logging.info(f"Synthetic subject {subject_name} created in {summary['subject_dir']}")
+    return summary
+
+
+def _write_fixations_csv(csv_path, timestamps, fix_starts, fix_ends, rng):
+    """
+    Writes fixations in Pupil Player's export format. Pupil's exporter leaves a few trailing rows that
+    _get_fixations_ts drops (df.iloc[:-3]), so 3 extra rows are appended at the end.
+    """
+    num_rows = len(fix_starts) + 3
+    starts = np.concatenate([fix_starts, np.repeat(fix_ends[-1:], 3)]) if len(fix_starts) else np.zeros(3, int)
+    ends = np.concatenate([fix_ends, np.repeat(fix_ends[-1:], 3)]) if len(fix_ends) else np.zeros(3, int)
+    with open(csv_path, "w") as file:
+        file.write(",".join(FIXATION_COLUMNS) + "\n")
+        for _id in range(num_rows):
+            start, end = int(starts[_id]), int(ends[_id])
+            duration_ms = (timestamps[end] - timestamps[start]) * 1000.0
+            gaze = rng.normal(0, 1, 3)
+            file.write(f"{_id},{timestamps[start]:.6f},{duration_ms:.3f},{start},{end},"
+                       f"{rng.uniform():.5f},{rng.uniform():.5f},{rng.uniform(0, 1.5):.5f},1.0,3d gaze,"
+                       f"{gaze[0]:.5f},{gaze[1]:.5f},{gaze[2]:.5f},\n")
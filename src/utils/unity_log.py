@@ -0,0 +1,204 @@
+"""
+Typed loading (and a binary cache) of the Unity trail logs, REC_ET/UNI/<subject>_<trail>.txt.
+
+The log format is ASSUMED, nothing in the repository documents it: a csv with a header row and the columns of
+UNITY_COLUMNS, one row per event, where the event column holds the names of UNITY_EVENTS and timestamps are in
+Pupil time (seconds). The synthetic generator (synthetic_data) writes exactly this layout. Logs whose header lacks
+the required columns (REQUIRED_COLUMNS) raise a ValueError instead of parsing to an empty log, so a real log in
+another layout is noticed; the column names then need to be mapped here.
+"""
+import os
+import logging
+import numpy as np
+import pandas as pd
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+UNITY_LOG_VERSION = 1
+# Columns of a Unity trail log (REC_ET/UNI/<subject>_<trail>.txt), one row per event
+UNITY_COLUMNS = ["timestamp", "event", "ball_id", "ball_x", "ball_y", "ball_z",
+                 "cam_x", "cam_y", "cam_z", "gaze_x", "gaze_y", "gaze_z"]
+# spawn: a ball is placed (ball position), gaze: camera position and gaze direction sample,
+# prompt: the subject is asked to find a ball, found: the subject found it. Other events get the next codes.
+UNITY_EVENTS = ["spawn", "gaze", "prompt", "found"]
+_VECTOR_COLUMNS = {"ball_positions": ["ball_x", "ball_y", "ball_z"],
+                   "cam_positions": ["cam_x", "cam_y", "cam_z"],
+                   "gaze_directions": ["gaze_x", "gaze_y", "gaze_z"]}
+REQUIRED_COLUMNS = ["timestamp", "event"]
+CACHE_DIR_NAME = "UNI_cache"  # next to UNI, match_pl_uni expects only the trail files inside UNI
+
+
+def unity_cache_path(uni_file_path):
+    """
+    Returns the path of a Unity log's binary cache (e.g. REC_ET/UNI/AN755_T1.txt -> REC_ET/UNI_cache/AN755_T1.npz).
+    """
+    uni_path = os.path.dirname(os.path.abspath(uni_file_path))
+    name = os.path.splitext(os.path.basename(uni_file_path))[0]
+    return os.path.join(os.path.dirname(uni_path), CACHE_DIR_NAME, f"{name}.npz")
+
+
+class UnityLog:
+    def __init__(self, timestamps, event_codes, event_names, ball_ids, ball_positions, cam_positions,
+                 gaze_directions):
+        """
+        A Unity trail log as typed columns. Missing values are NaN (positions/directions) or -1 (ball ids).
+        :param timestamps: float64 (N,), Pupil time in seconds.
+        :param event_codes: int8 (N,), index into event_names.
+        :param event_names: The event vocabulary, starts with UNITY_EVENTS.
+        :param ball_ids: int32 (N,).
+        :param ball_positions: float32 (N, 3), set on spawn rows.
+        :param cam_positions: float32 (N, 3), set on gaze rows.
+        :param gaze_directions: float32 (N, 3), unit vectors, set on gaze rows.
+        """
+        self.timestamps = timestamps
+        self.event_codes = event_codes
+        self.event_names = list(event_names)
+        self.ball_ids = ball_ids
+        self.ball_positions = ball_positions
+        self.cam_positions = cam_positions
+        self.gaze_directions = gaze_directions
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def event_mask(self, event):
+        """
+        :return: A bool array of the rows of an event (all False if the event never happens).
+        """
+        if event not in self.event_names:
+            return np.zeros(len(self), dtype=bool)
+        return self.event_codes == self.event_names.index(event)
+
+    def spawns(self):
+        """
+        :return: (ball ids, (n, 3) positions) of the spawned balls.
+        """
+        mask = self.event_mask("spawn")
+        return self.ball_ids[mask], self.ball_positions[mask]
+
+    def gaze_samples(self):
+        """
+        :return: (timestamps, (n, 3) camera positions, (n, 3) gaze directions) of the gaze samples.
+        """
+        mask = self.event_mask("gaze")
+        return self.timestamps[mask], self.cam_positions[mask], self.gaze_directions[mask]
+
+    def events(self, event):
+        """
+        :return: (timestamps, ball ids) of an event's rows, e.g. events("prompt").
+        """
+        mask = self.event_mask(event)
+        return self.timestamps[mask], self.ball_ids[mask]
+
+    def to_dataframe(self):
+        """
+        :return: The log as a DataFrame with a categorical event column.
+        """
+        columns = {"timestamp": self.timestamps,
+                   "event": pd.Categorical.from_codes(self.event_codes, categories=self.event_names),
+                   "ball_id": self.ball_ids}
+        for name, vector_columns in _VECTOR_COLUMNS.items():
+            for axis, column in enumerate(vector_columns):
+                columns[column] = getattr(self, name)[:, axis]
+        return pd.DataFrame(columns)
+
+    @classmethod
+    def parse(cls, uni_file_path):
+        """
+        Parses a Unity trail log (csv text, in the assumed layout of the module docstring) with pandas' C parser
+        straight into typed columns. Optional columns that a log doesn't have are left missing, extra columns are
+        ignored.
+        :raises ValueError: If the header lacks a column of REQUIRED_COLUMNS.
+        """
+        header = pd.read_csv(uni_file_path, nrows=0).columns
+        missing = [column for column in REQUIRED_COLUMNS if column not in header]
+        if missing:
+            raise ValueError(f"Unity log {uni_file_path} has no {', '.join(missing)} column (header: "
+                             f"{', '.join(map(str, header))}). Expected the columns {', '.join(UNITY_COLUMNS)}.")
+        usecols = [column for column in UNITY_COLUMNS if column in header]
+        dtypes = {column: np.float32 for columns in _VECTOR_COLUMNS.values() for column in columns}
+        dtypes.update({"timestamp": np.float64, "event": "category", "ball_id": np.float64})
+        df = pd.read_csv(uni_file_path, usecols=usecols, dtype={c: dtypes[c] for c in usecols}, engine="c")
+        num_rows = len(df)
+
+        event_names = list(UNITY_EVENTS)
+        event_codes = np.full(num_rows, -1, dtype=np.int8)
+        if "event" in df:
+            categories = [str(category) for category in df["event"].cat.categories]
+            event_names += [category for category in categories if category not in event_names]
+            lookup = np.array([event_names.index(category) for category in categories] + [-1], dtype=np.int8)
+            event_codes = lookup[df["event"].cat.codes.to_numpy()]  # code -1 (missing event) maps to -1
+
+        def column(name, dtype, fill):
+            if name not in df:
+                return np.full(num_rows, fill, dtype=dtype)
+            values = df[name].to_numpy()
+            if np.issubdtype(dtype, np.integer):  # integer columns are read as float, so empty cells are NaN
+                values = np.where(np.isnan(values), fill, values)
+            return values.astype(dtype)
+
+        vectors = {name: np.column_stack([column(c, np.float32, np.nan) for c in vector_columns])
+                   for name, vector_columns in _VECTOR_COLUMNS.items()}
+        return cls(column("timestamp", np.float64, np.nan), event_codes, event_names,
+                   column("ball_id", np.int32, -1), **vectors)
+
+    def save(self, uni_file_path):
+        """
+        Saves the columns as an .npz cache (see unity_cache_path), together with the version and the log's size and
+        modification time.
+        """
+        stat = os.stat(uni_file_path)
+        path = unity_cache_path(uni_file_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(temp_path, header=np.array([UNITY_LOG_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64),
+                 event_names=np.array(self.event_names, dtype=str), timestamps=self.timestamps,
+                 event_codes=self.event_codes, ball_ids=self.ball_ids, ball_positions=self.ball_positions,
+                 cam_positions=self.cam_positions, gaze_directions=self.gaze_directions)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, uni_file_path):
+        """
+        Loads the cache of a Unity log.
+        :return: A UnityLog, or None if there is no cache or it is outdated (the log's size or mtime changed).
+        """
+        try:
+            with np.load(unity_cache_path(uni_file_path)) as cache:
+                stat = os.stat(uni_file_path)
+                if tuple(cache["header"]) != (UNITY_LOG_VERSION, stat.st_size, stat.st_mtime_ns):
+                    logging.debug(f"Unity cache of {uni_file_path} is outdated")
+                    return None
+                return cls(cache["timestamps"], cache["event_codes"], cache["event_names"].tolist(),
+                           cache["ball_ids"], cache["ball_positions"], cache["cam_positions"],
+                           cache["gaze_directions"])
+        except (FileNotFoundError, ValueError, KeyError, OSError):
+            return None
+
+    @classmethod
+    def load_or_parse(cls, uni_file_path):
+        """
+        Loads the cache of a Unity log, or parses the log and saves the cache if it is missing or outdated.
+        """
+        log = cls.load(uni_file_path)
+        if log is None:
+            log = cls.parse(uni_file_path)
+            try:
+                log.save(uni_file_path)
+                logging.debug(f"Cached Unity log {uni_file_path} ({len(log)} rows)")
+            except OSError as e:
+                logging.warning(f"Could not save the Unity cache of {uni_file_path}: {e}")
+        return log
+
+
+def load_unity_log(uni_file_path, use_cache=True):
+    """
+    :param uni_file_path: Path to a Unity trail log (e.g. VideoPreprocessor.uni_trail_path).
+    :param use_cache: Load/save the binary cache, False always parses the text.
+    :return: A UnityLog.
+    """
+    return UnityLog.load_or_parse(uni_file_path) if use_cache else UnityLog.parse(uni_file_path)
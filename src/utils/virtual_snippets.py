@@ -0,0 +1,252 @@
+import os
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+# Our own libraries
+from src.utils.preprocessing import TARGET_LENGTH
+from src.utils.seek_index import SeekIndex, seek_capture
+from src.utils.frame_store import is_manifest, load_manifest
+
+# Initializing log
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+class CapturePool:
+    def __init__(self, max_open=4):
+        """
+        Keeps a few cv2.VideoCapture objects open (least recently used are closed) together with their seek index
+        and current position, so every seek starts at the right keyframe or just reads forward.
+        A pool must only be used by one thread, see get_capture_pool.
+        :param max_open: Maximum number of videos kept open.
+        """
+        self.max_open = max_open
+        self._captures = OrderedDict()  # video path : [capture, index of the next frame read() returns, SeekIndex]
+
+    def _get(self, video_path):
+        if video_path in self._captures:
+            self._captures.move_to_end(video_path)
+            return self._captures[video_path]
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            raise FileNotFoundError(f"Cannot open video: {video_path}")
+        try:
+            seek_index = SeekIndex.load_or_build(video_path)
+        except Exception as e:
+            logging.warning(f"No seek index for {video_path}, falling back to plain seeking: {e}")
+            seek_index = None
+        self._captures[video_path] = [capture, 0, seek_index]
+        while len(self._captures) > self.max_open:
+            _, (old_capture, _, _) = self._captures.popitem(last=False)
+            old_capture.release()
+        return self._captures[video_path]
+
+    def _move_to(self, entry, frame_index):
+        capture, position, seek_index = entry
+        seek_capture(capture, seek_index, position, frame_index)
+        entry[1] = frame_index
+
+    def read_range(self, video_path, start_frame, end_frame):
+        """
+        Decodes frames start_frame..end_frame (inclusive) of a video.
+        :return: A generator of (frame index, BGR frame).
+        """
+        entry = self._get(video_path)
+        self._move_to(entry, start_frame)
+        capture = entry[0]
+        for frame_index in range(start_frame, end_frame + 1):
+            ret, frame = capture.read()
+            if not ret:
+                logging.warning(f"Frame {frame_index} of {video_path} could not be read.")
+                entry[1] = -1  # unknown position, the next read seeks
+                return
+            entry[1] = frame_index + 1
+            yield frame_index, frame
+
+    def frame_size(self, video_path):
+        """
+        :return: (width, height) of a video.
+        """
+        capture = self._get(video_path)[0]
+        return int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def close(self):
+        for capture, _, _ in self._captures.values():
+            capture.release()
+        self._captures.clear()
+
+
+_thread_pools = threading.local()
+
+
+def get_capture_pool():
+    """
+    Returns the CapturePool of the calling thread (cv2.VideoCapture objects must not be shared between threads).
+    """
+    if not hasattr(_thread_pools, "pool"):
+        _thread_pools.pool = CapturePool()
+    return _thread_pools.pool
+
+
+class VirtualSnippet:
+    def __init__(self, video_path, start_frame, end_frame, target_length=TARGET_LENGTH, pool=None,
+                 frame_indices=None):
+        """
+        A snippet that is never written to disk: its frames are decoded on demand from the original recording
+        and the padding is only added logically (black frames are produced when iterating).
+        Frame indices are always the recording's frame indices, like in the metadata.
+        :param video_path: Path to the recording (world.mp4).
+        :param start_frame: First frame of the fixation group.
+        :param end_frame: Last frame of the fixation group.
+        :param target_length: Snippet length including padding.
+        :param pool: The CapturePool to decode with (default: the calling thread's pool).
+        :param frame_indices: The group's sampled frames (see frame_sampling), None for every frame of the group.
+        """
+        self.video_path = video_path
+        self.start_frame = int(start_frame)
+        self.end_frame = int(end_frame)
+        self.target_length = target_length
+        self.pool = pool
+        self.frame_indices = None if frame_indices is None else [int(frame_index) for frame_index in frame_indices]
+
+    @property
+    def num_frames(self):
+        """
+        The number of real (not padding) frames.
+        """
+        if self.frame_indices is not None:
+            return len(self.frame_indices)
+        return self.end_frame - self.start_frame + 1
+
+    @property
+    def padding(self):
+        return max(self.target_length - self.num_frames, 0)
+
+    @property
+    def key(self):
+        if self.frame_indices is not None:
+            return self.video_path, tuple(self.frame_indices), self.padding
+        return self.video_path, self.start_frame, self.end_frame, self.padding
+
+    def _pool(self):
+        return self.pool or get_capture_pool()
+
+    def frame_size(self):
+        return self._pool().frame_size(self.video_path)
+
+    def iter_frames(self, start_frame=None, end_frame=None):
+        """
+        Decodes a range of the snippet's real frames (no padding), clipped to the group's range.
+        :return: A generator of (frame index, BGR frame).
+        """
+        start_frame = self.start_frame if start_frame is None else max(start_frame, self.start_frame)
+        end_frame = self.end_frame if end_frame is None else min(end_frame, self.end_frame)
+        frames = self._pool().read_range(self.video_path, start_frame, end_frame)
+        if self.frame_indices is None:
+            return frames
+        wanted = set(self.frame_indices)
+        return ((frame_index, frame) for frame_index, frame in frames if frame_index in wanted)
+
+    def iter_padded(self):
+        """
+        Yields all target_length frames of the snippet: the real frames and then the black padding frames.
+        :return: A generator of (frame index or None for padding, BGR frame).
+        """
+        written = 0
+        for frame_index, frame in self.iter_frames():
+            if written == self.target_length:
+                return
+            written += 1
+            yield frame_index, frame
+        if written < self.target_length:
+            width, height = self.frame_size()
+            black_frame = np.zeros((height, width, 3), dtype=np.uint8)
+            for _ in range(self.target_length - written):
+                yield None, black_frame
+
+    def read_all(self):
+        """
+        :return: (frames, mask), a (target_length, H, W, 3) uint8 array and a bool array that is False for padding.
+        """
+        frames, mask = [], []
+        for frame_index, frame in self.iter_padded():
+            frames.append(frame)
+            mask.append(frame_index is not None)
+        return np.stack(frames), np.asarray(mask, dtype=bool)
+
+
+class SnippetFile(VirtualSnippet):
+    def __init__(self, snippet_path, start_frame, end_frame, target_length=TARGET_LENGTH, pool=None,
+                 frame_indices=None):
+        """
+        A snippet that was written to disk by trim_vid_around_fixations, with the same interface as VirtualSnippet.
+        Frame 0 of the file is the group's start_frame, requested recording frame indices are shifted accordingly.
+        For a sampled snippet, frame i of the file is frame_indices[i].
+        """
+        super().__init__(snippet_path, start_frame, end_frame, target_length, pool, frame_indices)
+
+    def iter_frames(self, start_frame=None, end_frame=None):
+        start_frame = self.start_frame if start_frame is None else max(start_frame, self.start_frame)
+        end_frame = self.end_frame if end_frame is None else min(end_frame, self.end_frame)
+        if self.frame_indices is not None:
+            first = bisect.bisect_left(self.frame_indices, start_frame)
+            last = bisect.bisect_right(self.frame_indices, end_frame) - 1
+            for file_index, frame in self._pool().read_range(self.video_path, first, last):
+                yield self.frame_indices[file_index], frame
+            return
+        offset = self.start_frame
+        for file_index, frame in self._pool().read_range(self.video_path, start_frame - offset, end_frame - offset):
+            yield file_index + offset, frame
+
+
+class ManifestSnippet(VirtualSnippet):
+    def __init__(self, manifest_path, start_frame, end_frame, target_length=TARGET_LENGTH, pool=None,
+                 frame_indices=None):
+        """
+        A snippet written into a frame store (see frame_store.FrameStore), with the same interface as VirtualSnippet.
+        Its frames are read from the store's objects, no video is decoded.
+        """
+        super().__init__(manifest_path, start_frame, end_frame, target_length, pool, frame_indices)
+        self.manifest, self.store = load_manifest(manifest_path)
+        self.frame_indices = self.manifest["frame_indices"]  # the frames the manifest really holds
+
+    def frame_size(self):
+        return self.manifest["width"], self.manifest["height"]
+
+    def iter_frames(self, start_frame=None, end_frame=None):
+        start_frame = self.start_frame if start_frame is None else max(start_frame, self.start_frame)
+        end_frame = self.end_frame if end_frame is None else min(end_frame, self.end_frame)
+        for frame_index, key in zip(self.manifest["frame_indices"], self.manifest["frames"]):
+            if start_frame <= frame_index <= end_frame:
+                yield frame_index, self.store.get(key)
+
+
+def open_snippet(video, target_length=None, pool=None):
+    """
+    Opens the snippet of a fixation group: the snippet file if it exists, otherwise a virtual snippet
+    read straight from the group's source recording (also for snippets that were packed into shards).
+    :param video: A single entry of the subject's metadata["videos"] list.
+    :param target_length: Snippet length including padding (default: the group's snippet_length if it is sampled,
+                          otherwise TARGET_LENGTH).
+    :return: A SnippetFile, a ManifestSnippet or a VirtualSnippet.
+    """
+    snippet_path = video.get("snippet_path")
+    frame_indices = video.get("frame_indices")
+    target_length = target_length or video.get("snippet_length", TARGET_LENGTH)
+    if snippet_path and os.path.isfile(snippet_path):
+        if is_manifest(snippet_path):
+            return ManifestSnippet(snippet_path, video["start_frame"], video["end_frame"], target_length, pool,
+                                   frame_indices)
+        return SnippetFile(snippet_path, video["start_frame"], video["end_frame"], target_length, pool,
+                           frame_indices)
+    source_video = video.get("source_video")
+    if source_video and os.path.isfile(source_video):
+        return VirtualSnippet(source_video, video["start_frame"], video["end_frame"], target_length, pool,
+                              frame_indices)
+    raise FileNotFoundError(f"Neither a snippet file nor a source video was found for {video['group_id']}")